@@ -0,0 +1,592 @@
+"""
+Chunk shape and page size advisor for local copies of NREL HDF5 resources
+
+The workload is either a named profile, a weighted mix of the suite's access
+patterns, or an access log saved from an instrument trace
+(Trace.save). Every candidate chunk shape and page size is scored with a
+chunk-granular cost model: each chunk touched costs one I/O latency per page
+(or per chunk and a share of index lookups for unpaged files) plus its bytes
+at the storage bandwidth. The best layout is written to a local copy with
+paged aggregation, and the workload is replayed on the source and the copy
+to compare the predicted and measured speedup. Replays open both files with
+a chunk cache of at least two chunks so that, as in the model, chunks are
+read whole rather than piecewise. The model leaves out HDF5's CPU cost of
+complex selections, so the measured speedup is the one to trust.
+
+Examples:
+
+    python advisor.py /data/nsrdb_2020.h5 /data/nsrdb_2020_ts.h5 \\
+        --dataset ghi --profile timeseries
+    python advisor.py hdf5://nrel/wtk-us.h5 /data/wtk_maps.h5 \\
+        --dataset windspeed_100m --log trace.jsonl --dry-run
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+import h5py
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'bin'))
+import backends
+import instrument
+import read_planner
+from suite import MB, PATTERNS, get_page_size, read
+
+# Relative weight of each suite access pattern per workload profile
+PROFILES = {'timeseries': {'timeseries': 6, 'multisite': 3, 'bbox': 2,
+                           'day': 1},
+            'maps': {'timestep': 6, 'day': 3, 'strided': 2,
+                     'timeseries': 1},
+            'mixed': {'timeseries': 1, 'multisite': 1, 'timestep': 1,
+                      'day': 1, 'bbox': 1, 'strided': 1}}
+# Per-I/O latency in seconds, bandwidth in bytes / s, the share of chunk
+# reads that also fetch an index node in unpaged files, whose metadata is
+# scattered in small blocks, and the read planner's per-request overhead in
+# bytes used when replaying. 'local' is a file in the OS page cache or on
+# NVMe, 'disk' a network block device like EBS. Local requests are so cheap
+# that one point selection spanning many chunks is slower than a request per
+# chunk.
+STORAGE = {'local': {'latency': 5e-5, 'bandwidth': 4e9, 'index': 0.05,
+                     'overhead': 0},
+           'disk': {'latency': 5e-4, 'bandwidth': 2.5e8, 'index': 0.5,
+                    'overhead': 0},
+           's3': {'latency': 0.03, 'bandwidth': 1e8, 'index': 0.5,
+                  'overhead': 3 * 2 ** 20}}
+TIME_CHUNKS = (24, 48, 96, 168, 336, 672, 1344, 2688, 5376, 8760, 17568)
+CHUNK_MB = (0.25, 0.5, 1, 2, 4, 8)
+PAGE_SIZES = (None, 1, 2, 4, 8, 16)
+
+
+class Workload:
+    """
+    Weighted set of dataset selections
+    """
+
+    def __init__(self, shape, selections, weights=None):
+        """
+        Parameters
+        ----------
+        shape : tuple
+            Dataset shape
+        selections : list
+            Selection tuples
+        weights : list, optional
+            Weight of each selection, defaults to 1
+        """
+        if weights is None:
+            weights = np.ones(len(selections))
+
+        self.shape = tuple(shape)
+        self.selections = list(selections)
+        self.weights = np.asarray(weights, dtype=float)
+        # Selected indices along each axis, reused for every candidate
+        self._idx = [[read_planner.normalize_selection(sel, n)[0]
+                      for sel, n in zip(selection, self.shape)]
+                     for selection in self.selections]
+
+    def __len__(self):
+        return len(self.selections)
+
+    @classmethod
+    def from_profile(cls, shape, profile='mixed', n=10, seed=0):
+        """
+        Workload from a named profile, see PROFILES
+
+        Parameters
+        ----------
+        shape : tuple
+            Dataset shape
+        profile : str
+            'timeseries', 'maps' or 'mixed'
+        n : int
+            Selections per access pattern
+        seed : int
+            Random seed for the selections
+
+        Returns
+        -------
+        Workload
+        """
+        rng = np.random.default_rng(seed)
+        patterns = PATTERNS[len(shape)]
+        mix = {k: w for k, w in PROFILES[profile].items() if k in patterns}
+        total = sum(mix.values())
+        selections = []
+        weights = []
+        for pattern, weight in mix.items():
+            sels = patterns[pattern](shape, rng, n)
+            selections += sels
+            weights += [weight / total / len(sels)] * len(sels)
+
+        return cls(shape, selections, weights)
+
+    @classmethod
+    def from_log(cls, path, variable, shape, max_selections=200, seed=0):
+        """
+        Workload from an access log written by instrument.Trace.save.
+        Selections are rebuilt from each event's extent: contiguous extents
+        become slices, sparse ones evenly spaced indices.
+
+        Parameters
+        ----------
+        path : str
+            JSON lines access log
+        variable : str
+            Dataset to take the events of
+        shape : tuple
+            Dataset shape
+        max_selections : int
+            Events are sampled down to this many, with weights scaled up
+        seed : int
+            Random seed for the sampling
+
+        Returns
+        -------
+        Workload
+        """
+        events = instrument.load_events(path)
+        if events.empty:
+            raise ValueError('{} has no events'.format(path))
+
+        events = events[(events['variable'] == variable)
+                        & events['extent'].notna()]
+        extents = [e for e in events['extent'] if len(e) == len(shape)]
+        if not extents:
+            raise ValueError('{} has no reads of {}'.format(path, variable))
+
+        weight = 1
+        if len(extents) > max_selections:
+            rng = np.random.default_rng(seed)
+            pick = rng.choice(len(extents), max_selections, replace=False)
+            weight = len(extents) / max_selections
+            extents = [extents[i] for i in np.sort(pick)]
+
+        selections = []
+        for extent in extents:
+            sel = []
+            for start, stop, count in extent:
+                if count == stop - start:
+                    sel.append(slice(start, stop))
+                else:
+                    sel.append(np.unique(np.linspace(start, stop - 1, count)
+                                         .round().astype(int)))
+
+            selections.append(tuple(sel))
+
+        return cls(shape, selections, [weight] * len(selections))
+
+    def chunks_touched(self, chunks):
+        """
+        Number of chunks each selection touches
+
+        Parameters
+        ----------
+        chunks : tuple
+            Chunk shape
+
+        Returns
+        -------
+        ndarray
+        """
+        # Indices are sorted and unique, so chunk ids only ever step up
+        return np.array([np.prod([np.count_nonzero(np.diff(i // c)) + 1
+                                  if len(i) else 0
+                                  for i, c in zip(idx, chunks)])
+                         for idx in self._idx], dtype=float)
+
+
+def chunk_cost(chunk_nbytes, page_size=None, storage='local'):
+    """
+    Predicted seconds to fetch one chunk
+
+    Parameters
+    ----------
+    chunk_nbytes : int
+        Chunk size in bytes
+    page_size : int | float, optional
+        File space page size in MB, None for an unpaged file
+    storage : str
+        Storage model, see STORAGE
+
+    Returns
+    -------
+    float
+    """
+    model = STORAGE[storage]
+    if page_size:
+        page = page_size * MB
+        pages = np.ceil(chunk_nbytes / page)
+        return pages * (model['latency'] + page / model['bandwidth'])
+
+    return (model['latency'] * (1 + model['index'])
+            + chunk_nbytes / model['bandwidth'])
+
+
+def predict(workload, chunks, itemsize, page_size=None, storage='local'):
+    """
+    Predicted seconds to read a workload
+
+    Parameters
+    ----------
+    workload : Workload
+        Selections to read
+    chunks : tuple
+        Chunk shape
+    itemsize : int
+        Bytes per element
+    page_size : int | float, optional
+        File space page size in MB, None for an unpaged file
+    storage : str
+        Storage model, see STORAGE
+
+    Returns
+    -------
+    float
+    """
+    nbytes = int(np.prod(chunks)) * itemsize
+    n_chunks = (workload.weights * workload.chunks_touched(chunks)).sum()
+
+    return float(n_chunks * chunk_cost(nbytes, page_size=page_size,
+                                       storage=storage))
+
+
+def chunk_candidates(shape, itemsize, chunks=None):
+    """
+    Candidate chunk shapes: for each time chunk length in TIME_CHUNKS and
+    chunk size in CHUNK_MB, the remaining axes are sized to fill the chunk,
+    split evenly between the spatial axes of 3D datasets
+
+    Parameters
+    ----------
+    shape : tuple
+        Dataset shape
+    itemsize : int
+        Bytes per element
+    chunks : tuple, optional
+        Current chunk shape, always included
+
+    Returns
+    -------
+    candidates : list
+        Unique chunk shape tuples
+    """
+    candidates = {tuple(chunks)} if chunks else set()
+    n_space = len(shape) - 1
+    for t, size in itertools.product(TIME_CHUNKS, CHUNK_MB):
+        t = min(t, shape[0])
+        cells = size * MB / itemsize / t
+        side = max(1, int(cells ** (1 / n_space)))
+        candidate = (t,) + tuple(min(side, n) for n in shape[1:])
+        candidates.add(candidate)
+
+    return sorted(candidates)
+
+
+def advise(workload, itemsize, chunks=None, page_size=None,
+           page_sizes=PAGE_SIZES, storage='local'):
+    """
+    Score every candidate chunk shape and page size on a workload
+
+    Parameters
+    ----------
+    workload : Workload
+        Selections to read
+    itemsize : int
+        Bytes per element
+    chunks : tuple, optional
+        Current chunk shape, the baseline of the speedups
+    page_size : int | float, optional
+        Current page size in MB
+    page_sizes : tuple
+        Candidate page sizes in MB, None for unpaged
+    storage : str
+        Storage model, see STORAGE
+
+    Returns
+    -------
+    table : pd.DataFrame
+        chunks, chunk_mb, page_size, predicted seconds and speedup over
+        the current layout, fastest first
+    """
+    shape = workload.shape
+    baseline = predict(workload, chunks or shape, itemsize,
+                       page_size=page_size, storage=storage)
+    rows = []
+    for candidate in chunk_candidates(shape, itemsize, chunks=chunks):
+        nbytes = int(np.prod(candidate)) * itemsize
+        for page in page_sizes:
+            seconds = predict(workload, candidate, itemsize, page_size=page,
+                              storage=storage)
+            rows.append({'chunks': candidate, 'chunk_mb': nbytes / MB,
+                         'page_size': page, 'seconds': seconds,
+                         'speedup': baseline / max(seconds, 1e-12)})
+
+    table = pd.DataFrame(rows)
+
+    return table.sort_values(['seconds', 'chunk_mb']).reset_index(drop=True)
+
+
+def _tiles(shape, chunks, src_chunks, itemsize, max_bytes):
+    """
+    Selections of at most max_bytes that cover a dataset, aligned to the new
+    chunks and spanning whole source chunks where possible so each is read
+    about once
+    """
+    src_chunks = src_chunks or shape
+    tile = [min(n, -(-s // c) * c)
+            for n, c, s in zip(shape, chunks, src_chunks)]
+    for axis in reversed(range(len(shape))):
+        other = int(np.prod(tile[:axis] + tile[axis + 1:])) * itemsize
+        k = max(1, max_bytes // (other * tile[axis]))
+        tile[axis] = min(shape[axis], tile[axis] * k)
+
+    starts = [range(0, n, t) for n, t in zip(shape, tile)]
+    for corner in itertools.product(*starts):
+        yield tuple(slice(i, min(i + t, n))
+                    for i, t, n in zip(corner, tile, shape))
+
+
+def _copy_dataset(src, dst, name, chunks=None, max_bytes=256 * MB):
+    """
+    Copy a dataset and its attributes, re-chunked if chunks is given
+    """
+    kwargs = {}
+    compression = getattr(src, 'compression', None)
+    if compression:
+        kwargs['compression'] = compression
+        kwargs['compression_opts'] = getattr(src, 'compression_opts', None)
+        kwargs['shuffle'] = getattr(src, 'shuffle', False)
+
+    chunks = chunks or src.chunks
+    if chunks is None and not kwargs:
+        dset = dst.create_dataset(name, data=src[...])
+    else:
+        dset = dst.create_dataset(name, shape=src.shape, dtype=src.dtype,
+                                  chunks=tuple(chunks), **kwargs)
+        for sel in _tiles(src.shape, chunks, src.chunks,
+                          src.dtype.itemsize, max_bytes):
+            dset[sel] = src[sel]
+
+    for key, value in src.attrs.items():
+        dset.attrs[key] = value
+
+
+def repack(src_path, dst_path, chunks, datasets, page_size=None,
+           max_bytes=256 * MB, **backend_kwargs):
+    """
+    Write a local copy of a resource with new chunks and page size
+
+    Parameters
+    ----------
+    src_path : str
+        Source resource URI or path, see backends.open_file
+    dst_path : str
+        Local output .h5 path
+    chunks : tuple
+        New chunk shape
+    datasets : list
+        Datasets to re-chunk, every other dataset is copied as is
+    page_size : int | float, optional
+        File space page size in MB, None for an unpaged file
+    max_bytes : int
+        Memory bound of each copied block
+    backend_kwargs : dict
+        Source backend arguments
+
+    Returns
+    -------
+    dst_path : str
+    """
+    kwargs = {}
+    if page_size:
+        kwargs = {'fs_strategy': 'page', 'fs_persist': True,
+                  'fs_page_size': int(page_size * MB)}
+
+    datasets = set(datasets)
+    with backends.open_file(src_path, **backend_kwargs) as src, \
+            h5py.File(dst_path, 'w', **kwargs) as dst:
+        for key, value in src.attrs.items():
+            dst.attrs[key] = value
+
+        def copy(group, prefix):
+            for key in group:
+                obj = group[key]
+                name = prefix + key
+                if hasattr(obj, 'shape'):
+                    new = chunks if name in datasets else None
+                    _copy_dataset(obj, dst, name, chunks=new,
+                                  max_bytes=max_bytes)
+                else:
+                    dst.require_group(name)
+                    copy(obj, name + '/')
+
+        copy(src, '')
+
+    return dst_path
+
+
+def chunk_cache_size(chunks, itemsize):
+    """
+    HDF5 chunk cache size in bytes that holds two chunks, at least the 1 MB
+    default, so chunks are cached and read whole
+
+    Parameters
+    ----------
+    chunks : tuple
+        Chunk shape
+    itemsize : int
+        Bytes per element
+
+    Returns
+    -------
+    int
+    """
+    return max(2 ** 20, 2 * int(np.prod(chunks)) * itemsize)
+
+
+def measure(path, dataset, workload, page_buf_size=None, storage='local'):
+    """
+    Replay a workload on a freshly opened file
+
+    Parameters
+    ----------
+    path : str
+        Resource URI or path
+    dataset : str
+        Dataset to read
+    workload : Workload
+        Selections to read
+    page_buf_size : int, optional
+        Page buffer size in bytes for paged files, defaults to the page size
+    storage : str
+        Storage model, sets the read planner's per-request overhead
+
+    Returns
+    -------
+    seconds : float
+        Weighted read time, comparable with predict
+    """
+    kwargs = {}
+    if backends.resolve(path)[0] != 'hsds':
+        with backends.open_file(path) as f:
+            page_size = backends.page_size(f)
+            dset = f[dataset]
+            kwargs['rdcc_nbytes'] = chunk_cache_size(dset.chunks or dset.shape,
+                                                     dset.dtype.itemsize)
+
+        if page_size:
+            kwargs['page_buf_size'] = max(page_buf_size or 0, page_size)
+
+    overhead = STORAGE[storage]['overhead']
+    latencies = []
+    with backends.open_file(path, **kwargs) as f:
+        dset = f[dataset]
+        for sel in workload.selections:
+            ts = time.perf_counter()
+            read(dset, sel, overhead=overhead)
+            latencies.append(time.perf_counter() - ts)
+
+    return float((workload.weights * np.array(latencies)).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n\n')[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='\n\n'.join(__doc__.split('\n\n')[2:]))
+    parser.add_argument('src', help='source file or URI')
+    parser.add_argument('dst', help='local output .h5 path')
+    parser.add_argument('--dataset', required=True,
+                        help='dataset the workload reads')
+    workload = parser.add_mutually_exclusive_group()
+    workload.add_argument('--profile', choices=list(PROFILES),
+                          default='mixed', help='named workload profile')
+    workload.add_argument('--log', help='access log from Trace.save')
+    parser.add_argument('--storage', choices=list(STORAGE), default='local',
+                        help='storage the copy will be read from')
+    parser.add_argument('--page-sizes', type=float, nargs='+',
+                        help='candidate page sizes in MB, 0 for unpaged')
+    parser.add_argument('--chunks', type=int, nargs='+',
+                        help='use this chunk shape instead of the best')
+    parser.add_argument('--repeats', type=int, default=10,
+                        help='selections per access pattern of a profile')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of candidates to print')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only print the candidates')
+    args = parser.parse_args()
+
+    with backends.open_file(args.src) as f:
+        dset = f[args.dataset]
+        shape, chunks = dset.shape, dset.chunks
+        itemsize = dset.dtype.itemsize
+        page_size = get_page_size(f)
+        same_shape = [k for k in f if getattr(f[k], 'shape', None) == shape]
+
+    if args.log:
+        wl = Workload.from_log(args.log, args.dataset, shape,
+                               seed=args.seed)
+    else:
+        wl = Workload.from_profile(shape, profile=args.profile,
+                                   n=args.repeats, seed=args.seed)
+
+    page_sizes = PAGE_SIZES
+    if args.page_sizes:
+        page_sizes = tuple(p or None for p in args.page_sizes)
+
+    table = advise(wl, itemsize, chunks=chunks, page_size=page_size,
+                   page_sizes=page_sizes, storage=args.storage)
+    print('{} {} chunks {} page size {} MB, {} selections'
+          .format(args.src, args.dataset, chunks, page_size or '-', len(wl)))
+    with pd.option_context('display.width', 120):
+        print(table.head(args.top).to_string())
+
+    best = table.iloc[0]
+    new_chunks, new_page = best['chunks'], best['page_size']
+    if args.chunks:
+        new_chunks = tuple(args.chunks)
+        rows = table[table['chunks'] == new_chunks]
+        if not rows.empty:
+            new_page = rows.iloc[0]['page_size']
+
+    if pd.isna(new_page):
+        new_page = None
+
+    predicted = (predict(wl, chunks or shape, itemsize, page_size=page_size,
+                         storage=args.storage)
+                 / predict(wl, new_chunks, itemsize, page_size=new_page,
+                           storage=args.storage))
+    print('chunks {} page size {} MB: predicted speedup {:.2f}x'
+          .format(new_chunks, new_page or '-', predicted))
+    if args.dry_run:
+        return
+
+    if tuple(new_chunks) == tuple(chunks or shape) and new_page == page_size:
+        print('the current layout is already the best candidate')
+        return
+
+    ts = time.time()
+    repack(args.src, args.dst, new_chunks, same_shape, page_size=new_page)
+    print('wrote {} ({:.1f} MB) in {:.1f} s'
+          .format(args.dst, os.path.getsize(args.dst) / MB, time.time() - ts))
+
+    before = measure(args.src, args.dataset, wl, storage=args.storage)
+    after = measure(args.dst, args.dataset, wl, storage=args.storage)
+    print('measured {:.4f} s -> {:.4f} s: speedup {:.2f}x '
+          '(predicted {:.2f}x)'.format(before, after, before / after,
+                                       predicted))
+    print('open the copy with rdcc_nbytes={}'
+          .format(chunk_cache_size(new_chunks, itemsize)))
+    if after > 1.05 * before:
+        print('WARNING: the copy is slower than the source for this '
+              'workload, keep the source layout')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,467 @@
+"""
+Benchmark suite for the access patterns used with NREL HDF5 resources
+
+Each file is opened through bin/backends.py, so any of hdf5:// (HSDS),
+s3:// (s3fs), http(s):// (ros3) or a local path can be benchmarked. For each
+access pattern the same random selections are read twice: once on a freshly
+opened file (cold) and once more on the same handle (warm). Per-request
+latencies are summarized as p50 / p95 / p99, along with bytes returned,
+estimated bytes of chunks touched and MB/s. Results are printed and written
+as JSON, and can be compared against a baseline JSON to catch regressions.
+
+Examples:
+
+    python suite.py hdf5://nrel/nsrdb/conus/nsrdb_conus_2020.h5 \\
+        --dataset wind_speed
+    python suite.py /data/nsrdb_2020.h5 /data/nsrdb_2020_p2m.h5 \\
+        --page-buf-size 2 4 --out results.json
+    python suite.py --synthetic /tmp/bench --compare baseline.json
+
+Note that cold runs only reset the HDF5 library and HSDS client caches, not
+the operating system's page cache.
+"""
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+import platform
+import sys
+import time
+
+import h5py
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'bin'))
+import backends
+import read_planner
+import synthetic
+
+MB = 1024 * 1024
+
+
+def get_page_size(h5_file):
+    """
+    Page size in MB of a file written with paged aggregation, read from the
+    file's creation properties
+
+    Parameters
+    ----------
+    h5_file : h5py.File | h5pyd.File
+        Open file
+
+    Returns
+    -------
+    page_size : int | float | None
+        Page size in MB, None if the file is not paged
+    """
+    page_size = backends.page_size(h5_file)
+    if page_size is None:
+        return None
+
+    page_size /= MB
+
+    return int(page_size) if page_size.is_integer() else page_size
+
+
+def _timeseries(shape, rng, n):
+    """
+    Full time-series of one site or grid cell
+    """
+    return [(slice(None),) + tuple(int(rng.integers(s)) for s in shape[1:])
+            for _ in range(n)]
+
+
+def _multisite(shape, rng, n, sites=50):
+    """
+    Full time-series of a batch of scattered sites
+    """
+    sites = min(sites, shape[1])
+    return [(slice(None), np.sort(rng.choice(shape[1], sites, replace=False)))
+            for _ in range(n)]
+
+
+def _timestep(shape, rng, n):
+    """
+    All sites (a full map) at one timestep
+    """
+    return [(int(rng.integers(shape[0])),) + (slice(None),) * (len(shape) - 1)
+            for _ in range(n)]
+
+
+def _day(shape, rng, n):
+    """
+    All sites for one day (48 half-hourly NSRDB or 24 hourly WTK steps)
+    """
+    steps = 48 if len(shape) == 2 else 24
+    steps = min(steps, shape[0])
+    sels = []
+    for _ in range(n):
+        t0 = int(rng.integers(shape[0] - steps + 1))
+        sels.append((slice(t0, t0 + steps),)
+                    + (slice(None),) * (len(shape) - 1))
+
+    return sels
+
+
+def _bbox(shape, rng, n, size=100, steps=168):
+    """
+    One week for a box of grid cells
+    """
+    steps = min(steps, shape[0])
+    sels = []
+    for _ in range(n):
+        t0 = int(rng.integers(shape[0] - steps + 1))
+        sel = [slice(t0, t0 + steps)]
+        for s in shape[1:]:
+            w = min(size, s)
+            i0 = int(rng.integers(s - w + 1))
+            sel.append(slice(i0, i0 + w))
+
+        sels.append(tuple(sel))
+
+    return sels
+
+
+def _strided(shape, rng, n, size=400, stride=(24, 4, 4)):
+    """
+    Daily snapshots of every 4th cell in a box, i.e. a strided cube
+    """
+    sels = []
+    for _ in range(n):
+        sel = [slice(None, None, stride[0])]
+        for s, step in zip(shape[1:], stride[1:]):
+            w = min(size, s)
+            i0 = int(rng.integers(s - w + 1))
+            sel.append(slice(i0, i0 + w, step))
+
+        sels.append(tuple(sel))
+
+    return sels
+
+
+PATTERNS = {2: {'timeseries': _timeseries, 'multisite': _multisite,
+                'timestep': _timestep, 'day': _day},
+            3: {'timeseries': _timeseries, 'timestep': _timestep,
+                'day': _day, 'bbox': _bbox, 'strided': _strided}}
+
+
+def chunk_bytes(dset, selection):
+    """
+    Estimated bytes of all chunks touched by a selection, i.e. the data
+    transferred from storage for an uncompressed dataset
+
+    Parameters
+    ----------
+    dset : h5py.Dataset | h5pyd.Dataset
+        Dataset
+    selection : tuple
+        Selection along each axis
+
+    Returns
+    -------
+    int
+    """
+    chunks = dset.chunks or dset.shape
+    n_chunks = 1
+    for sel, n, c in zip(selection, dset.shape, chunks):
+        idx = read_planner.normalize_selection(sel, n)[0]
+        n_chunks *= len(np.unique(idx // c))
+
+    return int(n_chunks * np.prod(chunks) * dset.dtype.itemsize)
+
+
+def read(dset, selection, overhead=read_planner.OVERHEAD_BYTES):
+    """
+    Read a selection, point selections go through the read planner like
+    HSDS does, with the given per-request overhead in bytes
+    """
+    if any(isinstance(sel, np.ndarray) for sel in selection):
+        return read_planner.read(dset, selection, overhead=overhead)
+
+    return dset[selection]
+
+
+def summarize(latencies, nbytes, nchunk_bytes):
+    """
+    Latency percentiles and throughput of a run
+
+    Parameters
+    ----------
+    latencies : list
+        Seconds per request
+    nbytes : int
+        Bytes returned
+    nchunk_bytes : int
+        Estimated bytes of chunks touched
+
+    Returns
+    -------
+    dict
+    """
+    latencies = np.asarray(latencies)
+    total = float(latencies.sum())
+    return {'requests': len(latencies),
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99)),
+            'mean': float(latencies.mean()),
+            'total': total,
+            'bytes': int(nbytes),
+            'chunk_bytes': int(nchunk_bytes),
+            'mb_per_s': nbytes / MB / max(total, 1e-9)}
+
+
+def run_pattern(path, dataset, pattern, repeats=10, seed=0,
+                **backend_kwargs):
+    """
+    Benchmark one access pattern cold and warm
+
+    Parameters
+    ----------
+    path : str
+        Resource URI or path
+    dataset : str
+        Dataset to read
+    pattern : str
+        Access pattern name, see PATTERNS
+    repeats : int
+        Number of requests per run
+    seed : int
+        Random seed for the selections
+    backend_kwargs : dict
+        Backend tuning, e.g. page_buf_size
+
+    Returns
+    -------
+    result : dict
+        Cold and warm run summaries
+    """
+    rng = np.random.default_rng(seed)
+    result = {}
+    with backends.open_file(path, **backend_kwargs) as f:
+        dset = f[dataset]
+        selections = PATTERNS[len(dset.shape)][pattern](dset.shape, rng,
+                                                        repeats)
+        estimate = sum(chunk_bytes(dset, sel) for sel in selections)
+        for run in ('cold', 'warm'):
+            latencies = []
+            nbytes = 0
+            for sel in selections:
+                ts = time.perf_counter()
+                arr = read(dset, sel)
+                latencies.append(time.perf_counter() - ts)
+                nbytes += arr.nbytes
+
+            result[run] = summarize(latencies, nbytes, estimate)
+
+    return result
+
+
+def run_suite(paths, dataset=None, patterns=None, repeats=10,
+              page_buf_sizes=(None,), seed=0, verbose=True):
+    """
+    Benchmark every pattern on every file and page buffer size
+
+    Parameters
+    ----------
+    paths : list
+        Resource URIs or paths
+    dataset : str, optional
+        Dataset to read, defaults to the first 2D or 3D dataset per file
+    patterns : list, optional
+        Pattern names, defaults to all patterns for the dataset's rank
+    repeats : int
+        Number of requests per run
+    page_buf_sizes : tuple
+        Page buffer sizes in MB to try on paged files, None for the
+        file's page size
+    seed : int
+        Random seed for the selections
+    verbose : bool
+        Print a line per run
+
+    Returns
+    -------
+    report : dict
+        Environment info and list of results
+    """
+    results = []
+    for path in paths:
+        backend = backends.resolve(path)[0]
+        with backends.open_file(path) as f:
+            name = dataset or next(k for k in f if len(f[k].shape) in (2, 3)
+                                   and k != 'coordinates')
+            dset = f[name]
+            shape, chunks = dset.shape, dset.chunks
+            names = patterns or list(PATTERNS[len(shape)])
+            page_size = get_page_size(f)
+
+        # Page buffers only apply to paged files opened with the HDF5 lib
+        bufs = [None]
+        if page_size and backend != 'hsds':
+            bufs = sorted({b or page_size for b in page_buf_sizes})
+            for buf in [b for b in bufs if b < page_size]:
+                print('skipping page_buf_size {} MB < page size {} MB'
+                      .format(buf, page_size))
+
+            bufs = [b for b in bufs if b >= page_size]
+
+        for buf in bufs:
+            kwargs = {'page_buf_size': int(buf * MB)} if buf else {}
+            for pattern in names:
+                result = run_pattern(path, name, pattern, repeats=repeats,
+                                     seed=seed, **kwargs)
+                result.update(file=path, backend=backend, dataset=name,
+                              shape=list(shape), chunks=list(chunks or []),
+                              page_size=page_size,
+                              page_buf_size=buf,
+                              pattern=pattern)
+                results.append(result)
+                if verbose:
+                    print_result(result)
+
+    report = {'created': datetime.now(timezone.utc).isoformat(),
+              'host': platform.node(),
+              'python': platform.python_version(),
+              'h5py': h5py.version.version,
+              'hdf5': h5py.version.hdf5_version,
+              'results': results}
+
+    return report
+
+
+def print_result(result):
+    """
+    Print one result line per run
+    """
+    for run in ('cold', 'warm'):
+        r = result[run]
+        print('{:<40} {:<8} buf={:<4} {:<10} {:<4} p50 {:8.4f}s '
+              'p95 {:8.4f}s p99 {:8.4f}s {:9.2f} MB/s'
+              .format(os.path.basename(result['file']), result['backend'],
+                      str(result['page_buf_size'] or '-'),
+                      result['pattern'], run, r['p50'], r['p95'], r['p99'],
+                      r['mb_per_s']))
+
+
+def _key(result):
+    return (os.path.basename(result['file']), result['dataset'],
+            result['page_buf_size'] or None, result['pattern'])
+
+
+def compare(report, baseline, threshold=1.2, run='warm', stat='p50'):
+    """
+    Find results that got slower than a baseline report
+
+    Parameters
+    ----------
+    report : dict
+        Current report
+    baseline : dict
+        Baseline report
+    threshold : float
+        Slowdown ratio that counts as a regression
+    run : str
+        'cold' or 'warm'
+    stat : str
+        Latency statistic to compare
+
+    Returns
+    -------
+    regressions : list
+        (key, baseline seconds, current seconds) of regressed results
+    """
+    base = {_key(r): r[run][stat] for r in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        key = _key(result)
+        if key in base and result[run][stat] > threshold * base[key]:
+            regressions.append((key, base[key], result[run][stat]))
+
+    return regressions
+
+
+# Small files (~35 MB and ~100 MB) that keep an offline run under a minute
+SYNTHETIC = (('nsrdb', synthetic.make_nsrdb, {'n_sites': 1000}),
+             ('wtk', synthetic.make_wtk, {'n_time': 1344,
+                                          'shape': (160, 240)}))
+
+
+def make_synthetic(out_dir, page_sizes=(None, 2)):
+    """
+    Write small synthetic NSRDB and WTK files, unpaged and paged
+
+    Returns
+    -------
+    paths : list
+        Written files, reused if they already exist
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for page_size in page_sizes:
+        for kind, make, kwargs in SYNTHETIC:
+            path = os.path.join(out_dir, kind + '.h5')
+            paged = synthetic.paged_path(path, page_size)
+            if not os.path.exists(paged):
+                make(path, page_size=page_size, **kwargs)
+
+            paths.append(paged)
+
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n\n')[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='\n\n'.join(__doc__.split('\n\n')[2:]))
+    parser.add_argument('paths', nargs='*', help='files or URIs to benchmark')
+    parser.add_argument('--synthetic', metavar='DIR',
+                        help='generate (or reuse) synthetic files in DIR '
+                             'and benchmark them')
+    parser.add_argument('--dataset', help='dataset to read')
+    parser.add_argument('--patterns', nargs='+',
+                        help='access patterns: timeseries, multisite, '
+                             'timestep, day, bbox, strided')
+    parser.add_argument('--repeats', type=int, default=10,
+                        help='requests per run')
+    parser.add_argument('--page-buf-size', type=int, nargs='+',
+                        default=[None], help='page buffer sizes in MB')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the JSON report to this file')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='baseline JSON report to check for regressions')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='warm p50 slowdown ratio flagged as regression')
+    args = parser.parse_args()
+
+    paths = list(args.paths)
+    if args.synthetic:
+        paths += make_synthetic(args.synthetic)
+
+    if not paths:
+        parser.error('no files to benchmark')
+
+    report = run_suite(paths, dataset=args.dataset, patterns=args.patterns,
+                       repeats=args.repeats,
+                       page_buf_sizes=args.page_buf_size, seed=args.seed)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        regressions = compare(report, baseline, threshold=args.threshold)
+        for key, before, after in regressions:
+            print('REGRESSION {}: {:.4f}s -> {:.4f}s'.format(key, before,
+                                                              after))
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
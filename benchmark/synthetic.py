@@ -0,0 +1,217 @@
+"""
+Generate synthetic local HDF5 files with NSRDB / WTK-like layouts so the
+benchmark suite can run offline
+
+NSRDB-like files hold (time, sites) datasets chunked (2688, 372) plus meta
+and time_index. WTK-like files hold (time, y, x) datasets on the WTK Lambert
+Conformal grid plus coordinates and time_index. Passing a page size writes
+the file with paged aggregation and appends a _p<N>m.h5 suffix so paged and
+unpaged copies can sit side by side.
+"""
+import argparse
+import os
+import sys
+
+import h5py
+import numpy as np
+import pandas as pd
+from pyproj import Proj
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'bin'))
+from wtk_grid import WTK_PROJ, WTK_RESOLUTION
+
+MB = 1024 * 1024
+STATES = [b'California', b'Colorado', b'Texas', b'New York', b'Florida',
+          b'Washington', b'Alaska', b'Hawaii']
+
+
+def paged_path(path, page_size):
+    """
+    Add the _p<N>m.h5 page size suffix to a file path
+    """
+    if not page_size:
+        return path
+
+    return '{}_p{}m.h5'.format(os.path.splitext(path)[0], page_size)
+
+
+def _create_file(path, page_size):
+    """
+    Open a new HDF5 file, with paged aggregation if page_size (MB) is given
+    """
+    if page_size:
+        return h5py.File(path, 'w', fs_strategy='page', fs_persist=True,
+                         fs_page_size=page_size * MB)
+
+    return h5py.File(path, 'w')
+
+
+def _time_index(n_time, freq):
+    """
+    time_index dataset values in the NREL string format
+    """
+    time_index = pd.date_range('2020-01-01', periods=n_time, freq=freq)
+    return time_index.strftime('%Y-%m-%d %H:%M:%S').values.astype('S19')
+
+
+def _fill(dset, rng, scale, block):
+    """
+    Fill a (time, ...) dataset block by block with diurnal values plus noise
+    """
+    n_time = dset.shape[0]
+    site_shape = dset.shape[1:]
+    phase = rng.random(site_shape, dtype=np.float32) * 2 * np.pi
+    for start in range(0, n_time, block):
+        t = np.arange(start, min(start + block, n_time), dtype=np.float32)
+        t = t.reshape((-1,) + (1,) * len(site_shape))
+        data = (np.sin(t * 2 * np.pi / 48 + phase) + 1) * 5
+        data += rng.random(data.shape, dtype=np.float32)
+        dset[start:start + len(data)] = (data * scale).astype(dset.dtype)
+
+
+def make_nsrdb(path, n_time=17568, n_sites=2000, chunks=(2688, 372),
+               datasets=('ghi', 'wind_speed'), page_size=None, seed=0):
+    """
+    Write an NSRDB-like (time, sites) file
+
+    Parameters
+    ----------
+    path : str
+        Output .h5 path
+    n_time : int
+        Number of timesteps (17568 for one half-hourly year)
+    n_sites : int
+        Number of sites
+    chunks : tuple
+        Dataset chunk shape
+    datasets : tuple
+        Dataset names to create
+    page_size : int, optional
+        File space page size in MB
+    seed : int
+        Random seed
+
+    Returns
+    -------
+    path : str
+        Path of the written file
+    """
+    rng = np.random.default_rng(seed)
+    path = paged_path(path, page_size)
+    chunks = tuple(min(c, n) for c, n in zip(chunks, (n_time, n_sites)))
+    meta = np.zeros(n_sites, dtype=[('latitude', 'f4'), ('longitude', 'f4'),
+                                    ('elevation', 'f4'), ('timezone', 'i2'),
+                                    ('country', 'S20'), ('state', 'S20'),
+                                    ('county', 'S20')])
+    meta['latitude'] = rng.uniform(20, 50, n_sites)
+    meta['longitude'] = rng.uniform(-125, -65, n_sites)
+    meta['elevation'] = rng.uniform(0, 3000, n_sites)
+    meta['timezone'] = np.round(meta['longitude'] / 15).astype('i2')
+    meta['country'] = b'United States'
+    meta['state'] = rng.choice(STATES, n_sites)
+    meta['county'] = b'None'
+    with _create_file(path, page_size) as f:
+        f.create_dataset('time_index', data=_time_index(n_time, '30min'))
+        f.create_dataset('meta', data=meta)
+        for name in datasets:
+            dset = f.create_dataset(name, shape=(n_time, n_sites),
+                                    dtype='u2', chunks=chunks)
+            dset.attrs['scale_factor'] = 10
+            dset.attrs['units'] = 'm/s' if 'wind' in name else 'W/m2'
+            _fill(dset, rng, 10, chunks[0])
+
+    return path
+
+
+def make_wtk(path, n_time=8760, shape=(200, 300), chunks=(168, 64, 64),
+             datasets=('windspeed_100m',), page_size=None, seed=0):
+    """
+    Write a WTK-like (time, y, x) file on the WTK Lambert Conformal grid
+
+    Parameters
+    ----------
+    path : str
+        Output .h5 path
+    n_time : int
+        Number of hourly timesteps
+    shape : tuple
+        (y, x) grid shape, the full WTK grid is (1602, 2976)
+    chunks : tuple
+        Dataset chunk shape
+    datasets : tuple
+        Dataset names to create
+    page_size : int, optional
+        File space page size in MB
+    seed : int
+        Random seed
+
+    Returns
+    -------
+    path : str
+        Path of the written file
+    """
+    rng = np.random.default_rng(seed)
+    path = paged_path(path, page_size)
+    full = (n_time,) + tuple(shape)
+    chunks = tuple(min(c, n) for c, n in zip(chunks, full))
+    proj = Proj(WTK_PROJ)
+    # Approximate south-west corner of the WTK grid
+    x0, y0 = proj(-123.30, 19.62)
+    x = x0 + np.arange(shape[1]) * WTK_RESOLUTION
+    y = y0 + np.arange(shape[0]) * WTK_RESOLUTION
+    xx, yy = np.meshgrid(x, y)
+    lon, lat = proj(xx, yy, inverse=True)
+    with _create_file(path, page_size) as f:
+        f.create_dataset('time_index', data=_time_index(n_time, 'h'))
+        f.create_dataset('coordinates',
+                         data=np.stack((lat, lon), axis=-1).astype('f4'))
+        for name in datasets:
+            dset = f.create_dataset(name, shape=full, dtype='u2',
+                                    chunks=chunks)
+            dset.attrs['scale_factor'] = 100
+            dset.attrs['units'] = 'm s-1'
+            _fill(dset, rng, 100, chunks[0])
+
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('kind', choices=('nsrdb', 'wtk'))
+    parser.add_argument('path', help='output .h5 path')
+    parser.add_argument('--time', type=int, help='number of timesteps')
+    parser.add_argument('--sites', type=int, default=2000,
+                        help='number of NSRDB sites')
+    parser.add_argument('--grid', type=int, nargs=2, default=(200, 300),
+                        metavar=('Y', 'X'), help='WTK grid shape')
+    parser.add_argument('--chunks', type=int, nargs='+',
+                        help='dataset chunk shape')
+    parser.add_argument('--page-size', type=int, nargs='*', default=[None],
+                        help='page size(s) in MB, writes one file each')
+    args = parser.parse_args()
+
+    for page_size in args.page_size:
+        if args.kind == 'nsrdb':
+            kwargs = {'n_sites': args.sites}
+            if args.time:
+                kwargs['n_time'] = args.time
+            if args.chunks:
+                kwargs['chunks'] = tuple(args.chunks)
+
+            path = make_nsrdb(args.path, page_size=page_size, **kwargs)
+        else:
+            kwargs = {'shape': tuple(args.grid)}
+            if args.time:
+                kwargs['n_time'] = args.time
+            if args.chunks:
+                kwargs['chunks'] = tuple(args.chunks)
+
+            path = make_wtk(args.path, page_size=page_size, **kwargs)
+
+        print('wrote {} ({:.1f} MB)'.format(path,
+                                             os.path.getsize(path) / MB))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+Parallel map frame rendering and in-memory GIF / MP4 encoding
+
+The figure, scatter and colorbar are built once per worker process and each
+frame only updates the scatter colors before the canvas is redrawn with the
+Agg backend. Frames are returned as RGB arrays and encoded straight to bytes.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import io
+import os
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+from PIL import Image
+
+from raster import imshow as raster_imshow, pixel_grid, raster_shape
+
+# Per-process renderer created by the pool initializer
+_RENDERER = None
+
+
+class FrameRenderer:
+    """
+    Map figure that is set up once and re-colored for every frame
+    """
+
+    def __init__(self, lon, lat, cbar_label, vmin=0, vmax=None, cmap='YlOrRd',
+                 dpi=100, figsize=(8, 4), s=10, raster=None, how='mean'):
+        """
+        Parameters
+        ----------
+        lon : ndarray
+            Longitude vector
+        lat : ndarray
+            Latitude vector
+        cbar_label : str
+            Colorbar label
+        vmin : float
+            Min value for colormap
+        vmax : float
+            Max value for colormap
+        cmap : str
+            Colormap to use
+        dpi : int
+            plot resolution
+        figsize : tuple
+            Figure size
+        s : float
+            Marker size
+        raster : bool | tuple, optional
+            Draw frames as a raster image instead of one marker per site,
+            True for the default (rows, cols) resolution
+        how : str
+            Per-pixel aggregation for raster frames
+        """
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self._title = self.fig.suptitle('', fontsize=16)
+        ax = self.fig.add_subplot(111)
+        self._grid = None
+        self._how = how
+        if raster:
+            # Sites are mapped to pixels once, each frame is one bincount
+            self._grid = pixel_grid(lon, lat, shape=raster_shape(raster))
+            self._sc = raster_imshow(ax, self._grid, np.zeros(len(lon)),
+                                     how=how, cmap=cmap, vmin=vmin,
+                                     vmax=vmax)
+        else:
+            # Marker edges would double the per-frame drawing cost
+            self._sc = ax.scatter(lon, lat, c=np.zeros(len(lon)), cmap=cmap,
+                                  s=s, vmin=vmin, vmax=vmax, linewidths=0)
+
+        cbar = self.fig.colorbar(self._sc)
+        cbar.ax.set_ylabel(cbar_label, rotation=90)
+        ax.axis('off')
+        self.fig.tight_layout()
+        # Cache the static background (axes, colorbar) so frames only redraw
+        # the scatter and title
+        self._sc.set_visible(False)
+        self.canvas.draw()
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._sc.set_visible(True)
+
+    def render(self, data, title=None):
+        """
+        Render one frame
+
+        Parameters
+        ----------
+        data : ndarray
+            Value for each site
+        title : str, optional
+            Frame title
+
+        Returns
+        -------
+        frame : ndarray
+            (height, width, 3) uint8 RGB image
+        """
+        if self._grid is not None:
+            self._sc.set_data(self._grid.aggregate(data, how=self._how))
+        else:
+            self._sc.set_array(np.asarray(data))
+
+        self._title.set_text(title or '')
+        self.canvas.restore_region(self._background)
+        self._sc.axes.draw_artist(self._sc)
+        self.fig.draw_artist(self._title)
+
+        return np.asarray(self.canvas.buffer_rgba())[..., :3].copy()
+
+
+def _init_worker(lon, lat, kwargs):
+    """
+    Build the renderer once per worker process
+    """
+    global _RENDERER
+    _RENDERER = FrameRenderer(lon, lat, **kwargs)
+
+
+def _render_batch(batch):
+    """
+    Render a batch of (data, title) frames with the worker's renderer
+    """
+    return [_RENDERER.render(data, title) for data, title in batch]
+
+
+def render_frames(lon, lat, frames, cbar_label, titles=None, max_workers=None,
+                  **kwargs):
+    """
+    Render map frames across a process pool
+
+    Parameters
+    ----------
+    lon : ndarray
+        Longitude vector
+    lat : ndarray
+        Latitude vector
+    frames : ndarray
+        (frames, sites) values to plot
+    cbar_label : str
+        Colorbar label
+    titles : list, optional
+        Title for each frame
+    max_workers : int, optional
+        Number of worker processes, defaults to the number of CPUs. Frames
+        are rendered in this process if 1.
+    kwargs : dict
+        Additional FrameRenderer arguments, e.g. vmax, cmap, dpi, figsize
+
+    Returns
+    -------
+    images : list
+        (height, width, 3) uint8 RGB image for each frame
+    """
+    frames = np.asarray(frames)
+    if titles is None:
+        titles = [None] * len(frames)
+
+    kwargs['cbar_label'] = cbar_label
+    if kwargs.get('vmax') is None:
+        kwargs['vmax'] = np.nanmax(frames)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    max_workers = min(max_workers, len(frames))
+    jobs = list(zip(frames, titles))
+    if max_workers <= 1:
+        renderer = FrameRenderer(lon, lat, **kwargs)
+        return [renderer.render(data, title) for data, title in jobs]
+
+    # One interleaved batch per worker amortizes the figure setup
+    batches = [jobs[i::max_workers] for i in range(max_workers)]
+    images = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=_init_worker,
+                             initargs=(lon, lat, kwargs)) as pool:
+        for i, batch in enumerate(pool.map(_render_batch, batches)):
+            images[i::max_workers] = batch
+
+    return images
+
+
+def encode(images, fmt='gif', fps=4):
+    """
+    Encode frames into an animation in memory
+
+    Parameters
+    ----------
+    images : list
+        (height, width, 3) uint8 RGB frames
+    fmt : str
+        'gif', or 'mp4' which requires imageio with an ffmpeg plugin
+    fps : float
+        Frames per second
+
+    Returns
+    -------
+    bytes
+        Encoded animation
+    """
+    if fmt == 'gif':
+        # Quantize every frame to one palette sampled across the animation
+        # rather than computing a palette per frame
+        sample = np.concatenate(images[::max(1, len(images) // 4)])
+        palette = Image.fromarray(sample).quantize(colors=255)
+        frames = [Image.fromarray(image).quantize(palette=palette,
+                                                  dither=Image.Dither.NONE)
+                  for image in images]
+        buffer = io.BytesIO()
+        frames[0].save(buffer, format='GIF', save_all=True,
+                       append_images=frames[1:], duration=int(1000 / fps),
+                       loop=0)
+        return buffer.getvalue()
+
+    if fmt == 'mp4':
+        try:
+            import imageio.v3 as iio
+        except ImportError:
+            raise ImportError("run 'pip install imageio[ffmpeg]' to write "
+                              "mp4 output")
+
+        # Most codecs require even frame dimensions
+        h, w = (np.array(images[0].shape[:2]) // 2) * 2
+        return iio.imwrite('<bytes>', np.stack(images)[:, :h, :w],
+                           extension='.mp4', fps=fps)
+
+    raise ValueError("fmt must be 'gif' or 'mp4', got {}".format(fmt))
@@ -0,0 +1,234 @@
+"""
+asyncio facade over HSDS
+
+Each blocking HSDS call runs in a thread pool so that the network latency of
+many requests overlaps. A semaphore bounds the number of requests in flight,
+requests that have not started yet are cancelled with their task, and
+results can be streamed as they complete with bounded buffering.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import itertools
+
+from functions import HSDS
+
+
+class AsyncHSDS:
+    """
+    Awaitable HSDS extraction methods
+    """
+
+    def __init__(self, hsds, max_concurrency=8, executor=None, **kwargs):
+        """
+        Parameters
+        ----------
+        hsds : HSDS | str
+            HSDS instance, or path to open one with kwargs
+        max_concurrency : int
+            Maximum number of requests in flight
+        executor : concurrent.futures.Executor, optional
+            Executor to run blocking reads in, defaults to a thread pool
+            with max_concurrency workers
+        kwargs : dict
+            HSDS arguments if hsds is a path, e.g. cache or chunk_cache
+        """
+        if isinstance(hsds, str):
+            hsds = HSDS(hsds, **kwargs)
+
+        self.hsds = hsds
+        self.max_concurrency = max_concurrency
+        self._own_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+        self._executor = executor
+        self._semaphore = None
+
+    async def __aenter__(self):
+        await self.preload()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Shut down the executor if owned and close the HSDS file
+        """
+        if self._own_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+        self.hsds.close()
+
+    async def _run(self, func, *args, **kwargs):
+        """
+        Run a blocking call in the executor once a concurrency slot is free
+        """
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            call = functools.partial(func, *args, **kwargs)
+            return await loop.run_in_executor(self._executor, call)
+
+    async def preload(self):
+        """
+        Load the time index, meta data and site tree once up front so
+        concurrent requests don't each compute them
+        """
+        await self._run(self.hsds.preload)
+
+    async def get_timeseries(self, variable, coords, local=True):
+        """
+        Awaitable HSDS.get_timeseries
+        """
+        return await self._run(self.hsds.get_timeseries, variable, coords,
+                               local=local)
+
+    async def get_timestep(self, variable, timestep, region=None,
+                           column='state'):
+        """
+        Awaitable HSDS.get_timestep
+        """
+        return await self._run(self.hsds.get_timestep, variable, timestep,
+                               region=region, column=column)
+
+    async def get_day(self, variable, date, local=True):
+        """
+        Awaitable HSDS.get_day
+        """
+        return await self._run(self.hsds.get_day, variable, date,
+                               local=local)
+
+    @staticmethod
+    async def gather(*aws):
+        """
+        Await all awaitables, cancelling the remaining ones as soon as one
+        fails
+
+        Parameters
+        ----------
+        aws : list
+            Coroutines or futures
+
+        Returns
+        -------
+        results : list
+            Results in the order of aws
+        """
+        tasks = [asyncio.ensure_future(aw) for aw in aws]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def timeseries(self, variables, coords, local=True):
+        """
+        Extract time-series for several variables at several sites
+        concurrently
+
+        Parameters
+        ----------
+        variables : list
+            Variables to extract
+        coords : list
+            (lat, lon) coordinates of interest
+        local : bool
+            Shift time-series to local time
+
+        Returns
+        -------
+        ts : dict
+            {(variable, coords): pd.DataFrame}
+        """
+        keys = list(itertools.product(variables, [tuple(c) for c in coords]))
+        results = await self.gather(*[self.get_timeseries(v, c, local=local)
+                                      for v, c in keys])
+
+        return dict(zip(keys, results))
+
+    async def timesteps(self, variables, timesteps, region=None,
+                        column='state'):
+        """
+        Extract several variables at several timesteps concurrently
+
+        Parameters
+        ----------
+        variables : list
+            Variables to extract
+        timesteps : list
+            Timesteps of interest
+        region : str, optional
+            Region to extract, see HSDS.get_timestep
+        column : str
+            Meta column to filter the region on
+
+        Returns
+        -------
+        data : dict
+            {(variable, timestep): pd.DataFrame}
+        """
+        keys = list(itertools.product(variables, timesteps))
+        results = await self.gather(*[self.get_timestep(v, t, region=region,
+                                                        column=column)
+                                      for v, t in keys])
+
+        return dict(zip(keys, results))
+
+    async def as_completed(self, requests, buffer=None):
+        """
+        Stream results as they complete. At most buffer requests are
+        started ahead of the consumer, so a slow consumer slows down the
+        requests instead of accumulating results. Closing the generator
+        cancels the outstanding requests.
+
+        Parameters
+        ----------
+        requests : iterable
+            (method name, args, kwargs) tuples, e.g.
+            ('get_timeseries', ('ghi', (39.7, -105.2)), {})
+        buffer : int, optional
+            Maximum requests started but not yet consumed, defaults to
+            max_concurrency
+
+        Yields
+        ------
+        request : tuple
+            The request
+        result : object
+            The request's result
+        """
+        buffer = buffer or self.max_concurrency
+        requests = iter(requests)
+        pending = {}
+
+        def submit():
+            for request in itertools.islice(requests, 1):
+                name, args, kwargs = request
+                coro = getattr(self, name)(*args, **kwargs)
+                pending[asyncio.ensure_future(coro)] = request
+
+        try:
+            for _ in range(buffer):
+                submit()
+
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    request = pending.pop(task)
+                    yield request, task.result()
+                    submit()
+        finally:
+            for task in pending:
+                task.cancel()
+
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
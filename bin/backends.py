@@ -0,0 +1,259 @@
+"""
+Storage backends for opening NREL HDF5 resources by URI
+
+    hdf5://<domain>     HSDS via h5pyd
+    s3://<bucket/key>   HDF5 file on S3 via s3fs and h5py
+    http(s)://<url>     HDF5 file over HTTP via the h5py ros3 driver
+    file://<path>       Local (posix) HDF5 file via h5py
+
+Bare paths open a local file if one exists at that path, otherwise they are
+treated as HSDS domains (e.g. '/nrel/wtk-us.h5'). Every backend returns an
+object with the h5py File interface, so HSDS behaves identically on all of
+them.
+"""
+import os
+import warnings
+
+import h5py
+import h5pyd
+
+
+def resolve(path, backend=None):
+    """
+    Backend name and backend-specific path for a resource URI
+
+    Parameters
+    ----------
+    path : str
+        Resource URI or path
+    backend : str, optional
+        Force a backend: 'hsds', 's3fs', 'ros3' or 'posix'
+
+    Returns
+    -------
+    backend : str
+        Backend name
+    path : str
+        Path to pass to the backend
+    """
+    if path.startswith('hdf5://'):
+        inferred, path = 'hsds', path[len('hdf5:/'):]
+    elif path.startswith('s3://'):
+        inferred = 's3fs'
+    elif path.startswith(('http://', 'https://')):
+        inferred = 'ros3'
+    elif path.startswith('file://'):
+        inferred, path = 'posix', path[len('file://'):]
+    elif os.path.isfile(path):
+        inferred = 'posix'
+    else:
+        inferred = 'hsds'
+
+    backend = backend or inferred
+    if backend not in BACKENDS:
+        raise ValueError('Unknown backend {}, expected one of {}'
+                         .format(backend, list(BACKENDS)))
+
+    return backend, path
+
+
+def _resize_pool(h5_file, pool_maxsize):
+    """
+    Remount the HTTP adapters of an h5pyd file's session with a larger
+    connection pool, h5pyd hard-codes the pool size
+    """
+    try:
+        from requests.adapters import HTTPAdapter
+    except ImportError:
+        return
+
+    conn = getattr(h5_file.id, 'http_conn', None)
+    session = getattr(conn, '_s', None) or getattr(conn, 'session', None)
+    if session is None:
+        warnings.warn('Could not find the h5pyd HTTP session, pool_maxsize '
+                      'is ignored')
+        return
+
+    for prefix in ('http://', 'https://'):
+        retries = session.get_adapter(prefix).max_retries
+        session.mount(prefix, HTTPAdapter(pool_connections=pool_maxsize,
+                                          pool_maxsize=pool_maxsize,
+                                          max_retries=retries))
+
+
+def open_hsds(path, bucket=None, pool_maxsize=None, retries=10, timeout=180,
+              **kwargs):
+    """
+    Open an HSDS domain with h5pyd
+
+    Parameters
+    ----------
+    path : str
+        HSDS domain
+    bucket : str, optional
+        Storage bucket, defaults to the BUCKET_NAME environment variable
+    pool_maxsize : int, optional
+        HTTP connection pool size, raise it for many concurrent requests
+    retries : int
+        Number of retries of failed requests
+    timeout : float
+        Request timeout in seconds
+    kwargs : dict
+        Additional h5pyd.File arguments, e.g. endpoint or api_key
+
+    Returns
+    -------
+    h5pyd.File
+    """
+    bucket = bucket or os.environ.get('BUCKET_NAME')
+    h5_file = h5pyd.File(path, mode='r', bucket=bucket, retries=retries,
+                         timeout=timeout, **kwargs)
+    if pool_maxsize:
+        _resize_pool(h5_file, pool_maxsize)
+
+    return h5_file
+
+
+def open_posix(path, page_buf_size=None, rdcc_nbytes=None, **kwargs):
+    """
+    Open a local HDF5 file with h5py
+
+    Parameters
+    ----------
+    path : str
+        Local file path
+    page_buf_size : int, optional
+        HDF5 page buffer size in bytes, only used by files written with
+        paged aggregation
+    rdcc_nbytes : int, optional
+        HDF5 raw data chunk cache size in bytes per dataset
+    kwargs : dict
+        Additional h5py.File arguments
+
+    Returns
+    -------
+    h5py.File
+    """
+    return h5py.File(path, mode='r', page_buf_size=page_buf_size,
+                     rdcc_nbytes=rdcc_nbytes, **kwargs)
+
+
+def open_ros3(path, page_buf_size=None, rdcc_nbytes=None, **kwargs):
+    """
+    Open an HDF5 file over HTTP(S) or S3 with the h5py ros3 driver
+
+    Parameters
+    ----------
+    path : str
+        File URL
+    page_buf_size : int, optional
+        HDF5 page buffer size in bytes
+    rdcc_nbytes : int, optional
+        HDF5 raw data chunk cache size in bytes per dataset
+    kwargs : dict
+        Additional h5py.File arguments, e.g. aws_region
+
+    Returns
+    -------
+    h5py.File
+    """
+    if 'ros3' not in h5py.registered_drivers():
+        raise RuntimeError('h5py was built without the ros3 driver')
+
+    return h5py.File(path, mode='r', driver='ros3',
+                     page_buf_size=page_buf_size, rdcc_nbytes=rdcc_nbytes,
+                     **kwargs)
+
+
+def open_s3fs(path, page_buf_size=None, rdcc_nbytes=None, block_size=None,
+              cache_type='readahead', anon=True, **kwargs):
+    """
+    Open an HDF5 file on S3 through an s3fs file object
+
+    Parameters
+    ----------
+    path : str
+        s3:// URI
+    page_buf_size : int, optional
+        HDF5 page buffer size in bytes
+    rdcc_nbytes : int, optional
+        HDF5 raw data chunk cache size in bytes per dataset
+    block_size : int, optional
+        s3fs read block size in bytes, e.g. the file's page size
+    cache_type : str
+        s3fs block cache strategy, e.g. 'readahead', 'blockcache' or 'none'
+    anon : bool
+        Anonymous S3 access
+    kwargs : dict
+        Additional s3fs.S3FileSystem arguments
+
+    Returns
+    -------
+    h5py.File
+    """
+    try:
+        import s3fs
+    except ImportError:
+        raise ImportError("run 'pip install s3fs' to use the s3fs backend")
+
+    fs = s3fs.S3FileSystem(anon=anon, **kwargs)
+    open_kwargs = {'cache_type': cache_type}
+    if block_size:
+        open_kwargs['block_size'] = block_size
+
+    f = fs.open(path, 'rb', **open_kwargs)
+
+    return h5py.File(f, mode='r', page_buf_size=page_buf_size,
+                     rdcc_nbytes=rdcc_nbytes)
+
+
+def page_size(h5_file):
+    """
+    File space page size of a file written with paged aggregation
+
+    Parameters
+    ----------
+    h5_file : h5py.File | h5pyd.File
+        Open file
+
+    Returns
+    -------
+    page_size : int | None
+        Page size in bytes, None if the file is not paged or is served by
+        HSDS, which has no page buffer
+    """
+    if not isinstance(h5_file.id, h5py.h5f.FileID):
+        return None
+
+    plist = h5_file.id.get_create_plist()
+    if plist.get_file_space_strategy()[0] != h5py.h5f.FSPACE_STRATEGY_PAGE:
+        return None
+
+    return plist.get_file_space_page_size()
+
+
+BACKENDS = {'hsds': open_hsds, 's3fs': open_s3fs, 'ros3': open_ros3,
+            'posix': open_posix}
+
+
+def open_file(path, backend=None, **kwargs):
+    """
+    Open an HDF5 resource with the backend for its URI scheme
+
+    Parameters
+    ----------
+    path : str
+        Resource URI or path, see module docstring
+    backend : str, optional
+        Force a backend: 'hsds', 's3fs', 'ros3' or 'posix'
+    kwargs : dict
+        Backend tuning, e.g. page_buf_size, rdcc_nbytes, block_size or
+        pool_maxsize, see the open_* functions
+
+    Returns
+    -------
+    h5pyd.File | h5py.File
+    """
+    backend, path = resolve(path, backend=backend)
+
+    return BACKENDS[backend](path, **kwargs)
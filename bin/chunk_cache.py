@@ -0,0 +1,286 @@
+"""
+In-process LRU chunk cache for h5pyd / h5py datasets
+"""
+from collections import OrderedDict
+import hashlib
+import itertools
+import os
+import threading
+
+import numpy as np
+
+from read_planner import normalize_selection
+
+
+class ChunkCache:
+    """
+    Byte-budgeted LRU cache of decoded dataset chunks keyed by
+    (domain, dataset, chunk coordinate), with an optional local disk tier
+    that evicted chunks spill to
+    """
+
+    def __init__(self, max_bytes=512 * 1024 ** 2, disk_dir=None,
+                 max_disk_bytes=8 * 1024 ** 3):
+        """
+        Parameters
+        ----------
+        max_bytes : int
+            Memory budget in bytes
+        disk_dir : str, optional
+            Directory for the disk tier, if None evicted chunks are dropped
+        max_disk_bytes : int
+            Disk tier budget in bytes
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._chunks = OrderedDict()
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def __contains__(self, key):
+        return key in self._chunks or key in self._disk
+
+    def _disk_path(self, key):
+        """
+        File holding a spilled chunk
+        """
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, name + '.npy')
+
+    def _spill(self, key, chunk):
+        """
+        Write an evicted chunk to the disk tier
+        """
+        path = self._disk_path(key)
+        np.save(path, chunk)
+        self._disk[key] = chunk.nbytes
+        self._disk_bytes += chunk.nbytes
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            old, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._disk_path(old))
+            except OSError:
+                pass
+
+    def get(self, key):
+        """
+        Get a chunk from the cache
+
+        Parameters
+        ----------
+        key : tuple
+            (domain, dataset, chunk coordinate)
+
+        Returns
+        -------
+        chunk : ndarray | None
+            Cached chunk, None on a miss
+        """
+        with self._lock:
+            if key in self._chunks:
+                self._chunks.move_to_end(key)
+                self.hits += 1
+                return self._chunks[key]
+
+            if key in self._disk:
+                size = self._disk.pop(key)
+                self._disk_bytes -= size
+                path = self._disk_path(key)
+                chunk = np.load(path)
+                os.remove(path)
+                self.disk_hits += 1
+                self._put(key, chunk)
+                return chunk
+
+            self.misses += 1
+
+        return None
+
+    def _put(self, key, chunk):
+        """
+        Insert a chunk and evict least recently used chunks, lock must be
+        held by the caller
+        """
+        if key in self._chunks:
+            self.nbytes -= self._chunks.pop(key).nbytes
+
+        self._chunks[key] = chunk
+        self.nbytes += chunk.nbytes
+        while self.nbytes > self.max_bytes and len(self._chunks) > 1:
+            old, old_chunk = self._chunks.popitem(last=False)
+            self.nbytes -= old_chunk.nbytes
+            self.evictions += 1
+            if self.disk_dir is not None:
+                self._spill(old, old_chunk)
+
+    def put(self, key, chunk):
+        """
+        Add a chunk to the cache
+
+        Parameters
+        ----------
+        key : tuple
+            (domain, dataset, chunk coordinate)
+        chunk : ndarray
+            Decoded chunk data
+        """
+        with self._lock:
+            self._put(key, chunk)
+
+    def clear(self):
+        """
+        Drop all cached chunks, including the disk tier
+        """
+        with self._lock:
+            for key in self._disk:
+                try:
+                    os.remove(self._disk_path(key))
+                except OSError:
+                    pass
+
+            self._chunks.clear()
+            self._disk.clear()
+            self.nbytes = 0
+            self._disk_bytes = 0
+
+    def stats(self):
+        """
+        Returns
+        -------
+        stats : dict
+            Hit, disk hit, miss and eviction counters plus memory and disk
+            usage in bytes
+        """
+        return {'hits': self.hits, 'disk_hits': self.disk_hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'chunks': len(self._chunks), 'bytes': self.nbytes,
+                'disk_bytes': self._disk_bytes}
+
+
+class CachedDataset:
+    """
+    Wrapper around an h5pyd / h5py dataset that serves reads from a
+    ChunkCache, fetching missing chunks from the underlying dataset
+    """
+
+    def __init__(self, ds, cache, domain):
+        """
+        Parameters
+        ----------
+        ds : h5pyd.Dataset | h5py.Dataset
+            Dataset to wrap
+        cache : ChunkCache
+            Shared chunk cache
+        domain : str
+            Domain (file) path, used in the cache keys
+        """
+        self._ds = ds
+        self._cache = cache
+        self._domain = domain
+        self.chunks = ds.chunks if ds.chunks is not None else ds.shape
+
+    def __getattr__(self, attr):
+        return getattr(self._ds, attr)
+
+    def _key(self, chunk):
+        """
+        Cache key of a chunk coordinate
+        """
+        return (self._domain, self._ds.name, chunk)
+
+    def _chunk_slices(self, chunk):
+        """
+        Dataset slices covering a chunk coordinate
+        """
+        return tuple(slice(c * size, min((c + 1) * size, n))
+                     for c, size, n in zip(chunk, self.chunks,
+                                           self._ds.shape))
+
+    def _fetch(self, missing):
+        """
+        Read missing chunks from the dataset and add them to the cache. If
+        the missing chunks fill most of their bounding box they are read
+        with a single request, otherwise one request per chunk.
+        """
+        fetched = {}
+        lo = np.min(missing, axis=0)
+        hi = np.max(missing, axis=0)
+        if np.prod(hi - lo + 1) <= 2 * len(missing):
+            box = self._chunk_slices(tuple(lo))
+            box = tuple(slice(b.start, s.stop) for b, s
+                        in zip(box, self._chunk_slices(tuple(hi))))
+            block = self._ds[box]
+            for chunk in missing:
+                local = tuple(slice(s.start - b.start, s.stop - b.start)
+                              for s, b in zip(self._chunk_slices(chunk), box))
+                fetched[chunk] = np.ascontiguousarray(block[local])
+        else:
+            for chunk in missing:
+                fetched[chunk] = self._ds[self._chunk_slices(chunk)]
+
+        for chunk, data in fetched.items():
+            self._cache.put(self._key(chunk), data)
+
+        return fetched
+
+    def __getitem__(self, selection):
+        if not isinstance(selection, tuple):
+            selection = (selection,)
+
+        if any(sel is Ellipsis for sel in selection):
+            selection = tuple(slice(None) if sel is Ellipsis else sel
+                              for sel in selection)
+
+        ndim = len(self._ds.shape)
+        selection = selection + (slice(None),) * (ndim - len(selection))
+        idx, inverse, scalar = zip(*[normalize_selection(sel, n) for sel, n
+                                     in zip(selection, self._ds.shape)])
+        chunk_ids = [i // c for i, c in zip(idx, self.chunks)]
+        touched = list(itertools.product(*[np.unique(c).tolist()
+                                           for c in chunk_ids]))
+
+        data = {}
+        missing = []
+        for chunk in touched:
+            cached = self._cache.get(self._key(chunk))
+            if cached is None:
+                missing.append(chunk)
+            else:
+                data[chunk] = cached
+
+        if missing:
+            data.update(self._fetch(missing))
+
+        out = np.empty([len(i) for i in idx], dtype=self._ds.dtype)
+        for chunk in touched:
+            # Indices are sorted, so each chunk covers a contiguous range
+            pos = [slice(np.searchsorted(ids, c, side='left'),
+                         np.searchsorted(ids, c, side='right'))
+                   for ids, c in zip(chunk_ids, chunk)]
+            local = [i[p] - c * size for i, p, c, size
+                     in zip(idx, pos, chunk, self.chunks)]
+            out[tuple(pos)] = data[chunk][np.ix_(*local)]
+
+        for axis, inv in enumerate(inverse):
+            if inv is not None:
+                out = np.take(out, inv, axis=axis)
+
+        drop = [axis for axis, s in enumerate(scalar) if s]
+        if drop:
+            out = out.reshape([n for axis, n in enumerate(out.shape)
+                               if axis not in drop])
+
+        return out
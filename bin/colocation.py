@@ -0,0 +1,384 @@
+"""
+Co-location of NSRDB sites with WIND Toolkit (WTK) grid cells
+
+The NSRDB site to WTK (i, j) cell mapping is computed for every site at once
+by projecting the site coordinates onto the WTK grid and is kept in the
+persistent meta cache, so mapping a region is a single array lookup. Site
+groups are read with one planned request per variable on each side, issued
+concurrently and restricted to the time window both datasets cover. The two
+cadences are then aligned on a common time index with vectorized resampling.
+
+    colocator = CoLocator(HSDS(nsrdb_path), HSDS(wtk_path))
+    sites = colocator.nsrdb.find_sites(state='Texas')
+    for group in colocator.iter_groups(sites, ['ghi', 'wind_speed'],
+                                       ['GHI', 'windspeed_10m']):
+        df = group.to_frame()
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+ALIGN_METHODS = ('instant', 'mean')
+
+
+def _ns(time_index):
+    """
+    int64 UTC nanoseconds of a DatetimeIndex, whatever its resolution
+    """
+    time_index = pd.DatetimeIndex(time_index)
+    if time_index.tz is not None:
+        time_index = time_index.tz_convert(None)
+
+    return np.asarray(time_index, dtype='M8[ns]').view(np.int64)
+
+
+def cadence(time_index):
+    """
+    Typical time step of a time index
+
+    Parameters
+    ----------
+    time_index : pd.DatetimeIndex
+        Sorted time index
+
+    Returns
+    -------
+    pd.Timedelta
+        Median time step
+    """
+    return pd.Timedelta(int(np.median(np.diff(_ns(time_index)))))
+
+
+def common_index(a, b, freq=None):
+    """
+    Common time index of two datasets: the timestamps of the coarser one
+    within the window both cover, or a regular index at freq
+
+    Parameters
+    ----------
+    a : pd.DatetimeIndex
+        UTC time index of the first dataset
+    b : pd.DatetimeIndex
+        UTC time index of the second dataset
+    freq : str | pd.Timedelta, optional
+        Cadence of the common index, e.g. '1h'
+
+    Returns
+    -------
+    pd.DatetimeIndex
+    """
+    start = max(a[0], b[0])
+    end = min(a[-1], b[-1])
+    if start > end:
+        raise ValueError('The datasets do not overlap in time: {} - {} and '
+                         '{} - {}'.format(a[0], a[-1], b[0], b[-1]))
+
+    if freq is not None:
+        return pd.date_range(start.ceil(freq), end, freq=freq)
+
+    coarse = a if cadence(a) >= cadence(b) else b
+
+    return coarse[(coarse >= start) & (coarse <= end)]
+
+
+def _bin_edges(target):
+    """
+    Edges of the [t, next t) averaging bins of a target index, the last bin
+    is one time step long
+    """
+    step = np.median(np.diff(target)) if len(target) > 1 else 0
+    return np.append(target, target[-1] + int(step))
+
+
+def time_selection(times, target, how='instant'):
+    """
+    Rows of a dataset needed to resample it onto a target index
+
+    Parameters
+    ----------
+    times : pd.DatetimeIndex
+        Time index of the dataset
+    target : pd.DatetimeIndex
+        Target time index
+    how : str
+        'instant' takes the rows at the target timestamps, 'mean' averages
+        all rows in [t, next t)
+
+    Returns
+    -------
+    selection : slice
+        Rows to read, strided when the needed rows are evenly spaced
+    times : pd.DatetimeIndex
+        Timestamps of the selected rows
+    """
+    t, g = _ns(times), _ns(target)
+    if how == 'instant':
+        pos = np.minimum(np.searchsorted(t, g), len(t) - 1)
+        rows = pos[t[pos] == g]
+        if not len(rows):
+            raise ValueError('None of the target timestamps are in the '
+                             'dataset')
+
+        step = np.diff(rows)
+        if len(rows) > 1 and (step == step[0]).all():
+            selection = slice(int(rows[0]), int(rows[-1]) + 1, int(step[0]))
+        else:
+            selection = slice(int(rows[0]), int(rows[-1]) + 1)
+    elif how == 'mean':
+        edges = _bin_edges(g)
+        start, stop = np.searchsorted(t, edges[[0, -1]])
+        selection = slice(int(start), int(stop))
+    else:
+        raise ValueError('how must be one of {}, got {!r}'
+                         .format(ALIGN_METHODS, how))
+
+    return selection, times[selection]
+
+
+def resample(data, times, target, how='instant'):
+    """
+    Resample (time, ...) data onto a target time index
+
+    Parameters
+    ----------
+    data : ndarray
+        (time, ...) array
+    times : pd.DatetimeIndex
+        Timestamps of the rows of data
+    target : pd.DatetimeIndex
+        Target time index
+    how : str
+        'instant' takes the rows at the target timestamps, 'mean' averages
+        all rows in [t, next t). Targets without data are NaN.
+
+    Returns
+    -------
+    ndarray
+        float32 (target, ...) array
+    """
+    t, g = _ns(times), _ns(target)
+    out = np.full((len(g),) + data.shape[1:], np.nan, dtype=np.float32)
+    if how == 'instant':
+        pos = np.minimum(np.searchsorted(t, g), len(t) - 1)
+        hit = t[pos] == g
+        out[hit] = data[pos[hit]]
+    elif how == 'mean':
+        edges = np.searchsorted(t, _bin_edges(g))
+        counts = np.diff(edges)
+        full = counts > 0
+        if full.any():
+            # Bins are contiguous, so each reduceat segment is one bin
+            starts = edges[:-1][full]
+            sums = np.add.reduceat(data[:edges[-1]], starts, axis=0,
+                                   dtype=np.float64)
+            counts = counts[full].reshape((-1,) + (1,) * (data.ndim - 1))
+            out[full] = sums / counts
+    else:
+        raise ValueError('how must be one of {}, got {!r}'
+                         .format(ALIGN_METHODS, how))
+
+    return out
+
+
+class CoLocated:
+    """
+    Time-aligned NSRDB and WTK data for a group of co-located sites
+    """
+
+    def __init__(self, time_index, site_idx, ij):
+        """
+        Parameters
+        ----------
+        time_index : pd.DatetimeIndex
+            Common UTC time index
+        site_idx : ndarray
+            NSRDB site gids
+        ij : ndarray
+            (sites, 2) WTK (i, j) cell of each site
+        """
+        self.time_index = time_index
+        self.site_idx = site_idx
+        self.ij = ij
+        # {variable: float32 (time, sites) array}
+        self.nsrdb = {}
+        self.wtk = {}
+
+    def __len__(self):
+        return len(self.site_idx)
+
+    def to_frame(self):
+        """
+        Returns
+        -------
+        pd.DataFrame
+            Tidy frame indexed by (Datetime, gid) with (dataset, variable)
+            columns
+        """
+        index = pd.MultiIndex.from_product([self.time_index, self.site_idx],
+                                           names=['Datetime', 'gid'])
+        columns = []
+        data = []
+        for dataset, arrays in (('NSRDB', self.nsrdb), ('WTK', self.wtk)):
+            for variable, values in arrays.items():
+                columns.append((dataset, variable))
+                data.append(values.ravel())
+
+        columns = pd.MultiIndex.from_tuples(columns,
+                                            names=['dataset', 'variable'])
+
+        return pd.DataFrame(np.column_stack(data), index=index,
+                            columns=columns)
+
+
+class CoLocator:
+    """
+    Batched extraction of co-located, time-aligned NSRDB and WTK data
+    """
+
+    def __init__(self, nsrdb, wtk, freq=None, how='instant', max_workers=4):
+        """
+        Parameters
+        ----------
+        nsrdb : HSDS
+            NSRDB resource, e.g. one year of the aggregated NSRDB
+        wtk : HSDS
+            WTK resource with (time, rows, cols) datasets
+        freq : str, optional
+            Cadence of the common time index, defaults to the cadence of
+            the coarser dataset
+        how : str
+            'instant' samples the finer dataset at the common timestamps
+            (e.g. every other half-hourly NSRDB step for hourly WTK), 'mean'
+            averages it over each common time step
+        max_workers : int
+            Number of variables read concurrently
+        """
+        self.nsrdb = nsrdb
+        self.wtk = wtk
+        self.grid = wtk.wtk_grid
+        self.how = how
+        self.max_workers = max_workers
+        self.time_index = common_index(nsrdb.time_index, wtk.time_index,
+                                       freq=freq)
+        self._nsrdb_time = time_selection(nsrdb.time_index, self.time_index,
+                                          how=how)
+        self._wtk_time = time_selection(wtk.time_index, self.time_index,
+                                        how=how)
+        self._cells = None
+
+    @property
+    def cells(self):
+        """
+        Returns
+        -------
+        _cells : ndarray
+            int32 (n_sites, 2) WTK (i, j) cell of every NSRDB site, -1 for
+            sites outside the WTK grid
+        """
+        if self._cells is None:
+            name = 'wtk_cells_{}x{}_{:.0f}_{:.0f}'.format(*self.grid.shape,
+                                                          *self.grid.origin)
+
+            def build():
+                lat_lon = self.nsrdb.meta_store.coordinates
+                ji = self.grid.to_grid(lat_lon[:, ::-1])
+                ij = np.rint(ji[:, ::-1]).astype(np.int32)
+                outside = ((ij < 0) | (ij >= self.grid.shape)).any(axis=1)
+                ij[outside] = -1
+
+                return ij
+
+            self._cells = self.nsrdb.cached(name, build)
+
+        return self._cells
+
+    def _read_nsrdb(self, variable, site_idx):
+        """
+        Read, scale and align variable for NSRDB sites
+        """
+        selection, times = self._nsrdb_time
+        data = self.nsrdb.read_unscaled(variable, selection, site_idx)
+
+        return resample(data, times, self.time_index, how=self.how)
+
+    def _read_wtk(self, variable, i, j, inverse):
+        """
+        Read, scale and align variable for WTK cells, expanded to sites
+        """
+        selection, times = self._wtk_time
+        data = self.wtk.read_cells(variable, i, j, time_slice=selection)
+
+        return resample(data, times, self.time_index, how=self.how)[:, inverse]
+
+    def colocate(self, site_idx, nsrdb_variables, wtk_variables):
+        """
+        Extract time-aligned NSRDB and WTK data for a group of sites. Sites
+        outside the WTK grid are dropped and sites sharing a WTK cell read
+        it once.
+
+        Parameters
+        ----------
+        site_idx : ndarray | list
+            NSRDB site gids
+        nsrdb_variables : list
+            NSRDB variables to extract
+        wtk_variables : list
+            WTK variables to extract
+
+        Returns
+        -------
+        CoLocated
+        """
+        site_idx = np.unique(np.asarray(site_idx, dtype=np.int64))
+        ij = self.cells[site_idx]
+        inside = ij[:, 0] >= 0
+        site_idx, ij = site_idx[inside], ij[inside]
+        n_cols = self.grid.shape[1]
+        cells, inverse = np.unique(ij[:, 0].astype(np.int64) * n_cols
+                                   + ij[:, 1], return_inverse=True)
+        i, j = np.divmod(cells, n_cols)
+
+        group = CoLocated(self.time_index, site_idx, ij)
+        if not len(site_idx):
+            return group
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            nsrdb = {variable: pool.submit(self._read_nsrdb, variable,
+                                           site_idx)
+                     for variable in dict.fromkeys(nsrdb_variables)}
+            wtk = {variable: pool.submit(self._read_wtk, variable, i, j,
+                                         inverse)
+                   for variable in dict.fromkeys(wtk_variables)}
+            group.nsrdb = {k: f.result() for k, f in nsrdb.items()}
+            group.wtk = {k: f.result() for k, f in wtk.items()}
+
+        return group
+
+    def iter_groups(self, site_idx, nsrdb_variables, wtk_variables,
+                    group_size=1000):
+        """
+        Extract many sites in groups of neighbouring gids, so each group is
+        read with a few coalesced requests and memory stays bounded by one
+        group
+
+        Parameters
+        ----------
+        site_idx : ndarray | list
+            NSRDB site gids, e.g. from HSDS.find_sites
+        nsrdb_variables : list
+            NSRDB variables to extract
+        wtk_variables : list
+            WTK variables to extract
+        group_size : int
+            Maximum number of sites per group
+
+        Yields
+        ------
+        CoLocated
+        """
+        site_idx = np.unique(np.asarray(site_idx, dtype=np.int64))
+        site_idx = site_idx[self.cells[site_idx, 0] >= 0]
+        for start in range(0, len(site_idx), group_size):
+            yield self.colocate(site_idx[start:start + group_size],
+                                nsrdb_variables, wtk_variables)
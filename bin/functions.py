@@ -1,17 +1,33 @@
 """
 HSDS data extraction functions
 """
-import dateutil
-import h5pyd
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
 import os
 import pandas as pd
-from pyproj import Proj
-from scipy.spatial import cKDTree
+from PIL import Image
 import seaborn as sns
 
+import animation
+import backends
+import instrument
+from chunk_cache import CachedDataset, ChunkCache
+from meta_cache import MetaCache, cached
+from meta_store import MetaStore
+from polygon_mask import SparseCells, read_cells, site_cells
+from raster import imshow as raster_imshow, pixel_grid, raster_shape
+import read_planner
+from reductions import (GroupedStats, P2Quantile, RunningStats,
+                        StreamingHistogram)
+from region_masks import RegionMasks
+from spatial_index import SiteIndex
+from time_index import TimeIndex, parse_time_index
+import vertical
+from wtk_grid import WTKGrid
+
 mpl.rcParams['font.sans-serif'] = 'DejaVu Sans'
 mpl.rcParams['pdf.fonttype'] = 42
 mpl.rc('xtick', labelsize=14)
@@ -21,44 +37,52 @@ sns.set_style("white")
 sns.set_style("ticks")
 
 
-def WTK_idx(wtk, lat_lon):
+# Most recently used WTK grids by filename, bounded to MAX_WTK_GRIDS
+_WTK_GRIDS = OrderedDict()
+MAX_WTK_GRIDS = 8
+
+
+def WTK_idx(wtk, lat_lon, clip=False):
     """
     Function to find the nearest x/y WTK indices for a given lat/lon using
-    Proj4 projection library
+    Proj4 projection library. The projection and grid origin are cached for
+    the most recently used files.
 
     Parameters
     ----------
     wtk : 'h5pyd.File'
         h5pyd File instance for the WTK
-    lat_lon : tuple | list
-        (lat, lon) coordinates of interest
+    lat_lon : tuple | list | ndarray
+        (lat, lon) coordinates of interest, or (n, 2) array of coordinates
+    clip : bool
+        Snap coordinates outside the WTK grid to the nearest edge cell
+        instead of raising a ValueError
 
     Results
     -------
-    ij : 'tuple'
+    ij : 'tuple' | ndarray
         x/y coordinate in the database of the closest pixel to coordinate of
-        interest
+        interest, or (n, 2) array of indices
     """
-    dset_coords = wtk['coordinates']
-    projstring = """+proj=lcc +lat_1=30 +lat_2=60
-                    +lat_0=38.47240422490422 +lon_0=-96.0
-                    +x_0=0 +y_0=0 +ellps=sphere
-                    +units=m +no_defs """
-    projectLcc = Proj(projstring)
-    # Grab origin directly from database
-    origin_ll = reversed(dset_coords[0][0])
-    origin = projectLcc(*origin_ll)
-
-    lon_lat = reversed(lat_lon)
-    coords = projectLcc(*lon_lat)
-    delta = np.subtract(coords, origin)
-    ij = [int(round(x / 2000)) for x in delta]
-    return tuple(reversed(ij))
+    grid = _WTK_GRIDS.pop(wtk.filename, None)
+    if grid is None:
+        grid = WTKGrid(wtk)
+
+    _WTK_GRIDS[wtk.filename] = grid
+    while len(_WTK_GRIDS) > MAX_WTK_GRIDS:
+        _WTK_GRIDS.popitem(last=False)
+
+    ij = grid.ij(lat_lon, clip=clip)
+    if ij.ndim == 1:
+        return tuple(int(x) for x in ij)
+
+    return ij
 
 
 def NSRDB_idx(nsrdb, lat_lon):
     """
-    Function to find the NSRDB site index for a given lat/lon using a KDTree
+    Function to find the NSRDB site index for a given lat/lon by
+    great-circle distance
 
     Parameters
     ----------
@@ -82,8 +106,7 @@ def NSRDB_idx(nsrdb, lat_lon):
         # ensure we have an (N,2) numpy array of lat/lon
         dset_coords = meta[['latitude', 'longitude']].values
 
-    tree = cKDTree(dset_coords)
-    _, pos = tree.query(np.array(lat_lon))
+    _, pos = SiteIndex(dset_coords).query(np.array(lat_lon))
     return pos
 
 
@@ -102,9 +125,9 @@ def datetimeIndex(f):
     dt : 'pd.DataFrame'
         DataFrame containing parsed 'datetime' stamps
     """
-    dt = f["datetime"]
-    dt = pd.DataFrame({"datetime": dt[:]}, index=range(0, dt.shape[0]))
-    dt['datetime'] = dt['datetime'].apply(dateutil.parser.parse)
+    dt = f["datetime"][:]
+    dt = parse_time_index(dt).tz_convert(None)
+    dt = pd.DataFrame({"datetime": dt}, index=range(0, len(dt)))
     return dt
 
 
@@ -113,19 +136,107 @@ class HSDS:
     HSDS Resource handler class
     """
 
-    def __init__(self, hsds_path, preload=False):
+    def __init__(self, hsds_path, preload=False, cache=None,
+                 chunk_cache=None, backend=None, **backend_kwargs):
         """
         Parameters
         ----------
-        hsds_path : h5pyd.File instance
+        hsds_path : str
+            Resource URI or path: an HSDS domain (hdf5:// or a bare domain
+            path), s3://, http(s):// (ros3) or a local file (file:// or an
+            existing path)
+        preload : bool
+            Preload time_index, meta, and tree
+        cache : MetaCache | str | bool, optional
+            Persistent cache for meta, time_index and tree. A str is used as
+            the cache directory, True uses the default cache directory.
+        chunk_cache : ChunkCache | int, optional
+            In-memory chunk cache, or its memory budget in bytes, used for
+            all dataset reads. Can be shared between HSDS instances.
+        backend : str, optional
+            Force a backend: 'hsds', 's3fs', 'ros3' or 'posix'
+        backend_kwargs : dict
+            Backend tuning, e.g. page_buf_size, rdcc_nbytes, block_size or
+            pool_maxsize, see backends.open_file
         """
-        self._h5d = h5pyd.File(hsds_path, mode='r')
+        self._hsds_path = hsds_path
+        self._h5d = backends.open_file(hsds_path, backend=backend,
+                                       **backend_kwargs)
+        if cache is True:
+            cache = MetaCache()
+        elif isinstance(cache, str):
+            cache = MetaCache(cache_dir=cache)
+
+        self._cache = cache or None
+        if isinstance(chunk_cache, int) and not isinstance(chunk_cache, bool):
+            chunk_cache = ChunkCache(max_bytes=chunk_cache)
+
+        self._chunk_cache = chunk_cache
+        self._time_index = None
+        self._time_lookup = None
+        self._meta = None
+        self._meta_store = None
+        self._tree = None
+        self._regions = None
+        self._wtk_grid = None
         if preload:
             self.preload()
-        else:
-            self._time_index = None
-            self._meta = None
-            self._tree = None
+
+    @property
+    def chunk_cache(self):
+        """
+        Returns
+        -------
+        _chunk_cache : ChunkCache | None
+            Chunk cache used for dataset reads
+        """
+        return self._chunk_cache
+
+    def dataset(self, variable):
+        """
+        Dataset for variable, wrapped in the chunk cache if one is in use
+
+        Parameters
+        ----------
+        variable : str
+            Dataset name
+
+        Returns
+        -------
+        ds : h5pyd.Dataset | CachedDataset
+        """
+        ds = self._h5d[variable]
+        if self._chunk_cache is not None:
+            ds = CachedDataset(ds, self._chunk_cache, self._hsds_path)
+
+        return ds
+
+    def cached(self, name, func):
+        """
+        Load an artifact from the persistent cache or compute it with func
+
+        Parameters
+        ----------
+        name : str
+            Artifact name, unique per file
+        func : callable
+            Function returning the artifact
+
+        Returns
+        -------
+        obj : ndarray | object
+        """
+        return cached(self._cache, self._h5d, self._hsds_path, name, func)
+
+    @property
+    def datasets(self):
+        """
+        Returns
+        -------
+        list
+            Names of the datasets in the file
+        """
+        return list(self._h5d)
 
     @property
     def time_index(self):
@@ -136,13 +247,37 @@ class HSDS:
             Datetime index vector for given HSDS file
         """
         if self._time_index is None:
-            time_index = self._h5d['time_index'][...].astype(str)
-            # Parse as UTC-aware timestamps to avoid tz-naive vs tz-aware
-            # arithmetic errors when comparing or subtracting datetimes.
-            self._time_index = pd.to_datetime(time_index, utc=True)
+            def parse():
+                # Parse as UTC-aware timestamps to avoid tz-naive vs tz-aware
+                # arithmetic errors when comparing or subtracting datetimes.
+                # WTK files name the time index 'datetime'
+                name = 'time_index'
+                if name not in self._h5d and 'datetime' in self._h5d:
+                    name = 'datetime'
+
+                raw = instrument.full_read(name, self._h5d[name])
+                time_index = parse_time_index(raw)
+                return time_index.tz_convert(None).values.astype('M8[ns]')
+
+            time_index = self.cached('time_index', parse)
+            self._time_index = pd.DatetimeIndex(np.asarray(time_index),
+                                                tz='UTC')
 
         return self._time_index
 
+    @property
+    def time_lookup(self):
+        """
+        Returns
+        -------
+        _time_lookup : TimeIndex
+            Fast timestamp to time index position lookups
+        """
+        if self._time_lookup is None:
+            self._time_lookup = TimeIndex(self.time_index)
+
+        return self._time_lookup
+
     @property
     def meta(self):
         """
@@ -152,47 +287,117 @@ class HSDS:
             Site meta data for give HSDS file
         """
         if self._meta is None:
-            self._meta = pd.DataFrame(self._h5d['meta'][...])
+            def load():
+                meta = instrument.full_read('meta', self._h5d['meta'])
+                if meta.dtype.hasobject:
+                    # Variable length strings can't be memory-mapped
+                    return pd.DataFrame(meta)
+
+                # Drop h5py dtype metadata, which .npy files can't store
+                dtype = [(name, meta.dtype[name].str)
+                         for name in meta.dtype.names]
+                return meta.astype(dtype)
+
+            self._meta = pd.DataFrame(self.cached('meta', load))
 
         return self._meta
 
+    @property
+    def meta_store(self):
+        """
+        Returns
+        -------
+        _meta_store : MetaStore
+            Columnar meta data, each column is read with a field-only read
+            and decoded once on first use
+        """
+        if self._meta_store is None:
+            ds = self._h5d['meta']
+
+            def read_fields(fields):
+                if self._meta is not None:
+                    return self._meta[list(fields)]
+
+                return instrument.full_read('meta', ds, fields=fields)
+
+            self._meta_store = MetaStore(read_fields, ds.dtype.names,
+                                         cached=self.cached)
+
+        return self._meta_store
+
     @property
     def tree(self):
         """
         Returns
         -------
-        _tree : cKDTree
-            KDTree on site coordinates (latitude, longitude)
+        _tree : SiteIndex
+            Great-circle index of the site coordinates (latitude, longitude)
         """
         if self._tree is None:
-            # Prefer explicit coordinates dataset; fall back to meta lat/lon
-            try:
-                site_coords = self._h5d['coordinates'][...]
-            except Exception:
-                meta = pd.DataFrame(self._h5d['meta'][...])
-                site_coords = meta[['latitude', 'longitude']].values
+            def build():
+                # Prefer explicit coordinates dataset; fall back to meta
+                # lat/lon
+                if 'coordinates' in self._h5d:
+                    site_coords = instrument.full_read(
+                        'coordinates', self._h5d['coordinates'])
+                else:
+                    site_coords = self.meta_store.coordinates
 
-            self._tree = cKDTree(site_coords)
+                return SiteIndex(site_coords)
+
+            self._tree = self.cached('site_index', build)
 
         return self._tree
 
+    @property
+    def regions(self):
+        """
+        Returns
+        -------
+        _regions : RegionMasks
+            Region masks (CONUS, state, county, ...) computed once from meta
+        """
+        if self._regions is None:
+            self._regions = RegionMasks(self.meta_store)
+
+        return self._regions
+
+    @property
+    def wtk_grid(self):
+        """
+        Returns
+        -------
+        _wtk_grid : WTKGrid
+            Projection and origin of a gridded WTK file, read once
+        """
+        if self._wtk_grid is None:
+            self._wtk_grid = WTKGrid(self._h5d)
+
+        return self._wtk_grid
+
+    @instrument.operation
     def preload(self):
         """
-        Preload time_index, meta, and tree
+        Preload time_index, meta coordinates and timezones, and tree
         """
-        time_index = self._h5d['time_index'][...].astype(str)
-        # Store UTC-aware timestamps
-        self._time_index = pd.to_datetime(time_index, utc=True)
-        # Prefer explicit coordinates dataset; fall back to meta lat/lon
-        try:
-            site_coords = self._h5d['coordinates'][...]
-        except Exception:
-            meta = pd.DataFrame(self._h5d['meta'][...])
-            site_coords = meta[['latitude', 'longitude']].values
+        _ = self.time_index
+        _ = self.meta_store.coordinates
+        if 'timezone' in self.meta_store.names:
+            _ = self.meta_store.column('timezone')
+
+        _ = self.tree
 
-        self._tree = cKDTree(site_coords)
+    def __enter__(self):
+        return self
 
-        self._meta = pd.DataFrame(self._h5d['meta'][...])
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close the underlying file
+        """
+        self._h5d.close()
 
     def _nearest_site(self, coords):
         """
@@ -212,6 +417,24 @@ class HSDS:
         _, site_idx = self.tree.query(lat_lon)
         return site_idx
 
+    def _nearest_sites(self, coords):
+        """
+        Find the nearest sites to many (lat, lon) coordinates at once
+
+        Parameters
+        ----------
+        coords : ndarray | list
+            (n, 2) array of (lat, lon) coordinates of interest
+
+        Returns
+        -------
+        site_idx : ndarray
+            Site index in the datasets for each coordinate
+        """
+        lat_lon = np.atleast_2d(np.asarray(coords, dtype=float))
+        _, site_idx = self.tree.query(lat_lon)
+        return site_idx
+
     def _nearest_timestep(self, timestep):
         """
         Find the nearest timestep to timestep of interest
@@ -226,19 +449,9 @@ class HSDS:
         time_idx : int
             Time index in the datasets
         """
-        # Ensure the incoming timestep has the same tz-awareness as the
-        # stored time_index. If the provided timestep is tz-naive, treat it
-        # as UTC and localize to UTC so arithmetic works consistently. If
-        # it's tz-aware, convert it to UTC to match the stored index.
-        if (not hasattr(timestep, 'tzinfo')
-                or getattr(timestep, 'tzinfo') is None):
-            # pd.to_datetime will produce a tz-naive Timestamp; localize to UTC
-            ts = pd.to_datetime(timestep, utc=True)
-        else:
-            ts = pd.to_datetime(timestep).tz_convert('UTC')
-
-        delta = np.abs(self.time_index - ts)
-        time_idx = delta.argmin()
+        # tz-naive timesteps are treated as UTC, tz-aware timesteps are
+        # converted to UTC to match the stored index
+        time_idx = self.time_lookup.nearest(timestep)
 
         return time_idx
 
@@ -255,17 +468,10 @@ class HSDS:
 
         Returns
         -------
-        region_idx : list
-            Indices of all sites corresponding to region of interest
+        region_idx : ndarray
+            Sorted indices of all sites corresponding to region of interest
         """
-        if column in self.meta:
-            col_data = self.meta[column].str.decode('utf-8')
-            region_idx = self.meta.index[col_data == value].values
-        else:
-            raise ValueError('{} is not a valid column in meta'
-                             .format(column))
-
-        return region_idx
+        return self.regions.region(value, column=column)
 
     def _get_conus_idx(self):
         """
@@ -273,17 +479,76 @@ class HSDS:
 
         Returns
         -------
-        conus_idx : list
-            Indices of all sites in CONUS
+        conus_idx : ndarray
+            Sorted indices of all sites in CONUS
+        """
+        return self.regions.conus
+
+    def find_sites(self, **filters):
+        """
+        Find sites matching meta data filters, resolved by intersecting the
+        inverted indexes of each column
+
+        Parameters
+        ----------
+        filters : dict
+            {column: value or list of values}, e.g.
+            find_sites(state='Colorado', county=['Boulder', 'Denver'])
+
+        Returns
+        -------
+        site_idx : ndarray
+            Sorted indices of all matching sites
         """
-        country_data = self.meta['country'].str.decode('utf-8')
-        us_idx = country_data == 'United States'
-        state_data = self.meta.loc[us_idx, 'state'].str.decode('utf-8')
-        conus_idx = state_data.isin(['Alaska', 'Hawaii', 'AK', 'HI', 'None'])
-        conus_idx = state_data.index[~conus_idx].values
+        return self.meta_store.select(**filters)
 
-        return conus_idx
+    def polygon_sites(self, geometry):
+        """
+        Find sites inside a polygon
 
+        Parameters
+        ----------
+        geometry : dict | object
+            GeoJSON-like polygon geometry in lon/lat, or any object with
+            __geo_interface__ such as a shapely geometry or GeoDataFrame
+
+        Returns
+        -------
+        site_idx : ndarray
+            Sorted indices of all sites inside the polygon
+        """
+        return site_cells(self.meta_store.frame(['latitude', 'longitude']),
+                          geometry)
+
+    @instrument.operation
+    def extract_polygon(self, variables, geometry, time_slice=slice(None)):
+        """
+        Extract variables for all sites inside a polygon. Only the
+        chunk-aligned site runs that intersect the polygon are read.
+
+        Parameters
+        ----------
+        variables : list
+            Variables to extract, duplicates are ignored
+        geometry : dict | object
+            Polygon geometry in lon/lat, see polygon_sites
+        time_slice : slice
+            Selection along the time axis
+
+        Returns
+        -------
+        cells : SparseCells
+            Raw (time, sites) values per variable, indexed by site
+        """
+        site_idx = self.polygon_sites(geometry)
+        cells = SparseCells(site_idx)
+        for variable in dict.fromkeys(variables):
+            cells.data[variable] = self._read(variable,
+                                              (time_slice, site_idx))
+
+        return cells
+
+    @instrument.operation
     def get_timeseries(self, variable, coords, local=True):
         """
         Extract time-series data for the given variable at the given
@@ -306,18 +571,359 @@ class HSDS:
         site_idx = self._nearest_site(coords)
         time_index = self.time_index.copy()
         if local:
-            utc_dt = self.meta.iloc[site_idx]['timezone']
+            utc_dt = self.meta_store.column('timezone')[site_idx]
             utc_dt = pd.Timedelta('{}h'.format(utc_dt))
             time_index += utc_dt
 
         ds = self._h5d[variable]
-        ts = ds[:, site_idx] / ds.attrs.get('scale_factor', 1)
+        ts = self._read(variable, (slice(None), site_idx))
+        ts = ts / ds.attrs.get('scale_factor', 1)
         ts = pd.DataFrame({variable: ts, 'Datetime': time_index,
                            'Date': time_index.date, 'Month': time_index.month,
                            'Day': time_index.day, 'Hour': time_index.hour})
 
         return ts
 
+    def _read(self, variable, selection, out=None):
+        """
+        Read selection from variable with chunk-aligned, coalesced requests
+
+        Parameters
+        ----------
+        variable : str
+            Dataset to read from
+        selection : tuple
+            Selection along each axis of the dataset
+        out : ndarray, optional
+            Preallocated output array
+
+        Returns
+        -------
+        data : ndarray
+            Raw (scaled) data for the selection
+        """
+        return instrument.planned_read(variable, self.dataset(variable),
+                                       selection, out=out,
+                                       cache=self._chunk_cache)
+
+    def plan_read(self, variable, selection):
+        """
+        Dry run of a read: report what reading selection from variable
+        would cost without transferring any data
+
+        Parameters
+        ----------
+        variable : str
+            Dataset to read from
+        selection : tuple
+            Selection along each axis of the dataset
+
+        Returns
+        -------
+        summary : dict
+            Number of requests, chunks touched and bytes transferred
+        """
+        return read_planner.read(self._h5d[variable], selection,
+                                 dry_run=True)
+
+    @instrument.operation
+    def get_timeseries_batch(self, variables, coords, long=False,
+                             return_gids=False):
+        """
+        Extract time-series data for many variables at many coordinates.
+        Coordinates are resolved with a single site index query, duplicate
+        sites are dropped and reads are coalesced by the read planner so
+        that neighbouring sites share a single request.
+
+        Parameters
+        ----------
+        variables : str | list
+            Variable(s) to extract time-series for
+        coords : ndarray | list
+            (n, 2) array of (lat, lon) coordinates of interest
+        long : bool
+            Return a long (tidy) DataFrame with one row per
+            (time, site) instead of a wide DataFrame
+        return_gids : bool
+            Also return the gid of each coordinate, as the columns only hold
+            the unique sites
+
+        Returns
+        -------
+        ts : pd.DataFrame
+            Wide DataFrame indexed by time with (variable, gid) columns, or
+            long DataFrame with 'Datetime', 'gid' and one column per variable
+        gids : ndarray
+            Site gid of each coordinate, in the order of coords, if
+            return_gids
+        """
+        if isinstance(variables, str):
+            variables = [variables]
+
+        gids = np.asarray(self._nearest_sites(coords))
+        site_idx = np.unique(gids)
+        time_index = self.time_index
+
+        data = {}
+        for variable in variables:
+            ds = self._h5d[variable]
+            out = self._read(variable, (slice(None), site_idx))
+            data[variable] = out / np.float32(ds.attrs.get('scale_factor', 1))
+
+        columns = pd.MultiIndex.from_product([variables, site_idx],
+                                             names=['variable', 'gid'])
+        ts = pd.DataFrame(np.hstack([data[v] for v in variables]),
+                          index=time_index, columns=columns)
+        ts.index.name = 'Datetime'
+        if long:
+            ts = ts.stack('gid', future_stack=True).reset_index()
+            ts.columns.name = None
+
+        if return_gids:
+            return ts, gids
+
+        return ts
+
+    @instrument.operation
+    def get_interpolated_timeseries(self, variables, coords, k=4, power=2,
+                                    max_distance=None):
+        """
+        Extract inverse distance weighted time-series at many coordinates
+        from their k nearest sites. The neighbours of all coordinates are
+        read together with one coalesced read per variable.
+
+        Parameters
+        ----------
+        variables : str | list
+            Variable(s) to extract time-series for
+        coords : ndarray | list
+            (n, 2) array of (lat, lon) coordinates of interest
+        k : int
+            Number of neighbouring sites per coordinate
+        power : float
+            Power of the inverse distance
+        max_distance : float, optional
+            Ignore sites further than this in km, coordinates without any
+            site in range are NaN
+
+        Returns
+        -------
+        ts : pd.DataFrame
+            float32 DataFrame indexed by time with (variable, point)
+            columns, point being the position in coords
+        """
+        if isinstance(variables, str):
+            variables = [variables]
+
+        site_idx, weights = self.tree.neighbours(coords, k=k, power=power,
+                                                 max_distance=max_distance)
+        sites, pos = np.unique(site_idx, return_inverse=True)
+        pos = pos.reshape(site_idx.shape)
+        weights = weights.astype(np.float32)
+
+        data = []
+        for variable in variables:
+            ds = self._h5d[variable]
+            out = self._read(variable, (slice(None), sites))
+            out = out / np.float32(ds.attrs.get('scale_factor', 1))
+            # Accumulate one neighbour rank at a time to avoid a
+            # (time, points, k) intermediate
+            ts = out[:, pos[:, 0]] * weights[:, 0]
+            for j in range(1, k):
+                ts += out[:, pos[:, j]] * weights[:, j]
+
+            data.append(ts)
+
+        columns = pd.MultiIndex.from_product([variables,
+                                              np.arange(len(site_idx))],
+                                             names=['variable', 'point'])
+        ts = pd.DataFrame(np.hstack(data), index=self.time_index,
+                          columns=columns)
+        ts.index.name = 'Datetime'
+
+        return ts
+
+    @classmethod
+    def _reduce_file(cls, hsds_path, variable, sites, reduce, **kwargs):
+        """
+        Read variable for sites from a single file and reduce it
+        """
+        with cls(hsds_path, **kwargs) as f:
+            ds = f._h5d[variable]
+            data = f._read(variable, (slice(None), sites))
+            data = data / np.float32(ds.attrs.get('scale_factor', 1))
+
+        return reduce(data)
+
+    @classmethod
+    def multi_year(cls, path_template, years, variable, sites=slice(None),
+                   reduce=None, max_workers=4, **kwargs):
+        """
+        Extract and reduce variable from many per-year files concurrently.
+        At most max_workers years are read at once and each year is reduced
+        before the next one is admitted, so memory stays bounded by
+        max_workers years of data for sites.
+
+        Parameters
+        ----------
+        path_template : str
+            Path to the per-year files with a {} placeholder for the year,
+            e.g. '/nrel/nsrdb/GOES/aggregated/v4.0.0/nsrdb_{}.h5'
+        years : list
+            Years to extract
+        variable : str
+            Variable to extract
+        sites : slice | list | ndarray
+            Sites to extract, defaults to all sites
+        reduce : callable, optional
+            Function applied to each year's (time, sites) array, defaults
+            to the mean over time
+        max_workers : int
+            Number of years read concurrently
+        kwargs : dict
+            Additional arguments passed to HSDS, e.g. cache
+
+        Yields
+        ------
+        year : int
+            Year that finished
+        result : object
+            Output of reduce for that year, in order of completion
+        """
+        if reduce is None:
+            def reduce(data):
+                return data.mean(axis=0)
+
+        years = iter(years)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            running = {}
+            for year in years:
+                path = path_template.format(year)
+                future = pool.submit(cls._reduce_file, path, variable,
+                                     sites, reduce, **kwargs)
+                running[future] = year
+                if len(running) >= max_workers:
+                    break
+
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    year = running.pop(future)
+                    next_year = next(years, None)
+                    if next_year is not None:
+                        path = path_template.format(next_year)
+                        new = pool.submit(cls._reduce_file, path, variable,
+                                          sites, reduce, **kwargs)
+                        running[new] = next_year
+
+                    yield year, future.result()
+
+    def iter_slabs(self, variable, sites=slice(None), slab_size=None):
+        """
+        Iterate over chunk-aligned time slabs of variable for sites
+
+        Parameters
+        ----------
+        variable : str
+            Variable to extract
+        sites : slice | list | ndarray
+            Sites to extract, defaults to all sites
+        slab_size : int, optional
+            Number of timesteps per slab, defaults to the time chunk size
+
+        Yields
+        ------
+        time_slice : slice
+            Position of the slab along the time axis
+        slab : ndarray
+            (time, sites) float32 array of unscaled values
+        """
+        ds = self._h5d[variable]
+        if slab_size is None:
+            slab_size = ds.chunks[0] if ds.chunks is not None else ds.shape[0]
+
+        sf = np.float32(ds.attrs.get('scale_factor', 1))
+        for start in range(0, ds.shape[0], slab_size):
+            time_slice = slice(start, min(start + slab_size, ds.shape[0]))
+            slab = self._read(variable, (time_slice, sites))
+            yield time_slice, slab.astype(np.float32) / sf
+
+    @instrument.operation
+    def stream_stats(self, variable, sites=slice(None), quantiles=None,
+                     bins=None, groupby=None, slab_size=None):
+        """
+        Compute statistics of variable for sites one time slab at a time,
+        peak memory is bounded by a single slab
+
+        Parameters
+        ----------
+        variable : str
+            Variable to extract
+        sites : slice | list | ndarray
+            Sites to extract, defaults to all sites
+        quantiles : list, optional
+            Quantiles to estimate with the P-squared algorithm
+        bins : ndarray, optional
+            Histogram bin edges
+        groupby : str, optional
+            'month' or 'hour' to also compute per group statistics
+        slab_size : int, optional
+            Number of timesteps per slab, defaults to the time chunk size
+
+        Returns
+        -------
+        out : dict
+            'stats' : DataFrame of count, mean, std, min and max per site,
+            'quantiles' : DataFrame of quantiles per site,
+            'histogram' : DataFrame of counts per site and bin,
+            'groups' : DataFrame of stats per (group, site)
+        """
+        ds = self._h5d[variable]
+        gids = np.arange(ds.shape[1])[sites]
+        n_sites = len(gids)
+
+        stats = RunningStats(n_sites)
+        qs = [P2Quantile(n_sites, q) for q in (quantiles or [])]
+        hist = StreamingHistogram(n_sites, bins) if bins is not None else None
+        grouped = None
+        if groupby is not None:
+            labels = getattr(self.time_index, groupby)
+            grouped = GroupedStats(n_sites, labels)
+
+        for time_slice, slab in self.iter_slabs(variable, sites=sites,
+                                                slab_size=slab_size):
+            stats.update(slab)
+            for q in qs:
+                q.update(slab)
+
+            if hist is not None:
+                hist.update(slab)
+
+            if grouped is not None:
+                grouped.update(slab, time_slice)
+
+        def frame(rs):
+            return pd.DataFrame({'count': rs.count, 'mean': rs.mean,
+                                 'std': rs.std, 'min': rs.min, 'max': rs.max},
+                                index=pd.Index(gids, name='gid'))
+
+        out = {'stats': frame(stats)}
+        if qs:
+            out['quantiles'] = pd.DataFrame({q.q: q.value for q in qs},
+                                            index=pd.Index(gids, name='gid'))
+
+        if hist is not None:
+            columns = pd.IntervalIndex.from_breaks(hist.edges, closed='left')
+            out['histogram'] = pd.DataFrame(hist.counts, columns=columns,
+                                            index=pd.Index(gids, name='gid'))
+
+        if grouped is not None:
+            out['groups'] = pd.concat({label: frame(rs) for label, rs
+                                       in grouped.groups.items()},
+                                      names=[groupby])
+
+        return out
+
     @staticmethod
     def create_boxplots(df, variable, dpi=100, figsize=(12, 4)):
         """
@@ -338,9 +944,11 @@ class HSDS:
         fig.tight_layout()
         plt.show()
 
-    def get_timestep(self, variable, timestep):
+    @instrument.operation
+    def get_timestep(self, variable, timestep, region=None, column='state'):
         """
-        Extract a days worth of data for the given day for CONUS
+        Extract a single timestep of data for CONUS or a given region. Only
+        the site ranges covered by the region are read from the server.
 
         Parameters
         ----------
@@ -348,22 +956,26 @@ class HSDS:
             Variable to extract time-series for
         timestep : str
             Datetimestep to extract
-        local : bool
-            Shift time-series to local time
+        region : str, optional
+            Region to extract, defaults to CONUS
+        column : str
+            Column in the meta data to filter region on
 
         Returns
         -------
         day : pd.DataFrame
 
         """
-        conus_idx = self._get_conus_idx()
+        if region is None:
+            site_idx = self._get_conus_idx()
+        else:
+            site_idx = self._get_region_idx(region, column=column)
+
         time_idx = self._nearest_timestep(pd.to_datetime(timestep))
-        meta = self.meta.iloc[conus_idx]
-        lon = meta['longitude'].values
-        lat = meta['latitude'].values
+        lat, lon = self.meta_store.coordinates[site_idx].T
         ds = self._h5d[variable]
         sf = ds.attrs.get('scale_factor', 1)
-        data = self._h5d[variable][time_idx][conus_idx] / sf
+        data = self._read(variable, (time_idx, site_idx)) / sf
 
         df = pd.DataFrame({'longitude': lon, 'latitude': lat, variable: data})
 
@@ -371,7 +983,8 @@ class HSDS:
 
     @staticmethod
     def create_scatter(df, variable, cbar_label=None, title=None,
-                       cmap='Rainbow', dpi=100, figsize=(8, 4)):
+                       cmap='rainbow', dpi=100, figsize=(8, 4), raster=None,
+                       how='mean'):
         """
         Create scatter plot from lon, lat, and data and save to f_out
 
@@ -389,6 +1002,12 @@ class HSDS:
             plot resolution
         figsize : tuple
             Figure size
+        raster : bool | tuple, optional
+            Aggregate sites onto a raster image instead of drawing one
+            marker per site, True for the default (rows, cols) resolution
+        how : str
+            Per-pixel aggregation for raster plots: 'mean', 'max', 'min',
+            'sum' or 'count'
         """
         fig = plt.figure(figsize=figsize, dpi=dpi)
         if title is not None:
@@ -402,13 +1021,189 @@ class HSDS:
             cbar_label = variable
         vmax = np.max(data)
 
-        sc = ax.scatter(lon, lat, c=data, cmap=cmap, vmin=0, vmax=vmax)
+        if raster:
+            grid = pixel_grid(lon, lat, shape=raster_shape(raster))
+            sc = raster_imshow(ax, grid, data, how=how, cmap=cmap, vmin=0,
+                               vmax=vmax)
+        else:
+            sc = ax.scatter(lon, lat, c=data, cmap=cmap, vmin=0, vmax=vmax)
+
         cbar = plt.colorbar(sc)
         cbar.ax.set_ylabel(cbar_label, rotation=90)
         ax.axis('off')
         fig.tight_layout()
         plt.show()
 
+    def read_unscaled(self, variable, time_slice, site_idx,
+                      max_bytes=2**24, out=None):
+        """
+        Read (time, sites) data into a preallocated float32 array, decoding
+        the scale factor batch by batch. Sites are read in chunk-aligned
+        batches of about max_bytes of raw data, so peak memory is the output
+        plus one batch.
+
+        Parameters
+        ----------
+        variable : str
+            Variable to extract
+        time_slice : slice
+            Selection along the time axis
+        site_idx : ndarray
+            Sorted site indices
+        max_bytes : int
+            Raw bytes to read per batch
+        out : ndarray, optional
+            Preallocated float32 (time, sites) output, e.g. a view of a
+            shared memory array
+
+        Returns
+        -------
+        data : ndarray
+            (time, sites) float32 array of unscaled values
+        """
+        ds = self._h5d[variable]
+        n_time = len(range(*time_slice.indices(ds.shape[0])))
+        if out is None:
+            out = np.empty((n_time, len(site_idx)), dtype=np.float32)
+
+        if not n_time or not len(site_idx):
+            return out
+
+        chunk = ds.chunks[1] if ds.chunks is not None else ds.shape[1]
+        per_chunk = max(n_time * chunk * ds.dtype.itemsize, 1)
+        batch = max(max_bytes // per_chunk, 1) * chunk
+        # Positions where site_idx crosses into the next batch of chunks
+        keys = site_idx // batch
+        bounds = np.concatenate(([0], np.where(np.diff(keys))[0] + 1,
+                                 [len(site_idx)]))
+        sf = np.float32(ds.attrs.get('scale_factor', 1))
+        for i0, i1 in zip(bounds[:-1], bounds[1:]):
+            raw = self._read(variable, (time_slice, site_idx[i0:i1]))
+            np.divide(raw, sf, out=out[:, i0:i1], casting='unsafe')
+
+        return out
+
+    def read_cells(self, variable, i, j, time_slice=slice(None)):
+        """
+        Read (i, j) cells of a gridded (time, rows, cols) WTK variable,
+        fetching only the chunk-aligned tiles that contain cells
+
+        Parameters
+        ----------
+        variable : str
+            Variable to extract
+        i : ndarray
+            Row indices of the cells
+        j : ndarray
+            Column indices of the cells
+        time_slice : slice
+            Selection along the time axis
+
+        Returns
+        -------
+        data : ndarray
+            (time, cells) float32 array of unscaled values
+        """
+        ds = self._h5d[variable]
+        data = read_cells(self.dataset(variable), i, j, time_slice=time_slice)
+
+        return data / np.float32(ds.attrs.get('scale_factor', 1))
+
+    @instrument.operation
+    def get_window(self, variable, start, end, sites=None, local=False,
+                   max_bytes=2**24):
+        """
+        Extract all timesteps between start and end (inclusive) for sites
+
+        Parameters
+        ----------
+        variable : str
+            Variable to extract
+        start : str | datetime
+            First timestamp of interest
+        end : str | datetime
+            Last timestamp of interest (inclusive)
+        sites : ndarray, optional
+            Sorted site indices, defaults to CONUS
+        local : bool
+            Interpret tz-naive start and end, and label the output, in local
+            time using the sites' mean UTC offset
+        max_bytes : int
+            Raw bytes to read per batch of sites
+
+        Returns
+        -------
+        window : pd.DataFrame
+            float32 (time, sites) DataFrame indexed by timestamp with site
+            indices as columns
+        """
+        if sites is None:
+            sites = self._get_conus_idx()
+
+        utc_dt = pd.Timedelta(0)
+        if local:
+            utc_dt = self.meta_store.column('timezone')[sites].mean()
+            utc_dt = pd.Timedelta('{}h'.format(utc_dt))
+
+        # Shift the window to UTC rather than shifting the shared time index,
+        # tz-aware timestamps are already absolute
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        if start.tzinfo is None:
+            start -= utc_dt
+
+        if end.tzinfo is None:
+            end -= utc_dt
+
+        time_slice = self.time_lookup.slice(start, end)
+        data = self.read_unscaled(variable, time_slice, sites,
+                                  max_bytes=max_bytes)
+        index = self.time_index[time_slice] + utc_dt
+        window = pd.DataFrame(data, index=index.rename('Datetime'),
+                              columns=sites, copy=False)
+
+        return window
+
+    @instrument.operation
+    def get_hub_height(self, variable, hub_height, sites,
+                       time_slice=slice(None), method='linear'):
+        """
+        Extract a WTK variable at arbitrary hub heights. Only the two levels
+        bracketing each site's hub height are read, and sites sharing a
+        level are read together.
+
+        Parameters
+        ----------
+        variable : str
+            Variable prefix, e.g. 'windspeed', 'winddirection' or
+            'temperature'
+        hub_height : float | list
+            Hub height in meters, one for all sites or one per site
+        sites : ndarray | list
+            Site indices
+        time_slice : slice
+            Selection along the time axis
+        method : str
+            Wind speed interpolation: 'linear' or 'power' (shear) law,
+            directions are interpolated along the shorter arc
+
+        Returns
+        -------
+        data : pd.DataFrame
+            float32 (time, sites) DataFrame indexed by timestamp with site
+            indices as columns
+        """
+        sites = np.asarray(sites)
+
+        def read(name, site_idx):
+            return self.read_unscaled(name, time_slice, site_idx)
+
+        data = vertical.interpolate(read, self._h5d, variable, hub_height,
+                                    sites, method=method)
+        index = self.time_index[time_slice].rename('Datetime')
+
+        return pd.DataFrame(data, index=index, columns=sites, copy=False)
+
+    @instrument.operation
     def get_day(self, variable, date, local=True):
         """
         Extract a days worth of data for the given day for CONUS
@@ -425,27 +1220,18 @@ class HSDS:
         Returns
         -------
         day : pd.DataFrame
-
+            float32 (time, sites) DataFrame indexed by timestamp with CONUS
+            site indices as columns
         """
-        conus_idx = self._get_conus_idx()
-        time_index = self.time_index
-        if local:
-            utc_dt = self.meta.iloc[conus_idx]['timezone'].mean()
-            utc_dt = pd.Timedelta('{}h'.format(utc_dt))
-            time_index += utc_dt
-
-        date = pd.to_datetime(date).date()
-        time_idx = np.where(time_index.date == date)[0]
-        time_slice = slice(time_idx[0], time_idx[-1] + 1)
-
-        day_df = pd.DataFrame(self._h5d[variable][time_slice][:, conus_idx],
-                              index=time_idx, columns=conus_idx)
+        date = pd.Timestamp(date).normalize()
+        end = date + pd.Timedelta(1, 'D') - pd.Timedelta(1, 'ns')
 
-        return day_df
+        return self.get_window(variable, date, end, local=local)
 
     @staticmethod
     def create_map(lon, lat, data, cbar_label, f_out=None, vmax=None,
-                   title=None, cmap='Rainbow', dpi=100, figsize=(8, 4)):
+                   title=None, cmap='rainbow', dpi=100, figsize=(8, 4),
+                   raster=None, how='mean'):
         """
         Create scatter plot from lon, lat, and data and save to f_out
 
@@ -467,6 +1253,12 @@ class HSDS:
             plot resolution
         figsize : tuple
             Figure size
+        raster : bool | tuple, optional
+            Aggregate sites onto a raster image instead of drawing one
+            marker per site, True for the default (rows, cols) resolution
+        how : str
+            Per-pixel aggregation for raster plots: 'mean', 'max', 'min',
+            'sum' or 'count'
         """
         fig = plt.figure(figsize=figsize, dpi=dpi)
         if title is not None:
@@ -476,8 +1268,13 @@ class HSDS:
         if vmax is None:
             vmax = np.max(data)
 
-        sc = ax.scatter(lon, lat, c=data, cmap=cmap, s=10,
-                        vmin=0, vmax=vmax)
+        if raster:
+            grid = pixel_grid(lon, lat, shape=raster_shape(raster))
+            sc = raster_imshow(ax, grid, data, how=how, cmap=cmap, vmin=0,
+                               vmax=vmax)
+        else:
+            sc = ax.scatter(lon, lat, c=data, cmap=cmap, s=10,
+                            vmin=0, vmax=vmax)
         cbar = plt.colorbar(sc)
         cbar.ax.set_ylabel(cbar_label, rotation=90)
         ax.axis('off')
@@ -489,12 +1286,44 @@ class HSDS:
             plt.show()
 
     @staticmethod
-    def creat_gif(fig_dir, file_prefix):
+    def creat_gif(fig_dir, file_prefix, f_out=None, fps=4):
         """
-        Create gif from all files in
+        Create gif from all files in fig_dir starting with file_prefix
+
+        Parameters
+        ----------
+        fig_dir : str
+            Directory containing the frame images
+        file_prefix : str
+            Prefix of the frame files, frames are ordered by file name
+        f_out : str, optional
+            File to save the gif to
+        fps : float
+            Frames per second
+
+        Returns
+        -------
+        gif : bytes
+            Encoded gif
         """
+        files = sorted(f for f in os.listdir(fig_dir)
+                       if f.startswith(file_prefix))
+        images = []
+        for f in files:
+            with Image.open(os.path.join(fig_dir, f)) as image:
+                images.append(np.asarray(image.convert('RGB')))
+
+        gif = animation.encode(images, fmt='gif', fps=fps)
+        if f_out is not None:
+            with open(f_out, 'wb') as f:
+                f.write(gif)
+
+        return gif
 
-    def create_nsrdb_gif(self, date, variable='dni'):
+    @instrument.operation
+    def create_nsrdb_gif(self, date, variable='dni', f_out=None, fmt='gif',
+                         fps=4, max_workers=None, dpi=100, figsize=(8, 4),
+                         raster=None):
         """
         Extract, plot, and create gif for given NSRDB date and variable
 
@@ -504,19 +1333,38 @@ class HSDS:
             Date to extract
         variable : str
             Variable to extract
+        f_out : str, optional
+            File to save the animation to
+        fmt : str
+            'gif' or 'mp4'
+        fps : float
+            Frames per second
+        max_workers : int, optional
+            Number of rendering processes, defaults to the number of CPUs
+        dpi : int
+            plot resolution
+        figsize : tuple
+            Figure size
+        raster : bool | tuple, optional
+            Draw frames as raster images of per-pixel means instead of one
+            marker per site, True for the default (rows, cols) resolution
+
+        Returns
+        -------
+        animation : bytes
+            Encoded animation
         """
         day_df = self.get_day(variable, date)
         label = '{} W/m^2'.format(variable)
-        vmax = np.max(day_df.values)
-        meta = self.meta.iloc[day_df.columns]
-        lon = meta['longitude'].values
-        lat = meta['latitude'].values
-        fig_dir = '../bin/gifs'
-        if not os.path.exists(fig_dir):
-            os.makedirs(fig_dir)
-
-        for i in len(day_df):
-            data = day_df.iloc[i]
-            f_out = os.path.join(fig_dir, 'nsrdb_{:03d}.png'.format(i))
-            self.create_map(lon, lat, data, label, f_out, vmax=vmax,
-                            cmap='YlOrRd')
+        lat, lon = self.meta_store.coordinates[day_df.columns.values].T
+        titles = [str(ts)[:16] for ts in day_df.index.tz_localize(None)]
+        images = animation.render_frames(lon, lat,
+                                         day_df.values, label, titles=titles,
+                                         max_workers=max_workers, dpi=dpi,
+                                         figsize=figsize, raster=raster)
+        movie = animation.encode(images, fmt=fmt, fps=fps)
+        if f_out is not None:
+            with open(f_out, 'wb') as f:
+                f.write(movie)
+
+        return movie
@@ -0,0 +1,385 @@
+"""
+Request-level instrumentation of HSDS dataset reads
+
+Every dataset read made by HSDS is reported as a ReadEvent to the registered
+hooks: the HSDS method it belongs to, the variable, output shape, bytes
+returned, requests issued, chunks touched, wall time and chunk cache hits.
+Events also record the extent of the selection along each axis, so a saved
+trace doubles as an access log for replaying or simulating a workload.
+With no hooks registered a read costs one list check, and with hooks the
+extra work is one read plan summary, so tracing can stay on in production.
+
+    with instrument.trace() as t:
+        res.get_timeseries('ghi', (39.7, -105.2))
+
+    print(t.report())
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import read_planner
+
+_HOOKS = []
+# Outermost HSDS method being executed in the current thread / task
+_OPERATION = ContextVar('hsds_operation', default=None)
+
+
+class ReadEvent:
+    """
+    One dataset read
+    """
+    __slots__ = ('operation', 'variable', 'shape', 'nbytes', 'requests',
+                 'chunks', 'transfer_bytes', 'seconds', 'cache_hits',
+                 'cache_misses', 'extent', 'timestamp')
+
+    def __init__(self, operation, variable, shape, nbytes, requests, chunks,
+                 transfer_bytes, seconds, cache_hits=0, cache_misses=0,
+                 extent=None):
+        """
+        Parameters
+        ----------
+        operation : str | None
+            HSDS method that issued the read
+        variable : str
+            Dataset read
+        shape : tuple
+            Shape of the returned array
+        nbytes : int
+            Bytes returned
+        requests : int
+            Number of requests issued
+        chunks : int
+            Number of chunks touched
+        transfer_bytes : int
+            Bytes transferred, including over-read within requests
+        seconds : float
+            Wall time of the read
+        cache_hits : int
+            Chunks served from the chunk cache
+        cache_misses : int
+            Chunks fetched from the source
+        extent : tuple, optional
+            (start, stop, count) of the selection along each dataset axis
+        """
+        self.operation = operation
+        self.variable = variable
+        self.shape = shape
+        self.nbytes = nbytes
+        self.requests = requests
+        self.chunks = chunks
+        self.transfer_bytes = transfer_bytes
+        self.seconds = seconds
+        self.cache_hits = cache_hits
+        self.cache_misses = cache_misses
+        self.extent = extent
+        self.timestamp = time.time()
+
+    def __repr__(self):
+        return ('ReadEvent({}, {}, shape={}, {:.1f} kB, {} requests, '
+                '{:.4f} s)'.format(self.operation, self.variable, self.shape,
+                                   self.nbytes / 1024, self.requests,
+                                   self.seconds))
+
+    def to_dict(self):
+        """
+        Returns
+        -------
+        dict
+        """
+        return {attr: getattr(self, attr) for attr in self.__slots__}
+
+
+def add_hook(callback):
+    """
+    Register a callback that receives every ReadEvent
+
+    Parameters
+    ----------
+    callback : callable
+        Called with each ReadEvent, from the thread that made the read
+    """
+    _HOOKS.append(callback)
+
+
+def remove_hook(callback):
+    """
+    Unregister a callback registered with add_hook
+
+    Parameters
+    ----------
+    callback : callable
+        Registered callback
+    """
+    _HOOKS.remove(callback)
+
+
+def enabled():
+    """
+    Returns
+    -------
+    bool
+        True if any hook is registered
+    """
+    return bool(_HOOKS)
+
+
+def emit(event):
+    """
+    Send an event to all hooks
+    """
+    for hook in list(_HOOKS):
+        hook(event)
+
+
+def operation(func):
+    """
+    Decorator that labels the reads made by an HSDS method with its name.
+    Nested calls keep the label of the outermost method.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _OPERATION.get() is not None:
+            return func(*args, **kwargs)
+
+        token = _OPERATION.set(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _OPERATION.reset(token)
+
+    return wrapper
+
+
+def _cache_counts(cache):
+    """
+    Chunk cache (hits, misses) counters, zeros without a cache
+    """
+    if cache is None:
+        return 0, 0
+
+    return cache.hits + cache.disk_hits, cache.misses
+
+
+def planned_read(variable, ds, selection, out=None, cache=None):
+    """
+    Read a selection through the read planner, reporting a ReadEvent if any
+    hook is registered
+
+    Parameters
+    ----------
+    variable : str
+        Dataset name
+    ds : h5pyd.Dataset | CachedDataset
+        Dataset to read from
+    selection : tuple
+        Selection along each axis
+    out : ndarray, optional
+        Preallocated output array
+    cache : ChunkCache, optional
+        Chunk cache behind ds, used to count hits and misses. Counts are
+        approximate when other threads share the cache.
+
+    Returns
+    -------
+    ndarray
+    """
+    if not _HOOKS:
+        return read_planner.read(ds, selection, out=out)
+
+    hits, misses = _cache_counts(cache)
+    ts = time.perf_counter()
+    read_plan = read_planner.plan(ds, selection)
+    data = read_plan.execute(ds, out=out)
+    seconds = time.perf_counter() - ts
+    summary = read_plan.summary()
+    hits_after, misses_after = _cache_counts(cache)
+    emit(ReadEvent(_OPERATION.get(), variable, data.shape, data.nbytes,
+                   summary['requests'], summary['chunks'], summary['bytes'],
+                   seconds, cache_hits=hits_after - hits,
+                   cache_misses=misses_after - misses,
+                   extent=read_plan.extent))
+
+    return data
+
+
+def full_read(variable, ds, fields=None):
+    """
+    Read a whole (metadata) dataset, reporting a ReadEvent if any hook is
+    registered
+
+    Parameters
+    ----------
+    variable : str
+        Dataset name
+    ds : h5pyd.Dataset
+        Dataset to read
+    fields : list, optional
+        Read only these fields of a compound dataset
+
+    Returns
+    -------
+    ndarray
+    """
+    source = ds if fields is None else ds.fields(list(fields))
+    if not _HOOKS:
+        return source[...]
+
+    ts = time.perf_counter()
+    data = source[...]
+    seconds = time.perf_counter() - ts
+    chunks = ds.chunks or ds.shape
+    n_chunks = int(np.prod([-(-n // c) for n, c in zip(ds.shape, chunks)]))
+    emit(ReadEvent(_OPERATION.get() or 'metadata', variable, data.shape,
+                   data.nbytes, 1, n_chunks, data.nbytes, seconds,
+                   extent=tuple((0, n, n) for n in ds.shape)))
+
+    return data
+
+
+class Trace:
+    """
+    Collects ReadEvents and summarizes where read time is spent
+    """
+
+    def __init__(self, callback=None):
+        """
+        Parameters
+        ----------
+        callback : callable, optional
+            Also called with every event as it is recorded
+        """
+        self.events = []
+        self._callback = callback
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            self.events.append(event)
+
+        if self._callback is not None:
+            self._callback(event)
+
+    def to_frame(self):
+        """
+        Returns
+        -------
+        pd.DataFrame
+            One row per event
+        """
+        with self._lock:
+            events = list(self.events)
+
+        return pd.DataFrame([e.to_dict() for e in events],
+                            columns=list(ReadEvent.__slots__))
+
+    def save(self, path):
+        """
+        Write the events as JSON lines, e.g. as an access log for
+        benchmark/advisor.py
+
+        Parameters
+        ----------
+        path : str
+            Output file path
+        """
+        self.to_frame().to_json(path, orient='records', lines=True)
+
+    def summary(self, by=('operation', 'variable')):
+        """
+        Aggregate events, slowest groups first
+
+        Parameters
+        ----------
+        by : tuple
+            Event attributes to group on
+
+        Returns
+        -------
+        summary : pd.DataFrame
+            Reads, total / p50 / p95 seconds, MB returned and transferred,
+            requests, chunks and cache hit rate per group
+        """
+        df = self.to_frame()
+        by = list(by)
+        if df.empty:
+            return pd.DataFrame(columns=by)
+
+        df[by] = df[by].fillna('-')
+        grouped = df.groupby(by)
+        summary = grouped.agg(reads=('seconds', 'size'),
+                              seconds=('seconds', 'sum'),
+                              p50=('seconds', 'median'),
+                              p95=('seconds', lambda s: s.quantile(0.95)),
+                              mb=('nbytes', 'sum'),
+                              transfer_mb=('transfer_bytes', 'sum'),
+                              requests=('requests', 'sum'),
+                              chunks=('chunks', 'sum'),
+                              cache_hits=('cache_hits', 'sum'),
+                              cache_misses=('cache_misses', 'sum'))
+        summary[['mb', 'transfer_mb']] /= 1024 ** 2
+        lookups = summary['cache_hits'] + summary['cache_misses']
+        lookups = lookups.where(lookups > 0)
+        summary['hit_rate'] = summary['cache_hits'] / lookups
+        summary['share'] = summary['seconds'] / summary['seconds'].sum()
+
+        return summary.sort_values('seconds', ascending=False)
+
+    def report(self, by=('operation', 'variable')):
+        """
+        Text report of summary
+
+        Returns
+        -------
+        str
+        """
+        with pd.option_context('display.width', 160,
+                               'display.float_format', '{:.4f}'.format):
+            return self.summary(by=by).to_string()
+
+
+def load_events(path):
+    """
+    Load events written by Trace.save
+
+    Parameters
+    ----------
+    path : str
+        JSON lines file
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per event
+    """
+    return pd.read_json(path, orient='records', lines=True)
+
+
+@contextmanager
+def trace(callback=None):
+    """
+    Record every HSDS read made, from any thread, while the context is
+    active
+
+    Parameters
+    ----------
+    callback : callable, optional
+        Also called with every event as it is recorded
+
+    Yields
+    ------
+    Trace
+    """
+    tracer = Trace(callback=callback)
+    add_hook(tracer)
+    try:
+        yield tracer
+    finally:
+        remove_hook(tracer)
@@ -0,0 +1,236 @@
+"""
+Persistent on-disk cache for HSDS file artifacts (meta, time_index, site index)
+"""
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'hsds-examples')
+
+
+def file_version(h5_file):
+    """
+    Server-side version of an open h5pyd / h5py file, used to invalidate
+    cached artifacts when the file changes
+
+    Parameters
+    ----------
+    h5_file : h5pyd.File | h5py.File
+        Open file instance
+
+    Returns
+    -------
+    version : str
+        Last modified time of the domain or local file, 'remote' for other
+        files
+    """
+    modified = getattr(h5_file, 'modified', None)
+    if modified is None and os.path.isfile(h5_file.filename):
+        modified = os.path.getmtime(h5_file.filename)
+    elif modified is None:
+        # Remote files opened through s3fs or ros3 are published once and
+        # don't change
+        modified = 'remote'
+
+    return str(modified)
+
+
+def _hash(value):
+    """
+    Short, filesystem safe hash of a string
+    """
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()[:16]
+
+
+def _dir_size(path):
+    """
+    Total size in bytes of all files under path
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+
+    return size
+
+
+class MetaCache:
+    """
+    Local cache of per-file artifacts keyed by domain path and version.
+    Arrays are stored as .npy files (memory-mapped on load) and other objects
+    are pickled. Entries for older versions of a domain are removed when a
+    new version is stored, and least recently used entries are evicted once
+    the cache exceeds max_size.
+    """
+
+    def __init__(self, cache_dir=None, max_size=2 * 1024 ** 3):
+        """
+        Parameters
+        ----------
+        cache_dir : str, optional
+            Cache directory, defaults to $HSDS_CACHE_DIR or
+            ~/.cache/hsds-examples
+        max_size : int
+            Maximum size of the cache in bytes
+        """
+        if cache_dir is None:
+            cache_dir = os.environ.get('HSDS_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_dir(self, path, version):
+        """
+        Directory holding the artifacts of a given domain version
+        """
+        return os.path.join(self.cache_dir, _hash(path), _hash(version))
+
+    def load(self, path, version, name):
+        """
+        Load a cached artifact
+
+        Parameters
+        ----------
+        path : str
+            Domain path
+        version : str
+            Domain version, see file_version
+        name : str
+            Artifact name, e.g. 'meta', 'time_index', 'site_index'
+
+        Returns
+        -------
+        obj : ndarray | object | None
+            Cached artifact, None if not cached
+        """
+        entry = self._entry_dir(path, version)
+        npy = os.path.join(entry, name + '.npy')
+        pkl = os.path.join(entry, name + '.pkl')
+        if os.path.exists(npy):
+            obj = np.load(npy, mmap_mode='r')
+        elif os.path.exists(pkl):
+            with open(pkl, 'rb') as f:
+                obj = pickle.load(f)
+        else:
+            return None
+
+        # Track last access for LRU eviction
+        os.utime(entry)
+
+        return obj
+
+    def store(self, path, version, name, obj):
+        """
+        Store an artifact in the cache
+
+        Parameters
+        ----------
+        path : str
+            Domain path
+        version : str
+            Domain version, see file_version
+        name : str
+            Artifact name, e.g. 'meta', 'time_index', 'site_index'
+        obj : ndarray | object
+            Artifact to store, ndarrays are saved as .npy, anything else is
+            pickled
+        """
+        entry = self._entry_dir(path, version)
+        domain_dir = os.path.dirname(entry)
+        if os.path.isdir(domain_dir):
+            for old in os.listdir(domain_dir):
+                old = os.path.join(domain_dir, old)
+                if old != entry:
+                    shutil.rmtree(old, ignore_errors=True)
+
+        os.makedirs(entry, exist_ok=True)
+        if isinstance(obj, np.ndarray):
+            out = os.path.join(entry, name + '.npy')
+        else:
+            out = os.path.join(entry, name + '.pkl')
+
+        # Write to a temporary file first so readers never see partial files
+        fd, tmp = tempfile.mkstemp(dir=entry)
+        with os.fdopen(fd, 'wb') as f:
+            if isinstance(obj, np.ndarray):
+                np.save(f, obj)
+            else:
+                pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(tmp, out)
+        self.prune(keep=entry)
+
+    def prune(self, keep=None):
+        """
+        Evict least recently used entries until the cache fits in max_size
+
+        Parameters
+        ----------
+        keep : str, optional
+            Entry directory that should never be evicted
+        """
+        entries = []
+        for domain in os.listdir(self.cache_dir):
+            domain_dir = os.path.join(self.cache_dir, domain)
+            if not os.path.isdir(domain_dir):
+                continue
+
+            for version in os.listdir(domain_dir):
+                entry = os.path.join(domain_dir, version)
+                entries.append((os.path.getmtime(entry), entry,
+                                _dir_size(entry)))
+
+        total = sum(e[2] for e in entries)
+        for _, entry, size in sorted(entries):
+            if total <= self.max_size:
+                break
+
+            if entry != keep:
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+    def clear(self):
+        """
+        Remove all cached artifacts
+        """
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+
+def cached(cache, h5_file, path, name, func):
+    """
+    Load an artifact from cache, computing and storing it if missing
+
+    Parameters
+    ----------
+    cache : MetaCache | None
+        Cache instance, if None func is always called
+    h5_file : h5pyd.File | h5py.File
+        Open file instance, used to determine the version
+    path : str
+        Domain path
+    name : str
+        Artifact name
+    func : callable
+        Function returning the artifact
+
+    Returns
+    -------
+    obj : ndarray | object
+    """
+    if cache is None:
+        return func()
+
+    version = file_version(h5_file)
+    obj = cache.load(path, version, name)
+    if obj is None:
+        obj = func()
+        cache.store(path, version, name, obj)
+
+    return obj
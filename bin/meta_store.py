@@ -0,0 +1,369 @@
+"""
+Columnar store of NSRDB / WTK site meta data
+
+Meta columns are read on first use with field-only reads, so a lat / lon
+lookup never transfers the string columns. String columns are decoded once
+into categorical codes, coordinates are kept as float32, and per-column
+inverted indexes map each value to its sorted site indices so that
+multi-column filters resolve by intersecting a few small arrays.
+
+    store = MetaStore.from_dataset(h5_file['meta'])
+    sites = store.select(country='United States', state='Colorado',
+                         county='Boulder')
+"""
+import numpy as np
+import pandas as pd
+
+COORDINATES = ('latitude', 'longitude')
+_EMPTY = np.zeros(0, dtype=np.int32)
+
+
+def intersect(small, large):
+    """
+    Intersection of two sorted, unique index arrays in
+    O(len(small) * log(len(large)))
+
+    Parameters
+    ----------
+    small : ndarray
+        Sorted indices, preferably the shorter array
+    large : ndarray
+        Sorted indices
+
+    Returns
+    -------
+    ndarray
+        Sorted indices in both arrays
+    """
+    if not len(small) or not len(large):
+        return small[:0]
+
+    pos = np.searchsorted(large, small)
+    pos[pos == len(large)] = 0
+
+    return small[large[pos] == small]
+
+
+def decode(values):
+    """
+    Decode a meta column, string columns become a pandas Categorical with
+    only the (few) unique values decoded
+
+    Parameters
+    ----------
+    values : ndarray | pd.Series
+        Raw column values, strings may be stored as bytes
+
+    Returns
+    -------
+    pd.Categorical | ndarray
+    """
+    values = np.asarray(values)
+    if values.dtype.kind not in 'SOU':
+        return values
+
+    values = pd.Categorical(values)
+    categories = [c.decode('utf-8') if isinstance(c, bytes) else c
+                  for c in values.categories]
+
+    return pd.Categorical.from_codes(values.codes, categories)
+
+
+class InvertedIndex:
+    """
+    Mapping of each value of a column to the sorted indices of the sites
+    that have it
+    """
+
+    def __init__(self, values):
+        """
+        Parameters
+        ----------
+        values : pd.Categorical | ndarray
+            Decoded column
+        """
+        if not isinstance(values, pd.Categorical):
+            values = pd.Categorical(values)
+
+        codes = values.codes
+        # A stable sort keeps the sites of each value in ascending order
+        order = np.argsort(codes, kind='stable').astype(np.int32)
+        counts = np.bincount(codes[codes >= 0],
+                             minlength=len(values.categories))
+        skip = int((codes < 0).sum())
+        self._sites = order[skip:]
+        self._offsets = np.concatenate(([0], np.cumsum(counts)))
+        self._lookup = {value: i for i, value
+                        in enumerate(values.categories)}
+
+    def __len__(self):
+        return len(self._lookup)
+
+    def __contains__(self, value):
+        return value in self._lookup
+
+    def __getitem__(self, value):
+        i = self._lookup[value]
+        return self._sites[self._offsets[i]:self._offsets[i + 1]]
+
+    @property
+    def values(self):
+        """
+        Returns
+        -------
+        list
+            Distinct values of the column
+        """
+        return list(self._lookup)
+
+    def get(self, value):
+        """
+        Sites with a value, an empty array if no site has it
+
+        Parameters
+        ----------
+        value : str | int | float
+            Column value
+
+        Returns
+        -------
+        site_idx : ndarray
+            Sorted int32 site indices
+        """
+        if value not in self._lookup:
+            return _EMPTY
+
+        return self[value]
+
+    def any(self, values):
+        """
+        Sites with any of several values
+
+        Parameters
+        ----------
+        values : list
+            Column values
+
+        Returns
+        -------
+        site_idx : ndarray
+            Sorted int32 site indices
+        """
+        # Each value's sites are disjoint, so dropping repeated values keeps
+        # the result free of duplicate sites
+        parts = [self.get(value) for value in dict.fromkeys(values)]
+        if len(parts) == 1:
+            return parts[0]
+
+        return np.sort(np.concatenate(parts + [_EMPTY]))
+
+    def counts(self):
+        """
+        Returns
+        -------
+        pd.Series
+            Number of sites per value
+        """
+        return pd.Series(np.diff(self._offsets), index=self.values)
+
+
+class MetaStore:
+    """
+    Lazily loaded, decoded meta columns with inverted indexes
+    """
+
+    def __init__(self, read_fields, names, cached=None):
+        """
+        Parameters
+        ----------
+        read_fields : callable
+            Called with a list of field names, returns a structured array
+            (or DataFrame) holding just those fields for every site
+        names : tuple
+            All field names in the meta data
+        cached : callable, optional
+            cached(name, func) loads an artifact from a persistent cache or
+            computes it with func, e.g. HSDS.cached
+        """
+        self._read_fields = read_fields
+        self.names = tuple(names)
+        self._cached = cached
+        self._columns = {}
+        self._indexes = {}
+        self._coordinates = None
+
+    @classmethod
+    def from_dataset(cls, ds, cached=None):
+        """
+        Store over a compound meta dataset
+
+        Parameters
+        ----------
+        ds : h5pyd.Dataset | h5py.Dataset
+            meta dataset
+        cached : callable, optional
+            See MetaStore
+
+        Returns
+        -------
+        MetaStore
+        """
+        return cls(lambda fields: ds.fields(list(fields))[...],
+                   ds.dtype.names, cached=cached)
+
+    @classmethod
+    def from_frame(cls, meta):
+        """
+        Store over an already loaded meta DataFrame
+
+        Parameters
+        ----------
+        meta : pd.DataFrame
+            Site meta data
+
+        Returns
+        -------
+        MetaStore
+        """
+        return cls(lambda fields: meta[list(fields)], meta.columns)
+
+    def _load(self, name, func):
+        if self._cached is None:
+            return func()
+
+        return self._cached(name, func)
+
+    def _check(self, column):
+        if column not in self.names:
+            raise ValueError('{} is not a valid column in meta'
+                             .format(column))
+
+    @property
+    def coordinates(self):
+        """
+        Returns
+        -------
+        ndarray
+            float32 (n_sites, 2) array of latitude, longitude, read with a
+            single field-only read
+        """
+        if self._coordinates is None:
+            for column in COORDINATES:
+                self._check(column)
+
+            def read():
+                data = self._read_fields(COORDINATES)
+                return np.column_stack([np.asarray(data[c], dtype=np.float32)
+                                        for c in COORDINATES])
+
+            self._coordinates = self._load('meta_coordinates', read)
+
+        return self._coordinates
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def column(self, column):
+        """
+        Decoded meta column, read and decoded only once
+
+        Parameters
+        ----------
+        column : str
+            Column in the meta data
+
+        Returns
+        -------
+        pd.Categorical | ndarray
+            Categorical for string columns, float32 for coordinates
+        """
+        if column in COORDINATES:
+            return self.coordinates[:, COORDINATES.index(column)]
+
+        if column not in self._columns:
+            self._check(column)
+            self._columns[column] = self._load(
+                'meta_' + column,
+                lambda: decode(self._read_fields([column])[column]))
+
+        return self._columns[column]
+
+    def index(self, column):
+        """
+        Inverted index of a column, built once
+
+        Parameters
+        ----------
+        column : str
+            Column in the meta data
+
+        Returns
+        -------
+        InvertedIndex
+        """
+        if column not in self._indexes:
+            self._indexes[column] = InvertedIndex(self.column(column))
+
+        return self._indexes[column]
+
+    def select(self, **filters):
+        """
+        Sites matching every filter, e.g. select(state='Colorado',
+        county=['Boulder', 'Denver'])
+
+        Parameters
+        ----------
+        filters : dict
+            {column: value or list of values}, a list matches any of its
+            values
+
+        Returns
+        -------
+        site_idx : ndarray
+            Sorted int32 site indices
+        """
+        if not filters:
+            return np.arange(len(self), dtype=np.int32)
+
+        parts = []
+        for column, values in filters.items():
+            if np.ndim(values) == 0:
+                values = [values]
+
+            parts.append(self.index(column).any(values))
+
+        # Intersect smallest first so every step works on the fewest sites
+        parts.sort(key=len)
+        site_idx = parts[0]
+        for part in parts[1:]:
+            site_idx = intersect(site_idx, part)
+
+        return site_idx
+
+    def frame(self, columns=None, site_idx=None):
+        """
+        Compact meta DataFrame of decoded columns
+
+        Parameters
+        ----------
+        columns : list, optional
+            Columns to include, defaults to all
+        site_idx : ndarray, optional
+            Sites to include, defaults to all. The frame is indexed by site.
+
+        Returns
+        -------
+        pd.DataFrame
+        """
+        columns = self.names if columns is None else columns
+        data = {}
+        for column in columns:
+            values = self.column(column)
+            if site_idx is not None:
+                values = values[site_idx]
+
+            data[column] = values
+
+        index = pd.RangeIndex(len(self)) if site_idx is None else site_idx
+
+        return pd.DataFrame(data, index=index)
@@ -0,0 +1,326 @@
+"""
+Polygon masks and masked extraction for gridded (WTK) and site-list (NSRDB)
+datasets
+"""
+from matplotlib.path import Path
+import numpy as np
+
+
+def geometry_rings(geometry):
+    """
+    Polygon rings of a GeoJSON-like geometry
+
+    Parameters
+    ----------
+    geometry : dict | object
+        GeoJSON mapping (Polygon, MultiPolygon, Feature or
+        FeatureCollection) or any object with __geo_interface__, e.g. a
+        shapely geometry or GeoDataFrame
+
+    Returns
+    -------
+    polygons : list
+        List of (exterior, holes) pairs, each ring an (n, 2) array of
+        (lon, lat) vertices
+    """
+    if hasattr(geometry, '__geo_interface__'):
+        geometry = geometry.__geo_interface__
+
+    kind = geometry['type']
+    if kind == 'FeatureCollection':
+        return [ring for feature in geometry['features']
+                for ring in geometry_rings(feature)]
+
+    if kind == 'Feature':
+        return geometry_rings(geometry['geometry'])
+
+    if kind == 'GeometryCollection':
+        return [ring for geom in geometry['geometries']
+                for ring in geometry_rings(geom)]
+
+    if kind == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif kind == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        raise ValueError('Expected a polygon geometry, got {}'.format(kind))
+
+    return [(np.asarray(rings[0], dtype=float)[:, :2],
+             [np.asarray(hole, dtype=float)[:, :2] for hole in rings[1:]])
+            for rings in polygons]
+
+
+def points_in_polygon(x, y, polygons):
+    """
+    Vectorized point in polygon test
+
+    Parameters
+    ----------
+    x : ndarray
+        Point x (lon) coordinates
+    y : ndarray
+        Point y (lat) coordinates
+    polygons : list
+        List of (exterior, holes) pairs, see geometry_rings
+
+    Returns
+    -------
+    mask : ndarray
+        True for points inside any polygon (and outside its holes)
+    """
+    points = np.column_stack((np.ravel(x), np.ravel(y)))
+    mask = np.zeros(len(points), dtype=bool)
+    for exterior, holes in polygons:
+        inside = Path(exterior).contains_points(points)
+        for hole in holes:
+            inside &= ~Path(hole).contains_points(points)
+
+        mask |= inside
+
+    return mask.reshape(np.shape(x))
+
+
+class SparseCells:
+    """
+    Values for the cells (or sites) inside a polygon, stored as
+    (time, cell) arrays plus the index of each cell
+    """
+
+    def __init__(self, index, shape=None):
+        """
+        Parameters
+        ----------
+        index : tuple | ndarray
+            (i, j) index arrays of the cells on a 2D grid, or site indices
+        shape : tuple, optional
+            Shape of the full grid, used by to_dense
+        """
+        self.index = index
+        self.shape = shape
+        self.data = {}
+
+    def __len__(self):
+        if isinstance(self.index, tuple):
+            return len(self.index[0])
+
+        return len(self.index)
+
+    def to_dense(self, variable, fill=np.nan):
+        """
+        Scatter a variable onto the bounding window of the cells
+
+        Parameters
+        ----------
+        variable : str
+            Variable to densify
+        fill : float
+            Value for cells outside the polygon
+
+        Returns
+        -------
+        dense : ndarray
+            (time, rows, cols) array covering the cell bounding window
+        origin : tuple
+            (i, j) index of the window's first cell
+        """
+        i, j = self.index
+        i0, j0 = i.min(), j.min()
+        data = self.data[variable]
+        dense = np.full((len(data), i.max() - i0 + 1, j.max() - j0 + 1),
+                        fill, dtype=np.result_type(data.dtype, type(fill)))
+        dense[:, i - i0, j - j0] = data
+
+        return dense, (int(i0), int(j0))
+
+
+def densify(ring, max_step=0.01):
+    """
+    Insert vertices along a ring so no edge is longer than max_step, so
+    that straight lon/lat edges stay close to straight after projection
+
+    Parameters
+    ----------
+    ring : ndarray
+        (n, 2) array of ring vertices
+    max_step : float
+        Maximum edge length in degrees
+
+    Returns
+    -------
+    ring : ndarray
+        Densified (m, 2) array of vertices
+    """
+    start, end = ring[:-1], ring[1:]
+    n = np.maximum(np.ceil(np.hypot(*(end - start).T) / max_step), 1)
+    n = n.astype(int)
+    edge = np.repeat(np.arange(len(start)), n)
+    frac = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    frac = (frac / n[edge])[:, None]
+    points = start[edge] + frac * (end[edge] - start[edge])
+
+    return np.concatenate((points, ring[-1:]))
+
+
+def wtk_cells(grid, geometry):
+    """
+    WTK grid cells whose centers fall inside a polygon. The polygon is
+    projected onto the grid, so no coordinates have to be downloaded.
+
+    Parameters
+    ----------
+    grid : WTKGrid
+        WTK grid projection and origin
+    geometry : dict | object
+        Polygon geometry in lon/lat, see geometry_rings
+
+    Returns
+    -------
+    i : ndarray
+        Sorted row indices of the cells inside the polygon
+    j : ndarray
+        Column indices of the cells inside the polygon
+    """
+    polygons = []
+    for exterior, holes in geometry_rings(geometry):
+        rings = [grid.to_grid(densify(ring))
+                 for ring in [exterior] + holes]
+        polygons.append((rings[0], rings[1:]))
+
+    vertices = np.concatenate([p[0] for p in polygons])
+    lo = np.maximum(np.floor(vertices.min(axis=0)).astype(int), 0)
+    hi = np.minimum(np.ceil(vertices.max(axis=0)).astype(int),
+                    np.array(grid.shape)[::-1] - 1)
+    jj, ii = np.meshgrid(np.arange(lo[0], hi[0] + 1),
+                         np.arange(lo[1], hi[1] + 1))
+    mask = points_in_polygon(jj, ii, polygons)
+
+    return ii[mask], jj[mask]
+
+
+def site_cells(meta, geometry):
+    """
+    Sites (e.g. NSRDB) whose coordinates fall inside a polygon
+
+    Parameters
+    ----------
+    meta : pd.DataFrame
+        Site meta data with 'latitude' and 'longitude' columns
+    geometry : dict | object
+        Polygon geometry in lon/lat, see geometry_rings
+
+    Returns
+    -------
+    site_idx : ndarray
+        Sorted indices of the sites inside the polygon
+    """
+    polygons = geometry_rings(geometry)
+    lon = meta['longitude'].values
+    lat = meta['latitude'].values
+    # Only test sites inside the polygons' bounding box
+    vertices = np.concatenate([p[0] for p in polygons])
+    lo, hi = vertices.min(axis=0), vertices.max(axis=0)
+    candidates = np.where((lon >= lo[0]) & (lon <= hi[0])
+                          & (lat >= lo[1]) & (lat <= hi[1]))[0]
+    inside = points_in_polygon(lon[candidates], lat[candidates], polygons)
+
+    return candidates[inside]
+
+
+def extract_wtk(wtk, grid, datasets, geometry, time_slice=slice(None)):
+    """
+    Extract WTK datasets for the grid cells inside a polygon
+
+    Parameters
+    ----------
+    wtk : h5pyd.File
+        h5pyd File instance for the WTK
+    grid : WTKGrid
+        WTK grid projection and origin
+    datasets : list
+        (time, rows, cols) datasets to extract, duplicates are ignored
+    geometry : dict | object
+        Polygon geometry in lon/lat, see geometry_rings
+    time_slice : slice
+        Selection along the time axis
+
+    Returns
+    -------
+    SparseCells
+        Raw values per dataset for the cells inside the polygon
+    """
+    i, j = wtk_cells(grid, geometry)
+    cells = SparseCells((i, j), shape=grid.shape)
+    for name in dict.fromkeys(datasets):
+        cells.data[name] = read_cells(wtk[name], i, j, time_slice=time_slice)
+
+    return cells
+
+
+def cell_tiles(i, j, chunks):
+    """
+    Chunk-aligned tiles covering a set of grid cells. Each tile is the
+    bounding box of the cells inside one chunk band along i and a run of
+    adjacent chunks along j that contain cells.
+
+    Parameters
+    ----------
+    i : ndarray
+        Row indices of the cells
+    j : ndarray
+        Column indices of the cells
+    chunks : tuple
+        (rows, cols) chunk shape
+
+    Returns
+    -------
+    tiles : list
+        List of (row slice, col slice, cell positions) for each tile
+    """
+    tiles = []
+    band = i // chunks[0]
+    col_chunk = j // chunks[1]
+    for b in np.unique(band):
+        in_band = np.where(band == b)[0]
+        chunk_ids = np.unique(col_chunk[in_band])
+        # Runs of adjacent column chunks are read together
+        breaks = np.where(np.diff(chunk_ids) != 1)[0] + 1
+        for run in np.split(chunk_ids, breaks):
+            cells = in_band[(col_chunk[in_band] >= run[0])
+                            & (col_chunk[in_band] <= run[-1])]
+            rows = slice(int(i[cells].min()), int(i[cells].max()) + 1)
+            cols = slice(int(j[cells].min()), int(j[cells].max()) + 1)
+            tiles.append((rows, cols, cells))
+
+    return tiles
+
+
+def read_cells(ds, i, j, time_slice=slice(None)):
+    """
+    Read the given (i, j) cells of a (time, rows, cols) dataset, only
+    fetching chunk-aligned tiles that contain cells
+
+    Parameters
+    ----------
+    ds : h5pyd.Dataset
+        (time, rows, cols) dataset
+    i : ndarray
+        Row indices of the cells
+    j : ndarray
+        Column indices of the cells
+    time_slice : slice
+        Selection along the time axis
+
+    Returns
+    -------
+    data : ndarray
+        (time, cells) array of raw values
+    """
+    chunks = ds.chunks if ds.chunks is not None else ds.shape
+    n_time = len(range(*time_slice.indices(ds.shape[0])))
+    out = np.empty((n_time, len(i)), dtype=ds.dtype)
+    for rows, cols, cells in cell_tiles(i, j, chunks[1:]):
+        block = ds[time_slice, rows, cols]
+        out[:, cells] = block[:, i[cells] - rows.start, j[cells] - cols.start]
+
+    return out
+
@@ -0,0 +1,193 @@
+"""
+Rasterized aggregation of site values onto a fixed-resolution lon/lat image
+
+Plotting one marker per site is slow for the ~1M NSRDB CONUS sites. Instead
+each site is mapped to a pixel once, and every frame over the same sites is
+aggregated with a single bincount (or reduceat for min / max) and drawn
+with imshow.
+"""
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+
+DEFAULT_SHAPE = (400, 800)  # (rows, cols) of the raster image
+AGGREGATIONS = ('mean', 'max', 'min', 'sum', 'count')
+
+# Recently used PixelGrids keyed by site coordinates and raster shape
+_GRIDS = OrderedDict()
+_MAX_GRIDS = 8
+
+
+class PixelGrid:
+    """
+    Site to pixel mapping of a set of (lon, lat) sites on a raster image
+    """
+
+    def __init__(self, lon, lat, shape=DEFAULT_SHAPE, extent=None):
+        """
+        Parameters
+        ----------
+        lon : ndarray
+            Longitude vector
+        lat : ndarray
+            Latitude vector
+        shape : tuple
+            (rows, cols) of the raster image
+        extent : tuple, optional
+            (lon_min, lon_max, lat_min, lat_max) of the image, defaults to
+            the bounds of the sites
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        if extent is None:
+            extent = (lon.min(), lon.max(), lat.min(), lat.max())
+
+        self.shape = tuple(shape)
+        self.extent = tuple(float(e) for e in extent)
+        rows, cols = self.shape
+        x0, x1, y0, y1 = self.extent
+        col = np.floor((lon - x0) / max(x1 - x0, 1e-12) * cols)
+        row = np.floor((lat - y0) / max(y1 - y0, 1e-12) * rows)
+        col = np.clip(col, 0, cols - 1).astype(np.int64)
+        row = np.clip(row, 0, rows - 1).astype(np.int64)
+        self.pixel = row * cols + col
+        self.size = rows * cols
+        self.counts = np.bincount(self.pixel, minlength=self.size)
+        self._order = None
+        self._starts = None
+
+    def _sorted(self):
+        """
+        Site order grouping sites by pixel and the start of each occupied
+        pixel's group, computed on the first min / max aggregation
+        """
+        if self._order is None:
+            self._order = np.argsort(self.pixel, kind='stable')
+            pixels = self.pixel[self._order]
+            self._starts = np.concatenate(
+                ([0], np.where(np.diff(pixels))[0] + 1))
+
+        return self._order, self._starts
+
+    def aggregate(self, data, how='mean'):
+        """
+        Aggregate site values onto the raster
+
+        Parameters
+        ----------
+        data : ndarray
+            Value for each site
+        how : str
+            'mean', 'max', 'min', 'sum' or 'count'
+
+        Returns
+        -------
+        image : ndarray
+            (rows, cols) float32 image, NaN for pixels without sites
+        """
+        if how not in AGGREGATIONS:
+            raise ValueError('how must be one of {}, got {}'
+                             .format(AGGREGATIONS, how))
+
+        data = np.asarray(data, dtype=np.float64)
+        image = np.full(self.size, np.nan, dtype=np.float32)
+        occupied = self.counts > 0
+        if how == 'count':
+            image[occupied] = self.counts[occupied]
+        elif how in ('mean', 'sum'):
+            image[occupied] = np.bincount(self.pixel, weights=data,
+                                          minlength=self.size)[occupied]
+            if how == 'mean':
+                image[occupied] /= self.counts[occupied]
+        else:
+            order, starts = self._sorted()
+            ufunc = np.maximum if how == 'max' else np.minimum
+            values = ufunc.reduceat(data[order], starts)
+            image[self.pixel[order[starts]]] = values
+
+        return image.reshape(self.shape)
+
+
+def _key(lon, lat, shape, extent):
+    """
+    Cache key of a site set and raster definition
+    """
+    h = hashlib.sha1()
+    for arr in (lon, lat):
+        h.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+
+    return h.hexdigest(), tuple(shape), extent
+
+
+def pixel_grid(lon, lat, shape=DEFAULT_SHAPE, extent=None):
+    """
+    PixelGrid for a set of sites, reused across calls with the same sites
+
+    Parameters
+    ----------
+    lon : ndarray
+        Longitude vector
+    lat : ndarray
+        Latitude vector
+    shape : tuple
+        (rows, cols) of the raster image
+    extent : tuple, optional
+        (lon_min, lon_max, lat_min, lat_max) of the image
+
+    Returns
+    -------
+    PixelGrid
+    """
+    key = _key(lon, lat, shape, extent)
+    grid = _GRIDS.pop(key, None)
+    if grid is None:
+        grid = PixelGrid(lon, lat, shape=shape, extent=extent)
+
+    _GRIDS[key] = grid
+    while len(_GRIDS) > _MAX_GRIDS:
+        _GRIDS.popitem(last=False)
+
+    return grid
+
+
+def raster_shape(raster):
+    """
+    Raster shape from a create_map / create_scatter raster argument
+
+    Parameters
+    ----------
+    raster : bool | tuple
+        True for DEFAULT_SHAPE or a (rows, cols) shape
+
+    Returns
+    -------
+    tuple
+    """
+    return DEFAULT_SHAPE if raster is True else tuple(raster)
+
+
+def imshow(ax, grid, data, how='mean', **kwargs):
+    """
+    Draw site values as a raster image
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        Axes to draw on
+    grid : PixelGrid
+        Site to pixel mapping
+    data : ndarray
+        Value for each site
+    how : str
+        Per-pixel aggregation
+    kwargs : dict
+        Additional imshow arguments, e.g. cmap, vmin and vmax
+
+    Returns
+    -------
+    matplotlib.image.AxesImage
+    """
+    return ax.imshow(grid.aggregate(data, how=how), origin='lower',
+                     extent=grid.extent, aspect='auto',
+                     interpolation='nearest', **kwargs)
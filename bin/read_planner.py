@@ -0,0 +1,471 @@
+"""
+Chunk-aware read planning for HSDS / HDF5 datasets
+
+Arbitrary selections are converted into a small set of hyperslab reads that
+respect the dataset chunk layout. Each axis selection is split into the chunks
+it touches, and neighbouring chunk groups are merged when a single larger
+request is cheaper than several small ones. Along the last axis scattered
+indices can be requested as a point list instead of a bounding slab when that
+transfers fewer bytes.
+"""
+import numpy as np
+
+# Cost of issuing one additional request expressed in bytes, i.e. the amount
+# of data that could be transferred in the time of one round trip.
+OVERHEAD_BYTES = 2 ** 20
+# Cost of each index in a point-list request, which has to be sent to the
+# server as part of the request body.
+POINT_BYTES = 8
+
+
+def normalize_selection(sel, n):
+    """
+    Convert an axis selection into a sorted array of unique indices
+
+    Parameters
+    ----------
+    sel : int | slice | list | ndarray
+        Selection along a single axis
+    n : int
+        Length of the axis
+
+    Returns
+    -------
+    idx : ndarray
+        Sorted, unique indices selected along the axis
+    inverse : ndarray | None
+        Positions of the requested indices in idx if the request was not
+        already sorted and unique, else None
+    scalar : bool
+        True if the selection was a scalar index and the axis should be
+        dropped from the output
+    """
+    if isinstance(sel, slice):
+        return np.arange(n)[sel], None, False
+
+    if np.isscalar(sel):
+        sel = int(sel)
+        if sel < 0:
+            sel += n
+
+        if not 0 <= sel < n:
+            raise IndexError('Index {} is out of bounds for axis of length {}'
+                             .format(sel, n))
+
+        return np.array([sel]), None, True
+
+    sel = np.asarray(sel)
+    if sel.dtype == bool:
+        return np.where(sel)[0], None, False
+
+    sel = sel.astype(np.int64)
+    sel[sel < 0] += n
+    if len(sel) and (sel.min() < 0 or sel.max() >= n):
+        raise IndexError('Selection is out of bounds for axis of length {}'
+                         .format(n))
+
+    idx, inverse = np.unique(sel, return_inverse=True)
+    if len(idx) == len(sel) and np.array_equal(idx, sel):
+        inverse = None
+
+    return idx, inverse, False
+
+
+class AxisSegment:
+    """
+    A contiguous part of an axis selection fetched with one request
+    """
+
+    def __init__(self, idx, start, points=False, step=1):
+        """
+        Parameters
+        ----------
+        idx : ndarray
+            Sorted, unique indices covered by this segment
+        start : int
+            Position of idx[0] in the output array along this axis
+        points : bool
+            Request the indices as a point list instead of a bounding slab
+        step : int
+            Stride of the slab, only used for evenly spaced selections
+        """
+        self.idx = idx
+        self.start = start
+        self.points = points
+        self.step = step
+
+    @property
+    def span(self):
+        """
+        Returns
+        -------
+        int
+            Length of the bounding slab of the segment
+        """
+        return int(self.idx[-1] - self.idx[0] + 1)
+
+    @property
+    def size(self):
+        """
+        Returns
+        -------
+        int
+            Number of elements fetched along the axis
+        """
+        if self.points or self.step > 1:
+            return len(self.idx)
+
+        return self.span
+
+    @property
+    def source(self):
+        """
+        Returns
+        -------
+        slice | list
+            Selection to request from the dataset
+        """
+        if self.points:
+            return self.idx.tolist()
+
+        return slice(int(self.idx[0]), int(self.idx[-1]) + 1, self.step)
+
+    @property
+    def local(self):
+        """
+        Returns
+        -------
+        slice | ndarray
+            Selection into the fetched block that yields the requested indices
+        """
+        if self.points or len(self.idx) == self.size:
+            return slice(None)
+
+        return self.idx - self.idx[0]
+
+    @property
+    def dest(self):
+        """
+        Returns
+        -------
+        slice
+            Positions in the output array along this axis
+        """
+        return slice(self.start, self.start + len(self.idx))
+
+    def chunks(self, chunk_size):
+        """
+        Number of chunks touched along this axis
+
+        Parameters
+        ----------
+        chunk_size : int
+            Chunk size along the axis
+
+        Returns
+        -------
+        int
+        """
+        if self.points or self.step > 1:
+            return len(np.unique(self.idx // chunk_size))
+
+        return int(self.idx[-1] // chunk_size - self.idx[0] // chunk_size + 1)
+
+
+def _segment_cost(lo, hi, count, points, other, itemsize, overhead):
+    """
+    Cost in bytes of fetching count indices between lo and hi in one request
+    """
+    if points:
+        return overhead + count * (other * itemsize + POINT_BYTES)
+
+    return overhead + (hi - lo + 1) * other * itemsize
+
+
+def plan_axis(idx, chunk_size, other=1, itemsize=1, allow_points=False,
+              overhead=OVERHEAD_BYTES):
+    """
+    Split an axis selection into segments, one request per segment
+
+    Parameters
+    ----------
+    idx : ndarray
+        Sorted, unique indices selected along the axis
+    chunk_size : int
+        Chunk size along the axis
+    other : int
+        Number of elements selected along all other axes
+    itemsize : int
+        Size of a single element in bytes
+    allow_points : bool
+        Allow point-list requests along this axis
+    overhead : int
+        Cost of an additional request in bytes
+
+    Returns
+    -------
+    segments : list
+        List of AxisSegment instances covering idx in order
+    """
+    if not len(idx):
+        return []
+
+    chunk_ids = idx // chunk_size
+    bounds = np.concatenate(([0], np.where(np.diff(chunk_ids) != 0)[0] + 1,
+                             [len(idx)]))
+
+    def best(i0, i1):
+        args = (idx[i0], idx[i1 - 1], i1 - i0)
+        slab = _segment_cost(*args, False, other, itemsize, overhead)
+        if allow_points:
+            pts = _segment_cost(*args, True, other, itemsize, overhead)
+            if pts < slab:
+                return pts, True
+
+        return slab, False
+
+    segments = []
+    i0, i1 = bounds[0], bounds[1]
+    cost, points = best(i0, i1)
+    for j0, j1 in zip(bounds[1:-1], bounds[2:]):
+        merged_cost, merged_points = best(i0, j1)
+        group_cost, group_points = best(j0, j1)
+        if merged_cost <= cost + group_cost:
+            i1, cost, points = j1, merged_cost, merged_points
+        else:
+            segments.append((idx[i0:i1], points))
+            i0, i1, cost, points = j0, j1, group_cost, group_points
+
+    segments.append((idx[i0:i1], points))
+
+    out = []
+    start = 0
+    for seg_idx, seg_points in segments:
+        out.append(AxisSegment(seg_idx, start, points=seg_points))
+        start += len(seg_idx)
+
+    return out
+
+
+class ReadPlan:
+    """
+    Set of chunk-aligned hyperslab reads covering a selection
+    """
+
+    def __init__(self, shape, chunks, itemsize, selection,
+                 overhead=OVERHEAD_BYTES):
+        """
+        Parameters
+        ----------
+        shape : tuple
+            Dataset shape
+        chunks : tuple | None
+            Dataset chunk shape, None for contiguous datasets
+        itemsize : int
+            Size of a single element in bytes
+        selection : tuple
+            Selection along each axis (int, slice, list, ndarray or bool
+            mask), missing trailing axes are fully selected
+        overhead : int
+            Cost of an additional request in bytes
+        """
+        if not isinstance(selection, tuple):
+            selection = (selection,)
+
+        selection = selection + (slice(None),) * (len(shape) - len(selection))
+        if chunks is None:
+            chunks = shape
+
+        self.shape = tuple(shape)
+        self.chunks = tuple(chunks)
+        self.itemsize = itemsize
+
+        self._idx = []
+        self._inverse = []
+        self._scalar = []
+        for sel, n in zip(selection, shape):
+            idx, inverse, scalar = normalize_selection(sel, n)
+            self._idx.append(idx)
+            self._inverse.append(inverse)
+            self._scalar.append(scalar)
+
+        counts = [len(idx) for idx in self._idx]
+        self.segments = []
+        last = len(shape) - 1
+        for axis, idx in enumerate(self._idx):
+            if isinstance(selection[axis], slice):
+                # A slice is already a single (strided) hyperslab request
+                step = selection[axis].step or 1
+                if step < 0:
+                    raise ValueError('Negative slice steps are not supported')
+
+                segs = [AxisSegment(idx, 0, step=step)] if len(idx) else []
+                self.segments.append(segs)
+                continue
+
+            other = int(np.prod(counts[:axis] + counts[axis + 1:]))
+            self.segments.append(plan_axis(idx, self.chunks[axis],
+                                           other=other, itemsize=itemsize,
+                                           allow_points=(axis == last),
+                                           overhead=overhead))
+
+    @property
+    def out_shape(self):
+        """
+        Returns
+        -------
+        tuple
+            Shape of the sorted, unique selection before reordering
+        """
+        return tuple(len(idx) for idx in self._idx)
+
+    @property
+    def extent(self):
+        """
+        Returns
+        -------
+        tuple
+            (start, stop, count) of the selected indices along each axis
+        """
+        return tuple((int(idx[0]), int(idx[-1]) + 1, len(idx)) if len(idx)
+                     else (0, 0, 0) for idx in self._idx)
+
+    def reads(self):
+        """
+        Iterate over the planned reads
+
+        Yields
+        ------
+        segs : tuple
+            One AxisSegment per axis
+        """
+        if any(not segs for segs in self.segments):
+            return
+
+        grids = np.meshgrid(*[np.arange(len(segs)) for segs in self.segments],
+                            indexing='ij')
+        for pos in zip(*[g.ravel() for g in grids]):
+            yield tuple(segs[i] for segs, i in zip(self.segments, pos))
+
+    def summary(self):
+        """
+        Summarize the plan without reading any data
+
+        Returns
+        -------
+        summary : dict
+            Number of requests, chunks touched, bytes transferred and bytes
+            requested by the selection
+        """
+        requests = 0
+        chunks = 0
+        nbytes = 0
+        for segs in self.reads():
+            requests += 1
+            chunks += int(np.prod([seg.chunks(c)
+                                   for seg, c in zip(segs, self.chunks)]))
+            nbytes += int(np.prod([seg.size for seg in segs])) * self.itemsize
+
+        selected = int(np.prod(self.out_shape)) * self.itemsize
+
+        return {'requests': requests, 'chunks': chunks, 'bytes': nbytes,
+                'selected_bytes': selected}
+
+    def execute(self, ds, out=None):
+        """
+        Issue the planned reads and scatter results into the output array
+
+        Parameters
+        ----------
+        ds : h5pyd.Dataset | h5py.Dataset
+            Dataset to read from
+        out : ndarray, optional
+            Preallocated output array in the requested order and shape,
+            filled in place
+
+        Returns
+        -------
+        out : ndarray
+            Selected data in the requested order and shape
+        """
+        reorder = (any(inverse is not None for inverse in self._inverse)
+                   or any(self._scalar))
+        result = out
+        if out is None or reorder:
+            # Reordered or squeezed selections are read in sorted order
+            # first, then copied into out
+            out = np.empty(self.out_shape, dtype=ds.dtype)
+
+        for segs in self.reads():
+            block = ds[tuple(seg.source for seg in segs)]
+            local = tuple(seg.local for seg in segs)
+            if any(isinstance(sel, np.ndarray) for sel in local):
+                block = block[np.ix_(*[np.arange(block.shape[i])[sel]
+                                       for i, sel in enumerate(local)])]
+
+            out[tuple(seg.dest for seg in segs)] = block
+
+        for axis, inverse in enumerate(self._inverse):
+            if inverse is not None:
+                out = np.take(out, inverse, axis=axis)
+
+        drop = tuple(axis for axis, s in enumerate(self._scalar) if s)
+        if drop:
+            out = out.reshape([n for axis, n in enumerate(out.shape)
+                               if axis not in drop])
+
+        if result is not None and result is not out:
+            result[...] = out
+            out = result
+
+        return out
+
+
+def plan(ds, selection, overhead=OVERHEAD_BYTES):
+    """
+    Plan the reads needed for selection from ds
+
+    Parameters
+    ----------
+    ds : h5pyd.Dataset | h5py.Dataset
+        Dataset to read from
+    selection : tuple
+        Selection along each axis
+    overhead : int
+        Cost of an additional request in bytes
+
+    Returns
+    -------
+    ReadPlan
+    """
+    return ReadPlan(ds.shape, ds.chunks, ds.dtype.itemsize, selection,
+                    overhead=overhead)
+
+
+def read(ds, selection, dry_run=False, out=None, overhead=OVERHEAD_BYTES):
+    """
+    Read selection from ds with chunk-aligned, coalesced requests
+
+    Parameters
+    ----------
+    ds : h5pyd.Dataset | h5py.Dataset
+        Dataset to read from
+    selection : tuple
+        Selection along each axis
+    dry_run : bool
+        Return the plan summary instead of reading the data
+    out : ndarray, optional
+        Preallocated output array
+    overhead : int
+        Cost of an additional request in bytes
+
+    Returns
+    -------
+    ndarray | dict
+        Selected data, or plan summary if dry_run
+    """
+    read_plan = plan(ds, selection, overhead=overhead)
+    if dry_run:
+        return read_plan.summary()
+
+    return read_plan.execute(ds, out=out)
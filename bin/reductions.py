@@ -0,0 +1,259 @@
+"""
+Streaming (out-of-core) reductions over (time, site) slabs
+
+Each accumulator is updated one time slab at a time, so peak memory is
+bounded by a single slab instead of the full (time, site) array.
+"""
+import numpy as np
+
+
+class RunningStats:
+    """
+    Online count, mean, variance (Welford / Chan et al.), min and max per
+    site
+    """
+
+    def __init__(self, n_sites):
+        """
+        Parameters
+        ----------
+        n_sites : int
+            Number of sites (columns) in each slab
+        """
+        self.count = np.zeros(n_sites, dtype=np.int64)
+        self.mean = np.zeros(n_sites, dtype=np.float64)
+        self._m2 = np.zeros(n_sites, dtype=np.float64)
+        self.min = np.full(n_sites, np.inf)
+        self.max = np.full(n_sites, -np.inf)
+
+    def update(self, block):
+        """
+        Add a (time, site) block
+
+        Parameters
+        ----------
+        block : ndarray
+            (time, site) array of values
+        """
+        if not len(block):
+            return
+
+        count = len(block)
+        mean = block.mean(axis=0, dtype=np.float64)
+        m2 = ((block - mean) ** 2).sum(axis=0, dtype=np.float64)
+        self._merge(count, mean, m2)
+        np.minimum(self.min, block.min(axis=0), out=self.min)
+        np.maximum(self.max, block.max(axis=0), out=self.max)
+
+    def _merge(self, count, mean, m2):
+        """
+        Merge the statistics of a batch into the running statistics
+        """
+        total = self.count + count
+        # An empty side contributes nothing, sites empty on both sides stay
+        # empty instead of turning into 0 / 0
+        total_f = np.maximum(total, 1).astype(np.float64)
+        delta = np.where(count > 0, mean - self.mean, 0)
+        self.mean += delta * (count / total_f)
+        self._m2 += np.where(count > 0, m2, 0) + delta ** 2 * (
+            self.count * count / total_f)
+        self.count = total
+
+    def merge(self, other):
+        """
+        Merge another RunningStats instance into this one
+
+        Parameters
+        ----------
+        other : RunningStats
+        """
+        self._merge(other.count, other.mean, other._m2)
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+
+    @property
+    def var(self):
+        """
+        Returns
+        -------
+        ndarray
+            Population variance per site
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._m2 / self.count
+
+    @property
+    def std(self):
+        """
+        Returns
+        -------
+        ndarray
+            Population standard deviation per site
+        """
+        return np.sqrt(self.var)
+
+
+class StreamingHistogram:
+    """
+    Fixed-bin histogram per site
+    """
+
+    def __init__(self, n_sites, bins):
+        """
+        Parameters
+        ----------
+        n_sites : int
+            Number of sites (columns) in each slab
+        bins : ndarray
+            Monotonically increasing bin edges, values outside the edges are
+            ignored
+        """
+        self.edges = np.asarray(bins, dtype=np.float64)
+        self.n_bins = len(self.edges) - 1
+        self.counts = np.zeros((n_sites, self.n_bins), dtype=np.int64)
+
+    def update(self, block):
+        """
+        Add a (time, site) block
+
+        Parameters
+        ----------
+        block : ndarray
+            (time, site) array of values
+        """
+        bins = np.searchsorted(self.edges, block, side='right') - 1
+        # Include the right-most edge in the last bin
+        bins[block == self.edges[-1]] = self.n_bins - 1
+        valid = (bins >= 0) & (bins < self.n_bins)
+        sites = np.broadcast_to(np.arange(block.shape[1]), block.shape)
+        flat = sites[valid] * self.n_bins + bins[valid]
+        self.counts += np.bincount(flat, minlength=self.counts.size
+                                   ).reshape(self.counts.shape)
+
+
+class P2Quantile:
+    """
+    Approximate quantile per site using the P-squared algorithm
+    (Jain & Chlamtac, 1985), vectorized across sites. Memory is five markers
+    per site regardless of the number of observations.
+    """
+
+    def __init__(self, n_sites, q):
+        """
+        Parameters
+        ----------
+        n_sites : int
+            Number of sites (columns) in each slab
+        q : float
+            Quantile to estimate, between 0 and 1
+        """
+        self.q = q
+        self._dn = np.array([0, q / 2, q, (1 + q) / 2, 1])[:, None]
+        self._heights = np.zeros((5, n_sites))
+        self._pos = np.tile(np.arange(1, 6, dtype=np.float64)[:, None],
+                            (1, n_sites))
+        self._desired = np.array([1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q,
+                                  5])[:, None] * np.ones((1, n_sites))
+        self._init = []
+
+    def update(self, block):
+        """
+        Add a (time, site) block
+
+        Parameters
+        ----------
+        block : ndarray
+            (time, site) array of values
+        """
+        block = np.asarray(block, dtype=np.float64)
+        start = 0
+        if len(self._init) < 5:
+            start = min(5 - len(self._init), len(block))
+            self._init.extend(block[:start])
+            if len(self._init) == 5:
+                self._heights = np.sort(np.array(self._init), axis=0)
+
+        for x in block[start:]:
+            self._add(x)
+
+    def _add(self, x):
+        """
+        Add a single observation per site
+        """
+        h = self._heights
+        n = self._pos
+        np.minimum(h[0], x, out=h[0])
+        np.maximum(h[4], x, out=h[4])
+        # Cell k such that h[k] <= x < h[k + 1]
+        k = (x[None, :] >= h[1:4]).sum(axis=0)
+        n += np.arange(5)[:, None] > k[None, :]
+        self._desired += self._dn
+
+        for i in (1, 2, 3):
+            d = self._desired[i] - n[i]
+            adjust = (((d >= 1) & (n[i + 1] - n[i] > 1))
+                      | ((d <= -1) & (n[i - 1] - n[i] < -1)))
+            if not adjust.any():
+                continue
+
+            d = np.sign(d[adjust])
+            hp, hi, hn = h[i - 1, adjust], h[i, adjust], h[i + 1, adjust]
+            np_, ni, nn = n[i - 1, adjust], n[i, adjust], n[i + 1, adjust]
+            parabolic = hi + d / (nn - np_) * (
+                (ni - np_ + d) * (hn - hi) / (nn - ni)
+                + (nn - ni - d) * (hi - hp) / (ni - np_))
+            linear = np.where(d > 0, hi + (hn - hi) / (nn - ni),
+                              hi - (hp - hi) / (np_ - ni))
+            ok = (hp < parabolic) & (parabolic < hn)
+            h[i, adjust] = np.where(ok, parabolic, linear)
+            n[i, adjust] = ni + d
+
+    @property
+    def value(self):
+        """
+        Returns
+        -------
+        ndarray
+            Estimated quantile per site
+        """
+        if len(self._init) < 5:
+            if not self._init:
+                return np.full(self._heights.shape[1], np.nan)
+
+            return np.quantile(np.array(self._init), self.q, axis=0)
+
+        return self._heights[2].copy()
+
+
+class GroupedStats:
+    """
+    RunningStats per group of timesteps, e.g. per month or hour of day
+    """
+
+    def __init__(self, n_sites, labels):
+        """
+        Parameters
+        ----------
+        n_sites : int
+            Number of sites (columns) in each slab
+        labels : ndarray
+            Group label for every timestep along the full time axis
+        """
+        self.labels = np.asarray(labels)
+        self.groups = {label: RunningStats(n_sites)
+                       for label in np.unique(self.labels)}
+
+    def update(self, block, time_slice):
+        """
+        Add a (time, site) block
+
+        Parameters
+        ----------
+        block : ndarray
+            (time, site) array of values
+        time_slice : slice
+            Position of the block along the full time axis
+        """
+        labels = self.labels[time_slice]
+        for label in np.unique(labels):
+            self.groups[label].update(block[labels == label])
@@ -0,0 +1,254 @@
+"""
+Parallel, resumable export of a (time, y, x) region to a local HDF5 file
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import itertools
+import json
+import os
+import time
+
+import h5py
+import numpy as np
+
+
+def _axis_tiles(sel, n, span):
+    """
+    Split a slice along one axis into tiles aligned to multiples of span in
+    source coordinates, i.e. one tile per source chunk when span is the
+    chunk size
+
+    Parameters
+    ----------
+    sel : slice
+        Selection along the axis in source coordinates
+    n : int
+        Length of the source axis
+    span : int
+        Tile span in source elements
+
+    Returns
+    -------
+    tiles : list
+        List of (source slice, output slice) pairs
+    """
+    start, stop, step = sel.indices(n)
+    idx = np.arange(start, stop, step)
+    if not len(idx):
+        return []
+
+    keys = idx // span
+    bounds = np.concatenate(([0], np.where(np.diff(keys) != 0)[0] + 1,
+                             [len(idx)]))
+    tiles = []
+    for i0, i1 in zip(bounds[:-1], bounds[1:]):
+        src = slice(int(idx[i0]), int(idx[i1 - 1]) + 1, step)
+        tiles.append((src, slice(int(i0), int(i1))))
+
+    return tiles
+
+
+def _tile_shape(chunks, steps):
+    """
+    Output tile shape holding every selected element of one source chunk
+    per axis
+    """
+    return tuple(max(1, -(-c // s)) for c, s in zip(chunks, steps))
+
+
+class RegionExport:
+    """
+    Export a (time, y, x) box of WTK-style 3D datasets to a chunked,
+    compressed local HDF5 file. The box is split into chunk-aligned tiles
+    that are fetched by a pool of workers and written as they arrive.
+    Completed tiles are recorded in a progress file next to the output so an
+    interrupted export resumes where it stopped.
+    """
+
+    def __init__(self, src, out_path, datasets, time_slice, y_slice,
+                 x_slice, static=('coordinates',), max_workers=8,
+                 compression='gzip', tile_shape=None):
+        """
+        Parameters
+        ----------
+        src : h5pyd.File | h5py.File
+            Source file
+        out_path : str
+            Local HDF5 file to write
+        datasets : list
+            (time, y, x) datasets to export
+        time_slice : slice
+            Selection along the time axis
+        y_slice : slice
+            Selection along the y (south-north) axis
+        x_slice : slice
+            Selection along the x (west-east) axis
+        static : tuple
+            (y, x, ...) datasets without a time axis to export as well
+        max_workers : int
+            Number of concurrent tile requests
+        compression : str | None
+            Compression filter for the output datasets
+        tile_shape : tuple, optional
+            Output tile (and chunk) shape, defaults to one source chunk
+        """
+        self.src = src
+        self.out_path = out_path
+        self.progress_path = out_path + '.progress'
+        # Drop duplicates while preserving order
+        self.datasets = list(dict.fromkeys(datasets))
+        self.selection = (time_slice, y_slice, x_slice)
+        self.static = [d for d in static if d in src]
+        self.max_workers = max_workers
+        self.compression = compression
+        self.tile_shape = tile_shape
+
+    def _out_shape(self, ds):
+        """
+        Output shape of a 3D dataset
+        """
+        return tuple(len(range(*sel.indices(n)))
+                     for sel, n in zip(self.selection, ds.shape))
+
+    def tiles(self, name):
+        """
+        Tiles covering the export box of a dataset
+
+        Parameters
+        ----------
+        name : str
+            Dataset name
+
+        Returns
+        -------
+        tiles : list
+            List of (tile id, source selection, output selection)
+        """
+        ds = self.src[name]
+        chunks = ds.chunks if ds.chunks is not None else ds.shape
+        steps = [sel.indices(n)[2] for sel, n in zip(self.selection,
+                                                     ds.shape)]
+        if self.tile_shape is None:
+            spans = chunks
+        else:
+            spans = [t * s for t, s in zip(self.tile_shape, steps)]
+
+        axes = [_axis_tiles(sel, n, span) for sel, n, span
+                in zip(self.selection, ds.shape, spans)]
+        tiles = []
+        for pos, parts in zip(itertools.product(*[range(len(a))
+                                                  for a in axes]),
+                              itertools.product(*axes)):
+            tile_id = '{}/{}'.format(name, '_'.join(str(p) for p in pos))
+            src = tuple(p[0] for p in parts)
+            out = tuple(p[1] for p in parts)
+            tiles.append((tile_id, src, out))
+
+        return tiles
+
+    def _completed(self):
+        """
+        Tile ids recorded as complete by a previous run
+        """
+        if not os.path.exists(self.progress_path):
+            return set()
+
+        with open(self.progress_path) as f:
+            return {json.loads(line)['tile'] for line in f if line.strip()}
+
+    def _create(self, out):
+        """
+        Create the output datasets, copying attributes such as scale_factor
+        """
+        for name in self.datasets:
+            ds = self.src[name]
+            shape = self._out_shape(ds)
+            if name not in out:
+                steps = [sel.indices(n)[2] for sel, n
+                         in zip(self.selection, ds.shape)]
+                chunks = ds.chunks if ds.chunks is not None else ds.shape
+                chunks = self.tile_shape or _tile_shape(chunks, steps)
+                chunks = tuple(min(c, s) for c, s in zip(chunks, shape))
+                dset = out.create_dataset(name, shape=shape, dtype=ds.dtype,
+                                          chunks=chunks,
+                                          compression=self.compression)
+                for key, value in ds.attrs.items():
+                    dset.attrs[key] = value
+
+        for name in self.static:
+            if name not in out:
+                ds = self.src[name]
+                data = ds[self.selection[1:]]
+                dset = out.create_dataset(name, data=data,
+                                          compression=self.compression)
+                for key, value in ds.attrs.items():
+                    dset.attrs[key] = value
+
+    def run(self, verbose=True):
+        """
+        Run (or resume) the export
+
+        Parameters
+        ----------
+        verbose : bool
+            Print progress and throughput
+
+        Returns
+        -------
+        summary : dict
+            Number of tiles written and skipped, bytes written, elapsed
+            seconds and throughput in MB/s
+        """
+        resume = os.path.exists(self.progress_path)
+        mode = 'a' if resume and os.path.exists(self.out_path) else 'w'
+        done = self._completed() if mode == 'a' else set()
+        if mode == 'w' and os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+
+        todo = [(name, tile) for name in self.datasets
+                for tile in self.tiles(name) if tile[0] not in done]
+
+        def fetch(name, src):
+            return self.src[name][src]
+
+        nbytes = 0
+        written = 0
+        ts = time.time()
+        with h5py.File(self.out_path, mode) as out, \
+                open(self.progress_path, 'a') as progress, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            self._create(out)
+            pending = iter(todo)
+            running = {}
+            # Keep a bounded number of tiles in flight to bound memory
+            for name, tile in itertools.islice(pending,
+                                               2 * self.max_workers):
+                running[pool.submit(fetch, name, tile[1])] = (name, tile)
+
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, (tile_id, _, out_sel) = running.pop(future)
+                    data = future.result()
+                    out[name][out_sel] = data
+                    out.flush()
+                    progress.write(json.dumps({'tile': tile_id}) + '\n')
+                    progress.flush()
+                    nbytes += data.nbytes
+                    written += 1
+                    for name, tile in itertools.islice(pending, 1):
+                        running[pool.submit(fetch, name, tile[1])] = (name,
+                                                                      tile)
+
+                if verbose:
+                    elapsed = time.time() - ts
+                    print('{}/{} tiles, {:.2f} MB/s'
+                          .format(written, len(todo),
+                                  nbytes / 1024 ** 2 / max(elapsed, 1e-9)))
+
+        os.remove(self.progress_path)
+        elapsed = time.time() - ts
+        summary = {'tiles': written, 'skipped': len(done), 'bytes': nbytes,
+                   'seconds': elapsed,
+                   'mb_per_s': nbytes / 1024 ** 2 / max(elapsed, 1e-9)}
+
+        return summary
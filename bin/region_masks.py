@@ -0,0 +1,89 @@
+"""
+Precomputed region masks for NSRDB / WTK site meta data
+"""
+import numpy as np
+import pandas as pd
+
+from meta_store import MetaStore
+
+NON_CONUS_STATES = ('Alaska', 'Hawaii', 'AK', 'HI', 'None')
+
+
+class RegionMasks:
+    """
+    Region masks computed once from site meta data and stored as sorted
+    int32 site index arrays
+    """
+
+    def __init__(self, meta):
+        """
+        Parameters
+        ----------
+        meta : MetaStore | pd.DataFrame
+            Site meta data, string columns may be stored as bytes
+        """
+        if isinstance(meta, pd.DataFrame):
+            meta = MetaStore.from_frame(meta)
+
+        self._store = meta
+        self._masks = {}
+
+    def column(self, column):
+        """
+        Decoded meta column, decoded only once
+
+        Parameters
+        ----------
+        column : str
+            Column in the meta data
+
+        Returns
+        -------
+        pd.Categorical | ndarray
+        """
+        return self._store.column(column)
+
+    def region(self, value, column='state'):
+        """
+        Sites whose meta column equals value
+
+        Parameters
+        ----------
+        value : str
+            Regional value to filter on
+        column : str
+            Column in the meta data to filter on
+
+        Returns
+        -------
+        site_idx : ndarray
+            Sorted indices of all sites in the region
+        """
+        return self._store.index(column).get(value)
+
+    def select(self, **filters):
+        """
+        Sites matching every filter, see MetaStore.select
+
+        Returns
+        -------
+        site_idx : ndarray
+            Sorted indices of all matching sites
+        """
+        return self._store.select(**filters)
+
+    @property
+    def conus(self):
+        """
+        Returns
+        -------
+        site_idx : ndarray
+            Sorted indices of all sites in CONUS
+        """
+        if 'conus' not in self._masks:
+            us = self._store.index('country').get('United States')
+            other = self._store.index('state').any(NON_CONUS_STATES)
+            self._masks['conus'] = np.setdiff1d(us, other,
+                                                assume_unique=True)
+
+        return self._masks['conus']
@@ -0,0 +1,212 @@
+"""
+Great-circle spatial index of site coordinates
+
+Sites are indexed as 3D unit vectors (ECEF on a unit sphere), where the
+straight-line (chord) distance increases monotonically with the great-circle
+distance. Nearest neighbours are therefore correct at any latitude, unlike a
+KDTree on raw (lat, lon) degrees which stretches east-west distances away from
+the equator. Queries take any number of points at once and report distances
+in km.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Mean earth radius in km
+EARTH_RADIUS = 6371.0088
+
+
+def to_unit_vectors(lat_lon):
+    """
+    Convert (lat, lon) degrees to unit vectors
+
+    Parameters
+    ----------
+    lat_lon : ndarray | list
+        (..., 2) array of (lat, lon) coordinates
+
+    Returns
+    -------
+    ndarray
+        (..., 3) array of unit vectors
+    """
+    lat_lon = np.radians(np.asarray(lat_lon, dtype=float))
+    lat, lon = lat_lon[..., 0], lat_lon[..., 1]
+    cos_lat = np.cos(lat)
+
+    return np.stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon),
+                     np.sin(lat)), axis=-1)
+
+
+def chord_to_km(chord):
+    """
+    Great-circle distance in km of a chord length on the unit sphere, inf
+    (missing neighbour) stays inf
+    """
+    km = 2 * EARTH_RADIUS * np.arcsin(np.clip(chord / 2, 0, 1))
+
+    return np.where(np.isinf(chord), np.inf, km)[()]
+
+
+def km_to_chord(km):
+    """
+    Chord length on the unit sphere of a great-circle distance in km
+    """
+    return 2 * np.sin(np.minimum(km / EARTH_RADIUS, np.pi) / 2)
+
+
+def idw_weights(distance, power=2):
+    """
+    Inverse distance weights of each point's neighbours, summing to 1 per
+    point. A neighbour at distance 0 gets all of the weight.
+
+    Parameters
+    ----------
+    distance : ndarray
+        (n, k) distances to the k neighbours of n points, inf for missing
+        neighbours
+    power : float
+        Power of the inverse distance
+
+    Returns
+    -------
+    weights : ndarray
+        (n, k) weights, rows without any neighbour are NaN
+    """
+    distance = np.atleast_2d(distance)
+    exact = distance <= 1e-9
+    with np.errstate(divide='ignore'):
+        weights = 1 / distance ** power
+
+    has_exact = exact.any(axis=1)
+    weights[has_exact] = exact[has_exact]
+    with np.errstate(invalid='ignore'):
+        return weights / weights.sum(axis=1, keepdims=True)
+
+
+class SiteIndex:
+    """
+    Nearest neighbour and radius queries by great-circle distance
+    """
+
+    def __init__(self, lat_lon):
+        """
+        Parameters
+        ----------
+        lat_lon : ndarray
+            (n_sites, 2) array of site (lat, lon) coordinates
+        """
+        self.tree = cKDTree(to_unit_vectors(lat_lon))
+
+    def __len__(self):
+        return self.tree.n
+
+    def query(self, coords, k=1, max_distance=None, workers=1):
+        """
+        k nearest sites of one or many points
+
+        Parameters
+        ----------
+        coords : tuple | ndarray
+            (lat, lon) of one point or (n, 2) array of points
+        k : int
+            Number of neighbours
+        max_distance : float, optional
+            Only return neighbours within this distance in km, missing
+            neighbours have distance inf and site index len(self)
+        workers : int
+            Number of threads for large batches, -1 for all cores
+
+        Returns
+        -------
+        distance : float | ndarray
+            Great-circle distances in km, shaped like cKDTree.query output
+        site_idx : int | ndarray
+            Site indices
+        """
+        bound = np.inf
+        if max_distance is not None:
+            bound = km_to_chord(max_distance) * (1 + 1e-12)
+
+        chord, site_idx = self.tree.query(to_unit_vectors(coords), k=k,
+                                          distance_upper_bound=bound,
+                                          workers=workers)
+
+        return chord_to_km(chord), site_idx
+
+    def query_radius(self, coords, radius, return_distance=False,
+                     workers=1):
+        """
+        All sites within a radius of one or many points
+
+        Parameters
+        ----------
+        coords : tuple | ndarray
+            (lat, lon) of one point or (n, 2) array of points
+        radius : float
+            Radius in km
+        return_distance : bool
+            Also return the distance to each site
+        workers : int
+            Number of threads for large batches, -1 for all cores
+
+        Returns
+        -------
+        site_idx : ndarray | list
+            Sorted site indices, a list of arrays for many points
+        distance : ndarray | list
+            Great-circle distances in km, if return_distance
+        """
+        vectors = to_unit_vectors(coords)
+        hits = self.tree.query_ball_point(vectors, km_to_chord(radius),
+                                          workers=workers,
+                                          return_sorted=True)
+        single = vectors.ndim == 1
+        if single:
+            hits = [hits]
+            vectors = vectors[None]
+
+        site_idx = [np.asarray(h, dtype=np.int64) for h in hits]
+        if not return_distance:
+            return site_idx[0] if single else site_idx
+
+        distance = [chord_to_km(np.linalg.norm(self.tree.data[idx] - v,
+                                               axis=-1))
+                    for idx, v in zip(site_idx, vectors)]
+        if single:
+            return site_idx[0], distance[0]
+
+        return site_idx, distance
+
+    def neighbours(self, coords, k=4, power=2, max_distance=None):
+        """
+        k nearest sites of many points and their inverse distance weights
+
+        Parameters
+        ----------
+        coords : ndarray
+            (n, 2) array of (lat, lon) points
+        k : int
+            Number of neighbours
+        power : float
+            Power of the inverse distance
+        max_distance : float, optional
+            Ignore neighbours further than this in km
+
+        Returns
+        -------
+        site_idx : ndarray
+            (n, k) site indices, missing neighbours point at site 0 with
+            weight 0
+        weights : ndarray
+            (n, k) weights summing to 1 per point, NaN for points without
+            any neighbour
+        """
+        coords = np.atleast_2d(np.asarray(coords, dtype=float))
+        distance, site_idx = self.query(coords, k=k,
+                                        max_distance=max_distance)
+        distance = distance.reshape(len(coords), k)
+        site_idx = site_idx.reshape(len(coords), k)
+        weights = idw_weights(distance, power=power)
+        site_idx[site_idx >= len(self)] = 0
+
+        return site_idx, weights
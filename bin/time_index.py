@@ -0,0 +1,235 @@
+"""
+Vectorized time index parsing and timestamp lookup
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Fixed formats used by NREL HSDS files, tried in order on the first
+# timestamp before falling back to pandas format inference
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S%z',
+                '%Y-%m-%d %H:%M:%S',
+                '%Y%m%d %H:%M:%S',
+                '%Y%m%d%H%M%S',
+                '%Y-%m-%dT%H:%M:%S%z',
+                '%Y-%m-%dT%H:%M:%S')
+
+
+def detect_format(timestamp):
+    """
+    Detect the fixed strptime format of a timestamp string
+
+    Parameters
+    ----------
+    timestamp : str
+        Single timestamp
+
+    Returns
+    -------
+    fmt : str | None
+        Matching format from TIME_FORMATS, None if no format matches
+    """
+    for fmt in TIME_FORMATS:
+        try:
+            datetime.strptime(timestamp, fmt)
+        except ValueError:
+            continue
+
+        return fmt
+
+    return None
+
+
+def parse_time_index(raw):
+    """
+    Parse a time_index / datetime dataset in one vectorized pass
+
+    Parameters
+    ----------
+    raw : ndarray
+        Array of byte-string (or string) timestamps
+
+    Returns
+    -------
+    time_index : pd.DatetimeIndex
+        UTC-aware datetime index
+    """
+    raw = np.asarray(raw)
+    if raw.dtype.kind == 'S':
+        raw = np.char.decode(raw, 'utf-8')
+    elif raw.dtype.kind == 'O':
+        raw = np.array([t.decode('utf-8') if isinstance(t, bytes) else t
+                        for t in raw])
+
+    fmt = detect_format(str(raw[0])) if len(raw) else None
+    if fmt is not None:
+        return pd.to_datetime(raw, format=fmt, utc=True)
+
+    return pd.to_datetime(raw, utc=True)
+
+
+def to_utc(timestamps):
+    """
+    Convert timestamps to UTC, tz-naive timestamps are assumed to be UTC
+
+    Parameters
+    ----------
+    timestamps : str | datetime | list | ndarray
+        Timestamp(s) to convert
+
+    Returns
+    -------
+    pd.Timestamp | pd.DatetimeIndex
+    """
+    if np.ndim(timestamps) == 0:
+        ts = pd.Timestamp(timestamps)
+        if ts.tzinfo is None:
+            return ts.tz_localize('UTC')
+
+        return ts.tz_convert('UTC')
+
+    if isinstance(timestamps, pd.DatetimeIndex):
+        ts = timestamps
+    elif np.asarray(timestamps).dtype.kind == 'M':
+        ts = pd.DatetimeIndex(timestamps)
+    else:
+        # User supplied timestamps may mix formats and time zones
+        return pd.DatetimeIndex([to_utc(t) for t in timestamps])
+
+    if ts.tz is None:
+        return ts.tz_localize('UTC')
+
+    return ts.tz_convert('UTC')
+
+
+class TimeIndex:
+    """
+    Timestamp to index lookups on a time index. Regular (fixed cadence)
+    indexes are resolved with O(1) arithmetic, irregular indexes with a
+    binary search.
+    """
+
+    def __init__(self, time_index):
+        """
+        Parameters
+        ----------
+        time_index : pd.DatetimeIndex
+            UTC-aware datetime index
+        """
+        self.time_index = time_index
+        self._ns = time_index.tz_convert(None).values.astype('M8[ns]').view(
+            np.int64)
+        self.freq = None
+        if len(self._ns) > 1:
+            steps = np.diff(self._ns)
+            if (steps == steps[0]).all() and steps[0] > 0:
+                self.freq = int(steps[0])
+
+    def __len__(self):
+        return len(self._ns)
+
+    @property
+    def regular(self):
+        """
+        Returns
+        -------
+        bool
+            True if the index has a fixed cadence
+        """
+        return self.freq is not None
+
+    def _to_ns(self, timestamps):
+        """
+        Convert timestamps to int64 ns since epoch in UTC
+        """
+        ts = to_utc(timestamps)
+        if isinstance(ts, pd.Timestamp):
+            return np.int64(ts.value)
+
+        return ts.tz_convert(None).values.astype('M8[ns]').view(np.int64)
+
+    def nearest(self, timestamps):
+        """
+        Find the nearest index position of one or many timestamps
+
+        Parameters
+        ----------
+        timestamps : str | datetime | list | ndarray
+            Timestamp(s) of interest, tz-naive timestamps are assumed UTC
+
+        Returns
+        -------
+        idx : int | ndarray
+            Position(s) in the time index
+        """
+        ns = self._to_ns(timestamps)
+        if self.regular:
+            idx = np.rint((ns - self._ns[0]) / self.freq).astype(np.int64)
+            idx = np.clip(idx, 0, len(self._ns) - 1)
+        else:
+            right = np.clip(np.searchsorted(self._ns, ns), 1,
+                            len(self._ns) - 1)
+            left = right - 1
+            closer = np.abs(self._ns[left] - ns) <= np.abs(self._ns[right]
+                                                           - ns)
+            idx = np.where(closer, left, right)
+
+        if np.ndim(idx) == 0:
+            return int(idx)
+
+        return idx
+
+    def _bounds(self, starts, ends):
+        """
+        Vectorized [i0, i1) positions covering [start, end] ranges
+        """
+        starts = np.atleast_1d(self._to_ns(starts))
+        ends = np.atleast_1d(self._to_ns(ends))
+        n = len(self._ns)
+        if self.regular:
+            i0 = np.ceil((starts - self._ns[0]) / self.freq).astype(np.int64)
+            i1 = np.floor((ends - self._ns[0]) / self.freq).astype(np.int64)
+            i0 = np.clip(i0, 0, n)
+            i1 = np.clip(i1 + 1, i0, n)
+        else:
+            i0 = np.searchsorted(self._ns, starts, side='left')
+            i1 = np.maximum(np.searchsorted(self._ns, ends, side='right'), i0)
+
+        return i0, i1
+
+    def slice(self, start, end):
+        """
+        Index slice covering [start, end]
+
+        Parameters
+        ----------
+        start : str | datetime
+            First timestamp of interest
+        end : str | datetime
+            Last timestamp of interest (inclusive)
+
+        Returns
+        -------
+        slice
+        """
+        i0, i1 = self._bounds(start, end)
+        return slice(int(i0[0]), int(i1[0]))
+
+    def slices(self, ranges):
+        """
+        Index slices for many (start, end) ranges at once
+
+        Parameters
+        ----------
+        ranges : list
+            List of (start, end) timestamp pairs, end is inclusive
+
+        Returns
+        -------
+        list
+            List of slices
+        """
+        starts, ends = zip(*ranges)
+        i0, i1 = self._bounds(list(starts), list(ends))
+        return [slice(int(a), int(b)) for a, b in zip(i0, i1)]
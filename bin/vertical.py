@@ -0,0 +1,269 @@
+"""
+Vertical interpolation of WTK variables to arbitrary hub heights
+
+WTK stores variables at fixed levels, e.g. windspeed_10m ... windspeed_200m.
+For each site the two levels bracketing its hub height are found, sites are
+grouped by level pair and every level is read once for all the sites that
+need it. Wind speed is interpolated linearly or with a power-law shear
+profile, wind direction along the shorter arc, anything else linearly. Hub
+heights outside the available levels are extrapolated from the two nearest
+levels.
+
+    speed = HSDS(wtk_path).get_hub_height('windspeed', [95, 110, 95],
+                                          sites=[10, 11, 12], method='power')
+"""
+import re
+
+import numpy as np
+
+INTERPOLATION_METHODS = ('linear', 'power')
+
+
+def dataset_name(variable, height):
+    """
+    Name of the dataset of variable at a height, e.g. windspeed_100m
+    """
+    return '{}_{}m'.format(variable, int(height))
+
+
+def levels(names, variable):
+    """
+    Heights at which variable is available
+
+    Parameters
+    ----------
+    names : iterable
+        Dataset names, e.g. an open h5py / h5pyd File
+    variable : str
+        Variable prefix, e.g. 'windspeed'
+
+    Returns
+    -------
+    ndarray
+        Sorted heights in meters
+    """
+    pattern = re.compile(r'^{}_(\d+)m$'.format(re.escape(variable)))
+    heights = [int(m.group(1)) for m in map(pattern.match, names) if m]
+    if not heights:
+        raise KeyError('No {}_<height>m datasets found'.format(variable))
+
+    return np.array(sorted(heights))
+
+
+def bracket(hub_height, heights):
+    """
+    Levels bracketing each hub height. Exact matches use the same level
+    twice, hub heights outside the levels use the two nearest levels.
+
+    Parameters
+    ----------
+    hub_height : ndarray
+        Hub height of each site in meters
+    heights : ndarray
+        Sorted available heights
+
+    Returns
+    -------
+    lower : ndarray
+        Lower level of each site
+    upper : ndarray
+        Upper level of each site
+    """
+    hub_height = np.asarray(hub_height, dtype=float)
+    if len(heights) == 1:
+        return np.full(hub_height.shape, heights[0]), \
+            np.full(hub_height.shape, heights[0])
+
+    pos = np.clip(np.searchsorted(heights, hub_height), 1, len(heights) - 1)
+    lower, upper = heights[pos - 1], heights[pos]
+    exact = np.isin(hub_height, heights)
+    lower = np.where(exact, hub_height, lower).astype(heights.dtype)
+    upper = np.where(exact, hub_height, upper).astype(heights.dtype)
+
+    return lower, upper
+
+
+def _fraction(h_lower, h_upper, hub_height):
+    """
+    Position of the hub height between the levels, 0 at equal levels
+    """
+    span = np.asarray(h_upper - h_lower, dtype=np.float32)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac = (hub_height - h_lower) / span
+
+    return np.where(span > 0, frac, 0).astype(np.float32)
+
+
+def linear(lower, upper, h_lower, h_upper, hub_height):
+    """
+    Linear interpolation between two levels
+
+    Parameters
+    ----------
+    lower : ndarray
+        (time, sites) values at the lower level
+    upper : ndarray
+        (time, sites) values at the upper level
+    h_lower : ndarray
+        Lower level of each site
+    h_upper : ndarray
+        Upper level of each site
+    hub_height : ndarray
+        Hub height of each site
+
+    Returns
+    -------
+    ndarray
+        (time, sites) values at hub height
+    """
+    frac = _fraction(h_lower, h_upper, hub_height)
+
+    return lower + (upper - lower) * frac
+
+
+def power_law(lower, upper, h_lower, h_upper, hub_height):
+    """
+    Power-law (wind shear) interpolation of wind speed between two levels.
+    The shear exponent is fitted per site and timestep from the two levels;
+    timesteps with calm winds at either level fall back to linear.
+
+    Parameters
+    ----------
+    See linear
+
+    Returns
+    -------
+    ndarray
+        (time, sites) wind speed at hub height
+    """
+    h_lower = np.asarray(h_lower, dtype=np.float32)
+    h_upper = np.asarray(h_upper, dtype=np.float32)
+    hub_height = np.asarray(hub_height, dtype=np.float32)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        alpha = np.log(upper / lower) / np.log(h_upper / h_lower)
+        out = lower * (hub_height / h_lower) ** alpha
+
+    bad = ~np.isfinite(out)
+    if bad.any():
+        out[bad] = linear(lower, upper, h_lower, h_upper, hub_height)[bad]
+
+    return out
+
+
+def circular(lower, upper, h_lower, h_upper, hub_height):
+    """
+    Interpolation of directions in degrees along the shorter arc, so 350
+    and 10 degrees give 0 rather than 180
+
+    Parameters
+    ----------
+    See linear
+
+    Returns
+    -------
+    ndarray
+        (time, sites) direction at hub height in [0, 360)
+    """
+    frac = _fraction(h_lower, h_upper, hub_height)
+    diff = (upper - lower + 180) % 360 - 180
+
+    return (lower + diff * frac) % 360
+
+
+def level_groups(h_lower, h_upper):
+    """
+    Sites grouped by level pair
+
+    Parameters
+    ----------
+    h_lower : ndarray
+        Lower level of each site
+    h_upper : ndarray
+        Upper level of each site
+
+    Returns
+    -------
+    dict
+        {(lower, upper): positions of the sites using that pair}
+    """
+    pairs = np.column_stack((h_lower, h_upper))
+    unique, inverse = np.unique(pairs, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.searchsorted(inverse[order], np.arange(len(unique) + 1))
+
+    return {(int(lo), int(hi)): order[bounds[k]:bounds[k + 1]]
+            for k, (lo, hi) in enumerate(unique)}
+
+
+def interpolate(read, names, variable, hub_height, sites, method='linear'):
+    """
+    Values of variable at each site's hub height, reading only the levels
+    bracketing the hub heights, each level once
+
+    Parameters
+    ----------
+    read : callable
+        read(dataset, sites) returns the unscaled float32 (time, sites)
+        values of a dataset for sorted site indices
+    names : iterable
+        Available dataset names
+    variable : str
+        Variable prefix, e.g. 'windspeed', 'winddirection' or
+        'temperature'
+    hub_height : float | ndarray
+        Hub height in meters, one for all sites or one per site
+    sites : ndarray
+        Site indices
+    method : str
+        Wind speed interpolation: 'linear' or 'power' (shear) law.
+        Directions are always interpolated along the shorter arc and other
+        variables linearly.
+
+    Returns
+    -------
+    ndarray
+        float32 (time, sites) values at hub height, in the order of sites
+    """
+    if method not in INTERPOLATION_METHODS:
+        raise ValueError('method must be one of {}, got {!r}'
+                         .format(INTERPOLATION_METHODS, method))
+
+    if 'direction' in variable:
+        func = circular
+    elif method == 'power' and 'speed' in variable:
+        func = power_law
+    else:
+        func = linear
+
+    sites = np.asarray(sites)
+    hub_height = np.broadcast_to(np.asarray(hub_height, dtype=np.float32),
+                                 sites.shape)
+    heights = levels(names, variable)
+    h_lower, h_upper = bracket(hub_height, heights)
+    groups = level_groups(h_lower, h_upper)
+    if not groups:
+        return read(dataset_name(variable, heights[0]), sites)
+
+    # Read every level once for all the sites whose pair includes it
+    data = {}
+    for height in np.union1d(h_lower, h_upper):
+        needed = (h_lower == height) | (h_upper == height)
+        level_sites, inverse = np.unique(sites[needed], return_inverse=True)
+        values = read(dataset_name(variable, height), level_sites)
+        pos = np.full(len(sites), -1)
+        pos[needed] = inverse.ravel()
+        data[height] = values, pos
+
+    out = None
+    for (lo, hi), group in groups.items():
+        lower, lower_pos = data[lo]
+        upper, upper_pos = data[hi]
+        values = func(lower[:, lower_pos[group]], upper[:, upper_pos[group]],
+                      h_lower[group], h_upper[group], hub_height[group])
+        if out is None:
+            out = np.empty((len(values), len(sites)), dtype=np.float32)
+
+        out[:, group] = values
+
+    return out
@@ -0,0 +1,348 @@
+"""
+Streaming output sinks for extracted (time, ...) blocks
+
+Blocks are written incrementally as they arrive, so the full extraction never
+has to be held in memory. Values can be stored as the scaled integers used by
+the source files (with their scale_factor attribute) or decoded to float32.
+"""
+import os
+
+import h5py
+import numpy as np
+
+
+def encode(block, scale_factor, encoding):
+    """
+    Encode a block of scaled source values
+
+    Parameters
+    ----------
+    block : ndarray
+        Values as stored in the source file
+    scale_factor : float
+        Source scale factor
+    encoding : str
+        'scaled' to keep the source integers, 'float32' to unscale
+
+    Returns
+    -------
+    ndarray
+    """
+    if encoding == 'scaled':
+        return block
+
+    if encoding == 'float32':
+        return block.astype(np.float32) / np.float32(scale_factor)
+
+    raise ValueError("encoding must be 'scaled' or 'float32', got {}"
+                     .format(encoding))
+
+
+class Sink:
+    """
+    Base class for streaming sinks
+    """
+
+    def __init__(self, path, encoding='scaled'):
+        """
+        Parameters
+        ----------
+        path : str
+            Output file or directory
+        encoding : str
+            'scaled' to keep source integers and scale_factor, 'float32' to
+            store unscaled values
+        """
+        self.path = path
+        self.encoding = encoding
+        self._scale = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _dtype(self, dtype):
+        """
+        Output dtype for a source dtype
+        """
+        return np.dtype(dtype) if self.encoding == 'scaled' else np.float32
+
+    def create(self, name, shape, dtype, attrs=None):
+        """
+        Create an output variable
+
+        Parameters
+        ----------
+        name : str
+            Variable name
+        shape : tuple
+            Full (time, ...) shape of the variable
+        dtype : np.dtype
+            Source dtype
+        attrs : dict, optional
+            Source attributes, e.g. scale_factor and units
+        """
+        attrs = dict(attrs or {})
+        self._scale[name] = attrs.get('scale_factor', 1)
+        if self.encoding == 'float32':
+            attrs.pop('scale_factor', None)
+
+        self._create(name, shape, self._dtype(dtype), attrs)
+
+    def write(self, name, start, block):
+        """
+        Write a block of timesteps
+
+        Parameters
+        ----------
+        name : str
+            Variable name
+        start : int
+            Position of the first timestep of block
+        block : ndarray
+            (time, ...) block of source values
+        """
+        block = encode(block, self._scale[name], self.encoding)
+        self._write(name, start, block)
+
+    def write_static(self, name, data):
+        """
+        Write a variable without a time axis, e.g. coordinates
+
+        Parameters
+        ----------
+        name : str
+            Variable name
+        data : ndarray
+            Values to write
+        """
+        raise NotImplementedError
+
+    def _create(self, name, shape, dtype, attrs):
+        raise NotImplementedError
+
+    def _write(self, name, start, block):
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Flush and close the sink
+        """
+
+
+class HDF5Sink(Sink):
+    """
+    Chunked, compressed HDF5 output
+    """
+
+    def __init__(self, path, encoding='scaled', compression='gzip',
+                 chunks=True):
+        """
+        Parameters
+        ----------
+        path : str
+            Output .h5 file
+        encoding : str
+            'scaled' or 'float32'
+        compression : str | None
+            HDF5 compression filter
+        chunks : tuple | bool
+            Chunk shape, True to let h5py pick one
+        """
+        super().__init__(path, encoding=encoding)
+        self._compression = compression
+        self._chunks = chunks
+        self._h5 = h5py.File(path, 'w')
+
+    def _create(self, name, shape, dtype, attrs):
+        dset = self._h5.create_dataset(name, shape=shape, dtype=dtype,
+                                       chunks=self._chunks,
+                                       compression=self._compression)
+        for key, value in attrs.items():
+            dset.attrs[key] = value
+
+    def _write(self, name, start, block):
+        self._h5[name][start:start + len(block)] = block
+
+    def write_static(self, name, data):
+        self._h5.create_dataset(name, data=data,
+                                compression=self._compression)
+
+    def close(self):
+        self._h5.close()
+
+
+class ZarrSink(Sink):
+    """
+    Zarr directory store output, requires zarr
+    """
+
+    def __init__(self, path, encoding='scaled', chunks=True):
+        """
+        Parameters
+        ----------
+        path : str
+            Output .zarr directory
+        encoding : str
+            'scaled' or 'float32'
+        chunks : tuple | bool
+            Chunk shape, True to let zarr pick one
+        """
+        try:
+            import zarr
+        except ImportError:
+            raise ImportError("run 'pip install zarr' to write zarr output")
+
+        super().__init__(path, encoding=encoding)
+        self._chunks = chunks
+        self._root = zarr.open_group(path, mode='w')
+
+    def _create_array(self, name, shape, dtype, **kwargs):
+        """
+        Create an array with Group.create_array, falling back to
+        create_dataset on zarr 2
+        """
+        create = getattr(self._root, 'create_array', None)
+        if create is None:
+            create = self._root.create_dataset
+
+        return create(name, shape=shape, dtype=dtype, **kwargs)
+
+    def _create(self, name, shape, dtype, attrs):
+        kwargs = {} if self._chunks is True else {'chunks': self._chunks}
+        arr = self._create_array(name, shape, dtype, **kwargs)
+        arr.attrs.update({key: np.asarray(value).tolist()
+                          for key, value in attrs.items()})
+
+    def _write(self, name, start, block):
+        self._root[name][start:start + len(block)] = block
+
+    def write_static(self, name, data):
+        arr = self._create_array(name, data.shape, data.dtype)
+        arr[...] = data
+
+
+class ParquetSink(Sink):
+    """
+    One Parquet file per variable in long format (time, cell, value) with one
+    row group per written block, requires pyarrow
+    """
+
+    def __init__(self, path, encoding='scaled'):
+        """
+        Parameters
+        ----------
+        path : str
+            Output directory
+        encoding : str
+            'scaled' or 'float32'
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("run 'pip install pyarrow' to write parquet "
+                              "output")
+
+        super().__init__(path, encoding=encoding)
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._writers = {}
+        os.makedirs(path, exist_ok=True)
+
+    def _create(self, name, shape, dtype, attrs):
+        schema = self._pa.schema(
+            [('time', self._pa.int32()), ('cell', self._pa.int32()),
+             (name, self._pa.from_numpy_dtype(dtype))],
+            metadata={key: str(np.asarray(value).tolist())
+                      for key, value in attrs.items()})
+        out = os.path.join(self.path, name + '.parquet')
+        self._writers[name] = self._pq.ParquetWriter(out, schema)
+
+    def _write(self, name, start, block):
+        n_time = len(block)
+        n_cell = block[0].size if n_time else 0
+        time = np.repeat(np.arange(start, start + n_time, dtype=np.int32),
+                         n_cell)
+        cell = np.tile(np.arange(n_cell, dtype=np.int32), n_time)
+        table = self._pa.table({'time': time, 'cell': cell,
+                                name: block.reshape(-1)},
+                               schema=self._writers[name].schema)
+        self._writers[name].write_table(table)
+
+    def write_static(self, name, data):
+        data = np.asarray(data).reshape(-1, data.shape[-1])
+        table = self._pa.table({'{}_{}'.format(name, i): data[:, i]
+                                for i in range(data.shape[1])})
+        self._pq.write_table(table, os.path.join(self.path,
+                                                 name + '.parquet'))
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+
+
+class CSVSink(Sink):
+    """
+    Opt-in text output, one CSV per variable and timestep (the legacy
+    layout), written with a compact number format
+    """
+
+    def __init__(self, path, encoding='float32', fmt='%.6g'):
+        """
+        Parameters
+        ----------
+        path : str
+            Output directory
+        encoding : str
+            'scaled' or 'float32'
+        fmt : str
+            Number format passed to np.savetxt
+        """
+        super().__init__(path, encoding=encoding)
+        self._fmt = fmt
+        os.makedirs(path, exist_ok=True)
+
+    def _create(self, name, shape, dtype, attrs):
+        pass
+
+    def _write(self, name, start, block):
+        for t, data in enumerate(block, start=start):
+            out = os.path.join(self.path, '{}_t{}.csv'.format(name, t))
+            np.savetxt(out, data.reshape(len(data), -1), fmt=self._fmt,
+                       delimiter=',')
+
+    def write_static(self, name, data):
+        data = np.asarray(data).reshape(-1, data.shape[-1])
+        np.savetxt(os.path.join(self.path, name + '.csv'), data,
+                   fmt=self._fmt, delimiter=',')
+
+
+SINKS = {'hdf5': HDF5Sink, 'zarr': ZarrSink, 'parquet': ParquetSink,
+         'csv': CSVSink}
+
+
+def open_sink(fmt, path, **kwargs):
+    """
+    Open a sink by format name
+
+    Parameters
+    ----------
+    fmt : str
+        One of 'hdf5', 'zarr', 'parquet' or 'csv'
+    path : str
+        Output file or directory
+    kwargs : dict
+        Additional arguments for the sink, e.g. encoding
+
+    Returns
+    -------
+    Sink
+    """
+    if fmt not in SINKS:
+        raise ValueError('Unknown output format {}, expected one of {}'
+                         .format(fmt, list(SINKS)))
+
+    return SINKS[fmt](path, **kwargs)
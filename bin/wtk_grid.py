@@ -0,0 +1,140 @@
+"""
+WIND Toolkit (WTK) Lambert Conformal Conic grid indexing
+"""
+import numpy as np
+from pyproj import Proj
+
+WTK_PROJ = """+proj=lcc +lat_1=30 +lat_2=60
+              +lat_0=38.47240422490422 +lon_0=-96.0
+              +x_0=0 +y_0=0 +ellps=sphere
+              +units=m +no_defs """
+WTK_RESOLUTION = 2000  # grid spacing in meters
+
+
+class WTKGrid:
+    """
+    Projection and origin of the WTK 2D grid, computed once, with
+    vectorized lat/lon to (i, j) index lookups
+    """
+
+    def __init__(self, wtk):
+        """
+        Parameters
+        ----------
+        wtk : h5pyd.File
+            h5pyd File instance for the WTK
+        """
+        dset_coords = wtk['coordinates']
+        self.shape = dset_coords.shape[:2]
+        self.proj = Proj(WTK_PROJ)
+        # Grab origin directly from database
+        lat, lon = dset_coords[0, 0]
+        self.origin = np.array(self.proj(lon, lat))
+
+    def ij(self, lat_lon, clip=False):
+        """
+        Nearest (i, j) grid indices for one or many (lat, lon) coordinates
+
+        Parameters
+        ----------
+        lat_lon : tuple | ndarray
+            (lat, lon) coordinates or (n, 2) array of coordinates
+        clip : bool
+            Snap points off the grid to the nearest edge cell, by default
+            they raise a ValueError
+
+        Returns
+        -------
+        ij : ndarray
+            (n, 2) array of (i, j) indices, or (2, ) for a single coordinate
+        """
+        lat_lon = np.asarray(lat_lon, dtype=float)
+        single = lat_lon.ndim == 1
+        lat_lon = np.atleast_2d(lat_lon)
+        x, y = self.proj(lat_lon[:, 1], lat_lon[:, 0])
+        ij = np.column_stack((np.rint((y - self.origin[1]) / WTK_RESOLUTION),
+                              np.rint((x - self.origin[0]) / WTK_RESOLUTION)))
+        ij = ij.astype(np.int64)
+        upper = np.array(self.shape) - 1
+        if clip:
+            ij = np.clip(ij, 0, upper)
+        elif (ij < 0).any() or (ij > upper).any():
+            raise ValueError('Coordinates are outside of the WTK grid')
+
+        return ij[0] if single else ij
+
+    def to_grid(self, lon_lat):
+        """
+        Project (lon, lat) points to fractional (x, y) grid coordinates,
+        i.e. (j, i) index space
+
+        Parameters
+        ----------
+        lon_lat : ndarray
+            (n, 2) array of (lon, lat) points
+
+        Returns
+        -------
+        xy : ndarray
+            (n, 2) array of fractional (j, i) grid coordinates
+        """
+        lon_lat = np.atleast_2d(np.asarray(lon_lat, dtype=float))
+        x, y = self.proj(lon_lat[:, 0], lon_lat[:, 1])
+        return np.column_stack(((x - self.origin[0]) / WTK_RESOLUTION,
+                                (y - self.origin[1]) / WTK_RESOLUTION))
+
+    def latlon(self, i, j):
+        """
+        (lat, lon) of grid cell centers, computed without reading the
+        coordinates dataset
+
+        Parameters
+        ----------
+        i : ndarray
+            Row indices
+        j : ndarray
+            Column indices
+
+        Returns
+        -------
+        lat_lon : ndarray
+            (n, 2) array of (lat, lon) coordinates
+        """
+        x = self.origin[0] + np.asarray(j) * WTK_RESOLUTION
+        y = self.origin[1] + np.asarray(i) * WTK_RESOLUTION
+        lon, lat = self.proj(x, y, inverse=True)
+        return np.column_stack((lat, lon))
+
+    def bounding_box(self, sw, ne, n=5000):
+        """
+        Grid index bounding box of a lat/lon rectangle. The rectangle edges
+        are sampled with n points each since straight lat/lon edges are
+        curved in the projected grid.
+
+        Parameters
+        ----------
+        sw : tuple
+            (lat, lon) of the south-west corner
+        ne : tuple
+            (lat, lon) of the north-east corner
+        n : int
+            Number of points sampled along each edge
+
+        Returns
+        -------
+        ij_min : ndarray
+            Minimum (i, j) indices
+        ij_max : ndarray
+            Maximum (i, j) indices
+        """
+        lat = np.linspace(sw[0], ne[0], n)
+        lon = np.linspace(sw[1], ne[1], n)
+        edges = np.concatenate((
+            np.column_stack((lat, np.full(n, ne[1]))),
+            np.column_stack((lat, np.full(n, sw[1]))),
+            np.column_stack((np.full(n, sw[0]), lon)),
+            np.column_stack((np.full(n, ne[0]), lon))))
+        # Rectangles reaching past the grid are clamped to its edges
+        ij = self.ij(edges, clip=True)
+
+        return ij.min(axis=0), ij.max(axis=0)
@@ -1,10 +1,14 @@
 # Jordan Perr-Sauer <jordan.perr-sauer@nrel.gov>
 
-import h5pyd, h5py
-import numpy as np
-from pyproj import Proj
+import h5pyd
+import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'bin'))
+from region_export import RegionExport
+from wtk_grid import WTKGrid
+
 ######### CONFIGURATION #########
 
 
@@ -26,59 +30,33 @@ tskip = 1
 # Which data sets do you want included in the download?
 datasets = ['windspeed_100m', 'winddirection_100m']
 
+# Number of concurrent download requests
+workers = 8
 
-######### END CONFIGURATION #########
 
-projstring = """+proj=lcc +lat_1=30 +lat_2=60
-                +lat_0=38.47240422490422 +lon_0=-96.0
-                +x_0=0 +y_0=0 +ellps=sphere
-                +units=m +no_defs """
-projectLcc = Proj(projstring)
+######### END CONFIGURATION #########
 
 f = h5pyd.File("/nrel/wtk-us.h5", 'r')
 
-dset_coords = f['coordinates']
-origin_ll = reversed(dset_coords[0][0]) # Grab origin directly from database
-origin = projectLcc(*origin_ll)
-
-def indicesForCoord(lat_index, lon_index):
-    coords = (lon_index,lat_index)
-    coords = projectLcc(*coords)
-    delta = np.subtract(coords, origin)
-    ij = [int(round(x/2000)) for x in delta]
-    return tuple(reversed(ij))
-
-def line(lat1, lon1, lat2, lon2):
-    z = zip( np.linspace(lat1, lat2, 5000), np.linspace(lon1, lon2, 5000) )
-    if sys.version_info >= (3,0):
-        z = list(z)
-    return z
+grid = WTKGrid(f)
 
 def bounding_ij(sw, ne):
-    bb = line(sw[0], ne[1], ne[0], ne[1]) #top
-    bb.extend( line(sw[0], sw[1], ne[0], sw[1]) ) #bottom
-    bb.extend( line(sw[0], sw[1], sw[0], ne[1]) ) #left
-    bb.extend( line(ne[0], sw[1], ne[0], ne[1]) ) #right
-    lcbb = map(lambda c: indicesForCoord(*c), bb)
-    if sys.version_info >= (3,0):
-        lcbb = list(lcbb)
-    lcbb_i = [x[0] for x in lcbb]
-    lcbb_j = [x[1] for x in lcbb]
-    ne = (max(lcbb_i), max(lcbb_j))
-    sw = (min(lcbb_i), min(lcbb_j))
-    return (ne, sw)
+    # Edges of the lat/lon rectangle are projected in one vectorized call
+    ij_min, ij_max = grid.bounding_box(sw, ne)
+    return (tuple(ij_max), tuple(ij_min))
 
 bd = bounding_ij(sw, ne)
 
 
-# Download data and save to local file
-
-lf = h5py.File(output, "w")
-
-for d in datasets:
-    ds = f[d][tmin:tmax:tskip,bd[1][0]:bd[0][0]:latskip,bd[1][1]:bd[0][1]:lonskip]
-    lf[d] = ds
+# Download data and save to local file. The box is fetched as chunk-aligned
+# tiles by a pool of workers and written to a chunked, compressed file;
+# re-running after an interruption resumes from the last completed tile.
 
-lf["coordinates"] = f["coordinates"][bd[1][0]:bd[0][0]:latskip,bd[1][1]:bd[0][1]:lonskip]
-lf.flush()
-lf.close()
+export = RegionExport(f, output, datasets,
+                      slice(tmin, tmax, tskip),
+                      slice(bd[1][0], bd[0][0], latskip),
+                      slice(bd[1][1], bd[0][1], lonskip),
+                      max_workers=workers)
+summary = export.run()
+print("Exported {tiles} tiles ({bytes} bytes) in {seconds:.1f} s, "
+      "{mb_per_s:.2f} MB/s".format(**summary))
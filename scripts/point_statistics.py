@@ -2,41 +2,45 @@
 
 import h5pyd
 import numpy as np
-from pyproj import Proj
+import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'bin'))
+from polygon_mask import read_cells
+import vertical
+from wtk_grid import WTKGrid
+
 ######### CONFIGURATION #########
 
 lat = 36.96744946416934
 lon = -109.05029296875
-hub_height = "100"
+hub_height = 95  # meters, interpolated between the bracketing WTK levels
 
 #################################
 
 f = h5pyd.File("/nrel/wtk-us.h5", 'r')
 
-projstring = """+proj=lcc +lat_1=30 +lat_2=60
-                +lat_0=38.47240422490422 +lon_0=-96.0
-                +x_0=0 +y_0=0 +ellps=sphere
-                +units=m +no_defs"""
+grid = WTKGrid(f)
+
+i, j = grid.ij((lat, lon))
 
-projectLcc = Proj(projstring)
+coord = f["coordinates"][i][j]
 
-_origin_ll = reversed(f['coordinates'][0][0])  # Grab origin directly from database
-origin = projectLcc(*_origin_ll)
 
-def ijForCoord(coords):
-    coords = reversed(coords)
-    coords = projectLcc(*coords)
-    delta = np.subtract(coords, origin)
-    ij = [int(round(x/2000)) for x in delta]
-    return tuple(reversed(ij))
+def read(name, cells):
+    # cells are flat i * n_cols + j grid indices, only the levels bracketing
+    # hub_height are read
+    ds = f[name]
+    rows, cols = np.divmod(np.asarray(cells), grid.shape[1])
+    data = read_cells(ds, rows, cols, slice(0, 24))
+    return data / np.float32(ds.attrs.get("scale_factor", 1))
 
-i, j = ijForCoord((lat, lon))
 
-coord = f["coordinates"][i][j]
-speed = f["windspeed_{0}m".format(hub_height)][0:24,i,j]
-direc = f["winddirection_{0}m".format(hub_height)][0:24,i,j]
+cell = [i * grid.shape[1] + j]
+speed = vertical.interpolate(read, f, "windspeed", hub_height, cell,
+                             method="power")[:, 0]
+direc = vertical.interpolate(read, f, "winddirection", hub_height, cell)[:, 0]
 
 ### Write raw data
 
@@ -7,7 +7,7 @@ GEOJSON_FILE = "../data/wtk/W0463_1kmBuffer.json"
 DESTINATION = "./output"
 
 DATASETS = ["windspeed_10m", "windspeed_40m", "windspeed_60m", "windspeed_80m", "windspeed_100m", "windspeed_120m",
-            "winddirection_10m", "winddirection_10m", "winddirection_10m", "winddirection_10m", "winddirection_10m", "winddirection_10m",
+            "winddirection_10m", "winddirection_40m", "winddirection_60m", "winddirection_80m", "winddirection_100m", "winddirection_120m",
             "temperature_2m", "temperature_10m", "temperature_100m", "temperature_120m",
             "pressure_0m", "pressure_100m",
             "relativehumidity_2m",
@@ -20,60 +20,65 @@ tmax = 5 # hours since 12AM January 1st, 2007
 
 tskip = 1 # stride length in time
 
+FORMAT = "hdf5"  # output format: hdf5, zarr, parquet or csv
+ENCODING = "scaled"  # scaled (source integers + scale_factor) or float32
+TBLOCK = 24  # number of timesteps fetched and written per block
+
 #################
 
 import h5pyd
 import geopandas as gpd
 import numpy as np
-from pyproj import Proj
+import os
+import sys
 from tqdm import tqdm
 import matplotlib
 matplotlib.use("Agg")
 
-
-proj4j_string = """+proj=lcc +lat_1=30 +lat_2=60
-                +lat_0=38.47240422490422 +lon_0=-96.0
-                +x_0=0 +y_0=0 +ellps=sphere
-                +units=m +no_defs """
-projectLcc = Proj(proj4j_string)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'bin'))
+from polygon_mask import read_cells, wtk_cells
+from writers import open_sink
+from wtk_grid import WTKGrid
 
 
 # Download origin data from server
 
 f = h5pyd.File("/nrel/wtk-us.h5", 'r')
-dset_coords = f['coordinates']
-origin_ll = reversed(dset_coords[0][0]) # Grab origin directly from database
-origin = projectLcc(*origin_ll)
+grid = WTKGrid(f)
 
-# Read polygon from GeoJSON and find IJ bounds
+# Read polygon from GeoJSON and find the grid cells inside it
 
 polygon = gpd.read_file(GEOJSON_FILE)
 polygon.crs = {'init': 'epsg:4326'}
-polygon_lcc = polygon.to_crs(proj4j_string)
-bounds = polygon_lcc.scale(2,2).bounds.iloc[0]
-
-ll = (bounds.minx, bounds.miny)
-ur = (bounds.maxx, bounds.maxy)
-
-delta = np.subtract(ll, origin)
-ll_ij = [int(round(x/2000)) for x in delta]
-
-delta = np.subtract(ur, origin)
-ur_ij = [int(round(x/2000)) for x in delta]
-
-# Download data from server and write to CSV file
-
-coords = dset_coords[ll_ij[1]:ur_ij[1]:SKIP,ll_ij[0]:ur_ij[0]:SKIP]
-coordsToString = np.vectorize(lambda c: "(%f %f)"%(c[0], c[1]))
-np.savetxt("%s/coords.csv"%(DESTINATION), coordsToString(coords), fmt="%s", delimiter=",")
-
-for d in tqdm(DATASETS, desc="Downloading Datasets"):
-    data = f[d][tmin:tmax:tskip,ll_ij[1]:ur_ij[1]:SKIP, ll_ij[0]:ur_ij[0]:SKIP]
-    for t in range(data.shape[0]):
-        np.savetxt("%s/%s_t%d.csv"%(DESTINATION, d, t), data[t], fmt='%.18f', delimiter=",")
+i, j = wtk_cells(grid, polygon)
+keep = (i % SKIP == 0) & (j % SKIP == 0)
+i, j = i[keep], j[keep]
+print("%d grid cells inside the polygon" % len(i))
+
+# Download only the chunk-aligned tiles that contain polygon cells and stream
+# the (time, cell) blocks into the output sink
+
+coords = grid.latlon(i, j)
+ext = {"hdf5": ".h5", "zarr": ".zarr"}.get(FORMAT, "")
+sink = open_sink(FORMAT, os.path.join(DESTINATION, "shape" + ext),
+                 encoding=ENCODING)
+
+with sink:
+    sink.write_static("coordinates", coords)
+    sink.write_static("cell_index", np.column_stack((i, j)))
+    times = range(tmin, tmax, tskip)
+    for d in tqdm(list(dict.fromkeys(DATASETS)), desc="Downloading Datasets"):
+        ds = f[d]
+        shape = (len(times), len(i))
+        sink.create(d, shape, ds.dtype, attrs=dict(ds.attrs))
+        for start in range(0, len(times), TBLOCK):
+            block = times[start:start + TBLOCK]
+            data = read_cells(ds, i, j, slice(block.start, block.stop, tskip))
+            sink.write(d, start, data)
 
 ax = polygon.plot()
-x,y = zip(*coords.flatten())
+x, y = coords.T
 ax.scatter(y,x,c='g')
 fig = ax.get_figure()
 fig.savefig("%s/plot.png"%(DESTINATION))
\ No newline at end of file